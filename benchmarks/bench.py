@@ -0,0 +1,653 @@
+#! /usr/bin/env python
+""" Benchmark every public method of `Acl` on synthetic ACLs
+
+    $ python benchmarks/bench.py --scale 100k
+    $ python benchmarks/bench.py --scale 100k --save baseline.json
+    $ python benchmarks/bench.py --scale 100k --compare baseline.json
+
+    Every case is timed `--repeat` times, on fresh copies for the methods that modify the Acl, and the best run is kept.
+    Throughput is in calls per second, in items per second for the bulk methods,
+    and in grants per second for the methods that process the whole Acl, like `dumps()`.
+    Peak memory is the most memory allocated while the case runs, measured with `tracemalloc` in a separate run.
+    When compared to a baseline, a case regresses when its throughput drops, or its peak memory grows,
+    by more than `--threshold`: the script then exits with status 1.
+    The baseline must have been measured on the same data: same sizes and seed.
+"""
+from __future__ import print_function
+
+import argparse
+import io
+import json
+import os
+import pickle
+import platform
+import random
+import sys
+import time
+from collections import OrderedDict, deque
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+# Benchmark the working tree, not an installed release
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import miracle
+
+#: Timer
+_clock = getattr(time, 'perf_counter', time.time)
+
+#: Preset scales: (roles, resources, permissions per resource, grant density)
+#: The number of grants is roles * resources * permissions * density
+SCALES = OrderedDict([
+    ('1k', (10, 100, 4, 0.25)),
+    ('10k', (100, 400, 5, 0.05)),
+    ('100k', (1000, 2000, 5, 0.01)),
+    ('1m', (10000, 10000, 5, 0.002)),
+    ('10m', (100000, 50000, 5, 0.0004)),
+])
+
+
+class Synthetic(object):
+    """ Synthetic ACL data
+
+        Every role is granted the same number of random (resource, permission) pairs,
+        and a fraction of the roles inherit from a random role with a lower number, so there are no cycles.
+    """
+
+    def __init__(self, roles, resources, permissions, density, parents=0.0, seed=0):
+        """ Generate the data
+
+        :param roles: Number of roles
+        :type roles: int
+        :param resources: Number of resources
+        :type resources: int
+        :param permissions: Number of permissions per resource
+        :type permissions: int
+        :param density: Fraction of all (role, resource, permission) triples that are granted
+        :type density: float
+        :param parents: Fraction of the roles that have a parent
+        :type parents: float
+        :param seed: Random seed: the same arguments always give the same data
+        :type seed: int
+        """
+        rng = random.Random(seed)
+
+        #: Names
+        self.roles = ['role{}'.format(i) for i in range(roles)]
+        self.resources = ['resource{}'.format(i) for i in range(resources)]
+        self.permissions = ['perm{}'.format(i) for i in range(permissions)]
+
+        #: Structure: { resource: permissions }
+        self.structure = {resource: list(self.permissions) for resource in self.resources}
+
+        #: Grants: [ (role, resource, permission) ]
+        self.grants = []
+        pairs = resources * permissions
+        per_role = min(pairs, max(1, int(round(pairs * density))))
+        for role in self.roles:
+            for i in rng.sample(range(pairs), per_role):
+                self.grants.append((role, self.resources[i // permissions], self.permissions[i % permissions]))
+
+        #: Role inheritance: { role: [parent] }
+        self.parents = {}
+        for i in range(1, roles):
+            if rng.random() < parents:
+                self.parents[self.roles[i]] = [self.roles[rng.randrange(i)]]
+
+    def build(self, cls):
+        """ Make an Acl of the data
+
+        :type cls: type
+        :rtype: miracle.Acl
+        """
+        acl = cls()
+        acl.add(self.structure)
+        acl.grant_many(self.grants)
+        for role, parents in self.parents.items():
+            acl.add_role(role, parents)
+        return acl
+
+
+class Bench(object):
+    """ State shared by the cases """
+
+    def __init__(self, cls, data, number, seed=0):
+        self.cls = cls
+        self.data = data
+        self.number = number
+        self.rng = random.Random(seed)
+
+        #: The Acl that read-only cases work on
+        self.acl = data.build(cls)
+        self._dump = self.acl.dumps()
+
+    def copy(self):
+        """ Make a copy of the Acl, for the cases that modify it
+
+        :rtype: miracle.Acl
+        """
+        return self.cls.loads(self._dump)
+
+    def roles(self, n=None):
+        """ Random roles [sets of n roles], `number` of them """
+        roles = self.data.roles
+        if n is None:
+            return [self.rng.choice(roles) for i in range(self.number)]
+        return [self.rng.sample(roles, min(n, len(roles))) for i in range(self.number)]
+
+    def resources(self):
+        """ Random resources, `number` of them """
+        return [self.rng.choice(self.data.resources) for i in range(self.number)]
+
+    def triples(self):
+        """ (role, resource, permission) to check, `number` of them: half granted, half random """
+        data = self.data
+        choice = self.rng.choice
+        return [choice(data.grants) if i % 2 else (choice(data.roles), choice(data.resources), choice(data.permissions))
+                for i in range(self.number)]
+
+    def new_grants(self):
+        """ Grants that are not in the Acl, `number` of them """
+        return [('new{}'.format(i), self.rng.choice(self.data.resources), self.rng.choice(self.data.permissions))
+                for i in range(self.number)]
+
+
+#: Benchmark cases: { name: case(bench) -> (function, [args], items per call) }
+#: A case prepares everything that is not timed: the Acl to work on, and the arguments of the calls.
+CASES = OrderedDict()
+
+
+def case(name):
+    """ Register a benchmark case """
+    def decorator(function):
+        CASES[name] = function
+        return function
+    return decorator
+
+
+def _calls(function, args, items=1):
+    return function, args, items
+
+
+def _whole(bench, function, *args):
+    """ A single call that processes the whole Acl: its throughput is in grants per second """
+    return function, [args], len(bench.data.grants)
+
+
+#region Read
+
+@case('build')
+def _build(bench):
+    return _calls(bench.data.build, [(bench.cls,)], len(bench.data.grants))
+
+
+@case('get_roles')
+def _get_roles(bench):
+    return _calls(bench.acl.get_roles, [()] * bench.number)
+
+
+@case('get_resources')
+def _get_resources(bench):
+    return _calls(bench.acl.get_resources, [()] * bench.number)
+
+
+@case('get_permissions')
+def _get_permissions(bench):
+    return _calls(bench.acl.get_permissions, [(r,) for r in bench.resources()])
+
+
+@case('get_parents')
+def _get_parents(bench):
+    return _calls(bench.acl.get_parents, [(r,) for r in bench.roles()])
+
+
+@case('get_implied')
+def _get_implied(bench):
+    return _calls(bench.acl.get_implied, [(bench.rng.choice(bench.data.permissions),) for i in range(bench.number)])
+
+
+@case('get')
+def _get(bench):
+    return _whole(bench, bench.acl.get)
+
+
+@case('check')
+def _check(bench):
+    return _calls(bench.acl.check, bench.triples())
+
+
+@case('check_any')
+def _check_any(bench):
+    triples = bench.triples()
+    return _calls(bench.acl.check_any, [(roles, resource, permission)
+                                 for roles, (role, resource, permission) in zip(bench.roles(3), triples)])
+
+
+@case('check_all')
+def _check_all(bench):
+    triples = bench.triples()
+    return _calls(bench.acl.check_all, [(roles, resource, permission)
+                                 for roles, (role, resource, permission) in zip(bench.roles(3), triples)])
+
+
+@case('check_any_denied')
+def _check_any_denied(bench):
+    # Probes of resources that nobody holds: crawlers, anonymous users
+    permissions = bench.data.permissions
+    return _calls(bench.acl.check_any, [(roles, 'probe/{}'.format(i), permissions[i % len(permissions)])
+                                        for i, roles in enumerate(bench.roles(3))])
+
+
+@case('check_many')
+def _check_many(bench):
+    return _calls(bench.acl.check_many, [tuple(zip(*bench.triples()))], bench.number)
+
+
+@case('which_permissions')
+def _which_permissions(bench):
+    return _calls(bench.acl.which_permissions, list(zip(bench.roles(), bench.resources())))
+
+
+@case('which_permissions_any')
+def _which_permissions_any(bench):
+    return _calls(bench.acl.which_permissions_any, list(zip(bench.roles(3), bench.resources())))
+
+
+@case('which_permissions_all')
+def _which_permissions_all(bench):
+    return _calls(bench.acl.which_permissions_all, list(zip(bench.roles(3), bench.resources())))
+
+
+@case('which')
+def _which(bench):
+    return _calls(bench.acl.which, [(r,) for r in bench.roles()])
+
+
+@case('which_any')
+def _which_any(bench):
+    return _calls(bench.acl.which_any, [(r,) for r in bench.roles(3)])
+
+
+@case('which_all')
+def _which_all(bench):
+    return _calls(bench.acl.which_all, [(r,) for r in bench.roles(3)])
+
+
+@case('show')
+def _show(bench):
+    return _whole(bench, bench.acl.show)
+
+
+@case('who')
+def _who(bench):
+    return _calls(bench.acl.who, [(resource, permission) for role, resource, permission in bench.triples()])
+
+
+@case('who_any')
+def _who_any(bench):
+    permissions = bench.data.permissions[:2]
+    return _calls(bench.acl.who_any, [(resource, permissions) for resource in bench.resources()])
+
+
+@case('who_all')
+def _who_all(bench):
+    permissions = bench.data.permissions[:2]
+    return _calls(bench.acl.who_all, [(resource, permissions) for resource in bench.resources()])
+
+
+@case('resources_with')
+def _resources_with(bench):
+    return _calls(bench.acl.resources_with, [(p,) for p in bench.data.permissions])
+
+
+def _exhaust(iterator):
+    """ Consume an iterator, without keeping anything """
+    deque(iterator, maxlen=0)
+
+
+@case('iter_grants')
+def _iter_grants(bench):
+    return _whole(bench, lambda: _exhaust(bench.acl.iter_grants()))
+
+
+@case('iter_which')
+def _iter_which(bench):
+    return _calls(lambda role: _exhaust(bench.acl.iter_which(role)), [(r,) for r in bench.roles()])
+
+
+@case('view_roles')
+def _view_roles(bench):
+    return _calls(bench.acl.view_roles, [()] * bench.number)
+
+
+@case('view_structure')
+def _view_structure(bench):
+    return _whole(bench, lambda: _exhaust(permission for permissions in bench.acl.view_structure().values()
+                                          for permission in permissions))
+
+
+@case('view_grants')
+def _view_grants(bench):
+    return _whole(bench, lambda: _exhaust(permission for resources in bench.acl.view_grants().values()
+                                          for permissions in resources.values() for permission in permissions))
+
+
+#endregion
+
+#region Write
+
+@case('add_role')
+def _add_role(bench):
+    return _calls(bench.copy().add_role, [('new{}'.format(i),) for i in range(bench.number)])
+
+
+@case('add_roles')
+def _add_roles(bench):
+    roles = ['new{}'.format(i) for i in range(bench.number)]
+    return _calls(bench.copy().add_roles, [(roles,)], len(roles))
+
+
+@case('add_resource')
+def _add_resource(bench):
+    return _calls(bench.copy().add_resource, [('new{}'.format(i),) for i in range(bench.number)])
+
+
+@case('add_permission')
+def _add_permission(bench):
+    return _calls(bench.copy().add_permission, [(r, 'new') for r in bench.resources()])
+
+
+@case('add')
+def _add(bench):
+    structure = {'new{}'.format(i): ['read', 'write'] for i in range(bench.number)}
+    return _calls(bench.copy().add, [(structure,)], len(structure))
+
+
+@case('add_implied')
+def _add_implied(bench):
+    permissions = bench.data.permissions
+    return _calls(bench.copy().add_implied, [(permissions[0], permissions[1:2])])
+
+
+@case('grant')
+def _grant(bench):
+    return _calls(bench.copy().grant, bench.new_grants())
+
+
+@case('grants')
+def _grants(bench):
+    grants = {}
+    for role, resource, permission in bench.new_grants():
+        grants.setdefault(role, {}).setdefault(resource, []).append(permission)
+    return _calls(bench.copy().grants, [(grants,)], bench.number)
+
+
+@case('grant_many')
+def _grant_many(bench):
+    return _calls(bench.copy().grant_many, [(bench.new_grants(),)], bench.number)
+
+
+@case('revoke')
+def _revoke(bench):
+    return _calls(bench.copy().revoke, bench.triples())
+
+
+@case('revoke_many')
+def _revoke_many(bench):
+    return _calls(bench.copy().revoke_many, [(bench.triples(),)], bench.number)
+
+
+@case('revoke_all')
+def _revoke_all(bench):
+    return _calls(bench.copy().revoke_all, [(r,) for r in bench.roles()])
+
+
+@case('del_role')
+def _del_role(bench):
+    return _calls(bench.copy().del_role, [(r,) for r in bench.roles()])
+
+
+@case('del_roles')
+def _del_roles(bench):
+    roles = bench.roles()
+    return _calls(bench.copy().del_roles, [(roles,)], len(roles))
+
+
+@case('del_resource')
+def _del_resource(bench):
+    return _calls(bench.copy().del_resource, [(r,) for r in bench.resources()])
+
+
+@case('del_permission')
+def _del_permission(bench):
+    permissions = bench.data.permissions
+    return _calls(bench.copy().del_permission, [(r, bench.rng.choice(permissions)) for r in bench.resources()])
+
+
+@case('clear')
+def _clear(bench):
+    return _whole(bench, bench.copy().clear)
+
+
+#endregion
+
+#region Changes
+
+@case('changes_since')
+def _changes_since(bench):
+    acl = bench.cls(changelog=True)
+    acl.grant_many(bench.new_grants())
+    for role, resource, permission in bench.new_grants():
+        acl.grant(role, resource, permission)
+    return _calls(acl.changes_since, [(v,) for v in range(acl.get_version())])
+
+
+@case('apply_changes')
+def _apply_changes(bench):
+    acl = bench.cls(changelog=True)
+    for role, resource, permission in bench.new_grants():
+        acl.grant(role, resource, permission)
+    return _calls(bench.cls().apply_changes, [(acl.changes_since(0),)], bench.number)
+
+
+#endregion
+
+#region Export & Import
+
+@case('freeze')
+def _freeze(bench):
+    return _whole(bench, bench.acl.freeze)
+
+
+@case('__getstate__')
+def _getstate(bench):
+    return _whole(bench, bench.acl.__getstate__)
+
+
+@case('__setstate__')
+def _setstate(bench):
+    return _whole(bench, bench.cls().__setstate__, bench.acl.__getstate__())
+
+
+@case('pickle.dumps')
+def _pickle_dumps(bench):
+    return _whole(bench, pickle.dumps, bench.acl, pickle.HIGHEST_PROTOCOL)
+
+
+@case('pickle.loads')
+def _pickle_loads(bench):
+    return _whole(bench, pickle.loads, pickle.dumps(bench.acl, pickle.HIGHEST_PROTOCOL))
+
+
+@case('dumps')
+def _dumps(bench):
+    return _whole(bench, bench.acl.dumps)
+
+
+@case('loads')
+def _loads(bench):
+    return _whole(bench, bench.cls.loads, bench.acl.dumps())
+
+
+@case('dump')
+def _dump(bench):
+    return _whole(bench, bench.acl.dump, io.BytesIO())
+
+
+@case('load')
+def _load(bench):
+    return _whole(bench, lambda data: bench.cls.load(io.BytesIO(data)), bench.acl.dumps())
+
+
+#endregion
+
+
+def _run(function, args):
+    """ Call the function with every set of arguments
+
+    :return: Elapsed seconds
+    :rtype: float
+    """
+    start = _clock()
+    for a in args:
+        function(*a)
+    return _clock() - start
+
+
+def measure(bench, name, repeat, memory=True):
+    """ Benchmark a case
+
+    :return: { 'items', 'seconds', 'throughput', 'peak' }. Peak memory is None when it's not measured
+    :rtype: dict
+    """
+    best = None
+    for i in range(repeat):
+        function, args, items = CASES[name](bench)
+        count = len(args) * items
+        seconds = _run(function, args)
+        best = seconds if best is None else min(best, seconds)
+    del function, args
+
+    peak = None
+    if memory and tracemalloc is not None:
+        function, args, items = CASES[name](bench)
+        tracemalloc.start()
+        try:
+            _run(function, args)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'items': count,
+        'seconds': best,
+        'throughput': count / best if best else float('inf'),
+        'peak': peak,
+    }
+
+
+def compare(results, baseline, threshold):
+    """ Compare results to a baseline
+
+    :return: { key: (throughput ratio, peak ratio or None, regressed) }
+    :rtype: dict
+    """
+    ret = {}
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        speed = result['throughput'] / base['throughput']
+        peak = result['peak'] / float(base['peak']) if result['peak'] and base.get('peak') else None
+        ret[key] = (speed, peak, speed < 1 - threshold or peak is not None and peak > 1 + threshold)
+    return ret
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scale', default='10k', choices=list(SCALES), help='preset scale (default: %(default)s)')
+    parser.add_argument('--roles', type=int, help='number of roles: overrides the preset')
+    parser.add_argument('--resources', type=int, help='number of resources: overrides the preset')
+    parser.add_argument('--permissions', type=int, help='permissions per resource: overrides the preset')
+    parser.add_argument('--density', type=float, help='fraction of the triples that are granted: overrides the preset')
+    parser.add_argument('--parents', type=float, default=0.0, help='fraction of the roles with a parent (default: 0)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: %(default)s)')
+    parser.add_argument('--acl', default='Acl', help='comma-separated Acl classes (default: %(default)s)')
+    parser.add_argument('--cases', help='comma-separated cases (default: all)')
+    parser.add_argument('--number', type=int, default=1000, help='calls per case (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per case; the best one is kept (default: %(default)s)')
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='do not measure peak memory')
+    parser.add_argument('--save', metavar='FILE', help='save the results as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare the results to a baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative change that is a regression (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    roles, resources, permissions, density = SCALES[args.scale]
+    data = Synthetic(
+        args.roles or roles, args.resources or resources, args.permissions or permissions,
+        args.density or density, args.parents, args.seed
+    )
+    classes = args.acl.split(',')
+    for name in classes:
+        if not isinstance(getattr(miracle, name, None), type) or not issubclass(getattr(miracle, name), miracle.Acl):
+            parser.error('not an Acl class: {}'.format(name))
+    cases = args.cases.split(',') if args.cases else list(CASES)
+    for name in cases:
+        if name not in CASES:
+            parser.error('unknown case: {}'.format(name))
+    parameters = {'roles': len(data.roles), 'resources': len(data.resources),
+                  'permissions': len(data.permissions), 'grants': len(data.grants), 'seed': args.seed}
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            saved = json.load(f)
+        if saved['data'] != parameters:
+            parser.error('the baseline was measured on other data: {}, this run: {}'.format(
+                ', '.join('{} {}'.format(name, value) for name, value in sorted(saved['data'].items())),
+                ', '.join('{} {}'.format(name, value) for name, value in sorted(parameters.items()))))
+        baseline = saved['results']
+
+    print('{} roles, {} resources, {} permissions, {} grants; Python {}'.format(
+        len(data.roles), len(data.resources), len(data.permissions), len(data.grants), platform.python_version()))
+
+    results = OrderedDict()
+    for cls_name in classes:
+        bench = Bench(getattr(miracle, cls_name), data, args.number, args.seed)
+        for name in cases:
+            key = '{} {}'.format(cls_name, name)
+            results[key] = measure(bench, name, args.repeat, args.memory)
+
+    # Report
+    comparison = compare(results, baseline, args.threshold) if baseline is not None else {}
+    print('{:<32} {:>10} {:>14} {:>12} {:>10}'.format('case', 'items', 'per second', 'peak KiB', 'baseline'))
+    for key, result in results.items():
+        line = '{:<32} {:>10} {:>14,.0f} {:>12}'.format(
+            key, result['items'], result['throughput'],
+            '-' if result['peak'] is None else '{:,.0f}'.format(result['peak'] / 1024.0))
+        if key in comparison:
+            speed, peak, regressed = comparison[key]
+            line += ' {:>+9.0%}{}'.format(speed - 1, '  REGRESSION' if regressed else '')
+        print(line)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'data': parameters,
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    regressions = [key for key, (speed, peak, regressed) in comparison.items() if regressed]
+    if regressions:
+        print('Regressions: {}'.format(', '.join(regressions)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
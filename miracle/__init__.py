@@ -1 +1,9 @@
 from .acl import Acl
+from .compact import CompactAcl
+from .frozen import FrozenAcl
+from .concurrent import ConcurrentAcl
+from .mapped import MappedAcl
+from .metrics import Metrics
+from .audit import DecisionLog
+from .storage import Storage, MemoryStorage
+from .sqlite import SqliteStorage, SqliteAcl
@@ -1,8 +1,135 @@
-from collections import defaultdict
+import gc
+import pickle
+from array import array
+from collections import defaultdict, deque, OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from inspect import getcallargs
+from itertools import chain, islice
+
+from .conditions import Condition
+from .metrics import Metrics
+from .views import SetView, MaskView, MappingView
+
+#: Version of the `Acl.dumps()` binary format
+DUMP_FORMAT = 1
+
+
+def _index_discard(index, key, subkey, value):
+    """ Discard a value from a two-level index: { key: { subkey: set(value) } }
+
+        Emptied entries are dropped so the index never outgrows the grants.
+    """
+    values = index[key][subkey]
+    values.discard(value)
+    if not values:
+        del index[key][subkey]
+        if not index[key]:
+            del index[key]
+
+
+def _copy_grants(grants):
+    """ Copy a dict of sets: { resource: set(permission) } """
+    return {resource: set(permissions) for resource, permissions in grants.items()}
+
+
+def _copy_structure(grants):
+    """ Copy a dict of dicts of sets: { role: { resource: set(permission) } } """
+    return {role: _copy_grants(resources) for role, resources in grants.items()}
+
+
+@contextmanager
+def _gc_paused():
+    """ Pause the garbage collector while creating lots of long-lived objects
+
+        Otherwise, the collector keeps scanning them all over again.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+#: Shared empty mapping for lookups that miss. Never modified.
+_EMPTY = {}
+
+#: Methods recorded in the changelog: { name: converters }
+_LOGGED = {}
+
+
+def _logged(**converters):
+    """ Mark a mutating method to be recorded in the changelog
+
+        Converters copy the arguments that the caller may consume or modify later, like iterators and dicts.
+    """
+    def decorator(method):
+        _LOGGED[method.__name__] = converters
+        return method
+    return decorator
+
+
+def _recorder(acl, name, converters):
+    """ Wrap a mutating method of an Acl to record its calls in the changelog
+
+        Only the outermost call is recorded: a method that calls others is replayed as a single change.
+        Arguments are recorded by name.
+        Failed calls are not recorded: mutating methods validate their arguments before changing anything.
+    """
+    method = getattr(acl, name)
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        if acl._recording:
+            return method(*args, **kwargs)
+
+        kwargs = getcallargs(method, *args, **kwargs)
+        del kwargs['self']
+        for arg, convert in converters.items():
+            if kwargs[arg] is not None:
+                kwargs[arg] = convert(kwargs[arg])
+
+        acl._recording = True
+        try:
+            ret = method(**kwargs)
+        finally:
+            acl._recording = False
+        acl._version += 1
+        acl._changelog.append((acl._version, name, kwargs))
+        return ret
+    return wrapper
+
+
+def _unpickle(cls, data, cache_size=0, changelog=False):
+    """ Unpickle an Acl from its `dumps()`, and the arguments of its constructor
+
+        The changelog starts empty: replicas behind the pickled version have to load a fresh copy.
+    """
+    acl = cls.loads(data)
+    acl._cache_size = cache_size
+    if changelog:
+        acl._start_changelog(changelog)
+    return acl
 
 
 class Acl(object):
-    def __init__(self):
+    def __init__(self, cache_size=0, changelog=False, separator=None):
+        """ Create an Acl
+
+        :param cache_size: Number of `which_*_any()` and `which_*_all()` results to memoize.
+            Default: no memoization
+        :type cache_size: int
+        :param changelog: Record the changes for `changes_since()`: True to keep all of them,
+            or the number of most recent changes to keep.
+            Default: no changelog
+        :type changelog: bool|int
+        :param separator: Make string resources hierarchical paths, like 'project/42/doc/7'.
+            A grant on a wildcard resource, like 'project/42/*', covers all of its descendants.
+            Default: resources are flat
+        :type separator: str
+        """
         #: Set of defined roles
         self._roles = set()
 
@@ -12,21 +139,530 @@ class Acl(object):
         #: Grants: set( (role, resource, permission) )
         self._grants = set()
 
+        #: Grants index by role: { role: { resource: mask } }
+        #: Permissions are stored as a bitmask, see `_bit()`
+        self._role_grants = {}
+
+        #: Grants index by resource: { resource: { permission: set(role) } }
+        self._resource_grants = {}
+
+        #: Grants index by permission: { permission: { resource: set(role) } }
+        #: The sets of roles are shared with `_resource_grants`
+        self._permission_grants = {}
+
+        #: Permission bit positions: { resource: { permission: bit } }
+        self._bits = {}
+
+        #: Permissions by bit position: { resource: [permission|None] }
+        self._perms = {}
+
+        #: Path separator of hierarchical resources, or None
+        self._separator = separator
+
+        #: Prefix trie of wildcard resources: { segment: node }, with the wildcard resource under the `None` key
+        self._trie = {}
+
+        #: Implied permissions: { permission: set(implied permission) }
+        self._implied = {}
+
+        #: Whether grants are expanded: when there are implied permissions, or '*' grants
+        self._expanding = False
+
+        #: Conditional grants: { role: { resource: { permission: Condition } } }
+        self._conditions = {}
+
+        #: Role inheritance: { role: set(parent) }
+        self._parents = {}
+
+        #: Role inheritance, reversed: { role: set(child) }
+        self._children = {}
+
+        #: Cached effective grants of roles that have parents: { role: { resource: mask } }
+        self._effective_grants = {}
+
+        #: Generation: incremented on every change of the grants
+        self._generation = 0
+
+        #: Memoized results: LRU { key: result }
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_generation = 0
+
+        #: Changelog: [ (version, method name, arguments) ], or None when disabled
+        self._changelog = None
+        if changelog:
+            self._start_changelog(changelog)
+
+        #: Version: number of the last recorded or applied change
+        self._version = 0
+
+        #: Whether a change is being recorded: nested calls are not
+        self._recording = False
+
+        #: Metrics of the calls, or None when not instrumented
+        self._metrics = None
+
+        #: Log of the decisions of the checks, or None when not audited
+        self._decisions = None
+
+    #region Bits
+
+    def _bit(self, resource, permission):
+        """ Get the bit position of a permission, allocating one if missing
+
+            Every granted permission on a resource gets its own bit,
+            so the permissions of a (role, resource) pair fit into a single integer.
+
+        :rtype: int
+        """
+        bits = self._bits.get(resource)
+        if bits is None:
+            bits = self._bits[resource] = {}
+            self._trie_add(resource)
+        if permission not in bits:
+            perms = self._perms.setdefault(resource, [])
+            try:
+                bit = perms.index(None)  # reuse a freed bit
+                perms[bit] = permission
+            except ValueError:
+                bit = len(perms)
+                perms.append(permission)
+            bits[permission] = bit
+            if self._expanding or permission == '*':
+                self._expand_bits(resource, permission)
+        return bits[permission]
+
+    def _mask(self, resource, permission):
+        """ Get the bitmask of a permission, or 0 when it was never granted
+
+        :rtype: int
+        """
+        bit = self._bits.get(resource, {}).get(permission)
+        return 0 if bit is None else 1 << bit
+
+    def _decode(self, resource, mask):
+        """ Convert a bitmask of permissions on a resource into a set of permissions
+
+        :rtype: set
+        """
+        perms = self._perms[resource]
+        return {perms[bit] for bit in range(mask.bit_length()) if mask >> bit & 1}
+
+    def _iter_mask(self, resource, mask):
+        """ Iterate over the permissions of a bitmask, without making a set """
+        perms = self._perms[resource]
+        while mask:
+            low = mask & -mask
+            yield perms[low.bit_length() - 1]
+            mask ^= low
+
+    def _implied_closure(self, resource, permissions):
+        """ Get the permissions, and all the permissions they imply on a resource, recursively
+
+            The '*' permission implies all permissions defined on the resource.
+
+        :rtype: set
+        """
+        ret = set()
+        stack = list(permissions)
+        while stack:
+            permission = stack.pop()
+            if permission not in ret:
+                ret.add(permission)
+                stack.extend(self._implied.get(permission, ()))
+                if permission == '*':
+                    stack.extend(self._structure.get(resource, ()))
+        return ret
+
+    def _expand_bits(self, resource, permission):
+        """ Allocate bits for the permissions that a permission implies on a resource
+
+            Expanding a grant then never allocates anything: it's a matter of bitwise OR.
+        """
+        if permission == '*':
+            self._expanding = True
+        bits = self._bits[resource]
+        for implied in self._implied_closure(resource, [permission]):
+            if implied not in bits:
+                self._bit(resource, implied)
+        mask = 0
+        for implying in self._implying(permission):
+            if implying in bits:
+                mask |= 1 << bits[implying]
+        if mask and self._holders(resource, mask):
+            self._changed()  # grants implying the new permission, or '*' grants, cover it
+
+    def _expand(self, resource, mask):
+        """ Expand a bitmask of permissions with the permissions they imply
+
+        :rtype: int
+        """
+        bits = self._bits[resource]
+        for permission in self._implied_closure(resource, self._decode(resource, mask)):
+            bit = bits.get(permission)
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def _implying_mask(self, resource, permission):
+        """ Get the bitmask of the permissions on a resource that grant a permission: itself, and those implying it
+
+        :rtype: int
+        """
+        mask = self._mask(resource, permission)
+        if mask and self._expanding:
+            for bit, granted in enumerate(self._perms[resource]):
+                if granted is not None and self._expand(resource, 1 << bit) & mask:
+                    mask |= 1 << bit
+        return mask
+
+    def _implying(self, permission):
+        """ Get the permissions that may imply a permission, recursively. '*' implies them all
+
+        :rtype: set
+        """
+        ret = {'*'}
+        stack = [permission, '*']
+        while stack:
+            target = stack.pop()
+            for implying, implied in self._implied.items():
+                if target in implied and implying not in ret:
+                    ret.add(implying)
+                    stack.append(implying)
+        return ret
+
+    def _free_bits(self, resource, permission=None):
+        """ Release the bit of a permission [or all bits of a resource] once it has no grants """
+        if permission is None:
+            if self._bits.pop(resource, None) is not None:
+                self._trie_discard(resource)
+            self._perms.pop(resource, None)
+        elif permission in self._bits.get(resource, ()):
+            if self._expanding and self._implied_by_grants(resource, permission):
+                return  # expanded grants still hold it
+            self._perms[resource][self._bits[resource].pop(permission)] = None
+
+    def _implied_by_grants(self, resource, permission):
+        """ Test whether the other permissions granted over a resource imply a permission
+
+        :rtype: bool
+        """
+        granted = [other for other in self._perms[resource]
+                   if other is not None and other != permission and self._holders(resource, self._mask(resource, other))]
+        return permission in self._implied_closure(resource, granted)
+
+    #endregion
+
+    #region Hierarchy
+
+    def _wildcard_path(self, resource):
+        """ Get the path of a wildcard resource: 'project/42/*' -> ['project', '42']
+
+        :return: Path segments, or None when the resource is not a wildcard
+        :rtype: list|None
+        """
+        if self._separator is None:
+            return None
+        try:
+            segments = resource.split(self._separator)
+        except (AttributeError, TypeError):
+            return None
+        return segments[:-1] if segments[-1] == '*' else None
+
+    def _trie_add(self, resource):
+        """ Index a resource in the trie, if it's a wildcard """
+        segments = self._wildcard_path(resource)
+        if segments is not None:
+            node = self._trie
+            for segment in segments:
+                node = node.setdefault(segment, {})
+            node[None] = resource
+
+    def _trie_discard(self, resource):
+        """ Remove a wildcard resource from the trie, and prune the emptied nodes """
+        segments = self._wildcard_path(resource)
+        if segments is None:
+            return
+        nodes = [self._trie]
+        for segment in segments:
+            nodes.append(nodes[-1].get(segment))
+            if nodes[-1] is None:
+                return
+        nodes[-1].pop(None, None)
+        for segment, parent, node in reversed(list(zip(segments, nodes, nodes[1:]))):
+            if node:
+                break
+            del parent[segment]
+
+    def _covering(self, resource):
+        """ Get the wildcard resources that cover a resource, from the root down
+
+            Walks the trie along the path, so it costs O(path depth) whatever the number of grants.
+
+        :rtype: list
+        """
+        try:
+            segments = resource.split(self._separator)
+        except (AttributeError, TypeError):
+            return []
+        node = self._trie
+        ret = [node[None]] if None in node else []
+        for segment in segments[:-1]:
+            node = node.get(segment)
+            if node is None:
+                break
+            if None in node:
+                ret.append(node[None])
+        return ret
+
+    def _allows(self, grants, resource, permission):
+        """ Test a permission in the effective grants of a role, including the wildcard grants
+
+        :param grants: Effective grants: { resource: mask }
+        :rtype: bool
+        """
+        if grants.get(resource, 0) & self._mask(resource, permission):
+            return True
+        return bool(self._trie) and any(grants.get(wildcard, 0) & self._mask(wildcard, permission) for wildcard in self._covering(resource))
+
+    def _permissions_in(self, grants, resource):
+        """ Get the permissions on a resource from the effective grants of a role, including the wildcard grants
+
+        :param grants: Effective grants: { resource: mask }
+        :rtype: set
+        """
+        mask = grants.get(resource, 0)
+        ret = self._decode(resource, mask) if mask else set()
+        if self._trie:
+            for wildcard in self._covering(resource):
+                mask = grants.get(wildcard, 0)
+                if mask:
+                    ret |= self._decode(wildcard, mask)
+        return ret
+
+    #endregion
+
+    #region Inheritance
+
+    def _ancestors(self, role):
+        """ Get all ancestors of a role
+
+        :rtype: set
+        """
+        ret = set()
+        stack = [role]
+        while stack:
+            for parent in self._parents.get(stack.pop(), ()):
+                if parent not in ret:
+                    ret.add(parent)
+                    stack.append(parent)
+        return ret
+
+    def _descendants(self, role):
+        """ Get all descendants of a role
+
+        :rtype: set
+        """
+        ret = set()
+        stack = [role]
+        while stack:
+            for child in self._children.get(stack.pop(), ()):
+                if child not in ret:
+                    ret.add(child)
+                    stack.append(child)
+        return ret
+
+    def _grants_of(self, role):
+        """ Get the effective grants of a role, including the inherited and implied ones: { resource: mask }
+
+            Roles without parents simply use the index. For the others, the union of the grants
+            of all their ancestors is computed once, and cached until their grants or parents change.
+            Implied permissions are expanded the same way.
+
+        :rtype: dict
+        """
+        if role not in self._parents and not self._expanding:
+            return self._role_grants.get(role, {})
+
+        resources = self._effective_grants.get(role)
+        if resources is None:
+            resources = dict(self._role_grants.get(role, {}))
+            for ancestor in self._ancestors(role):
+                for resource, mask in self._role_grants.get(ancestor, {}).items():
+                    resources[resource] = resources.get(resource, 0) | mask
+            if self._expanding:
+                expand = self._expand
+                resources = {resource: expand(resource, mask) for resource, mask in resources.items()}
+            self._effective_grants[role] = resources
+        return resources
+
+    def _unlink_role(self, role):
+        """ Remove a role from the inheritance graph """
+        self._changed(role)
+        for parent in self._parents.pop(role, ()):
+            self._children[parent].discard(role)
+            if not self._children[parent]:
+                del self._children[parent]
+        for child in self._children.pop(role, ()):
+            self._parents[child].discard(role)
+            if not self._parents[child]:
+                del self._parents[child]
+
+    #endregion
+
+    #region Conditions
+
+    def _conditional(self, role, resource, permission, context, results=None):
+        """ Test the conditional grants of a role [and its ancestors] against a context
+
+        :param results: Memo of the results of conditions: { (id(condition), id(context)): bool }
+        :type results: dict
+        :rtype: bool
+        """
+        conditions = self._conditions
+        for role in chain((role,), self._ancestors(role)) if role in self._parents else (role,):
+            condition = conditions.get(role, _EMPTY).get(resource, _EMPTY).get(permission)
+            if condition is None:
+                continue
+            if results is None:
+                if condition.holds(context):
+                    return True
+                continue
+            key = (id(condition), id(context))
+            if key not in results:
+                results[key] = condition.holds(context)
+            if results[key]:
+                return True
+        return False
+
+    def _check_many_conditional(self, roles, resources, permissions, contexts):
+        """ check_many() with contexts
+
+            Unconditional grants are checked in bulk, then the conditions of the misses are tested,
+            each condition once per context.
+        """
+        checks = list(zip(roles, resources, permissions, contexts))
+        ret = self.check_many([check[0] for check in checks], [check[1] for check in checks], [check[2] for check in checks])
+        conditional = self._conditional
+        results = {}
+        for i, (role, resource, permission, context) in enumerate(checks):
+            if not ret[i] and context is not None:
+                ret[i] = conditional(role, resource, permission, context, results)
+        return ret
+
+    def _check_roles_conditional(self, roles, resource, permission, context, every):
+        """ check_any() [check_all()] with a context
+
+            Unconditional grants of all the roles are checked first, then the conditions of the misses,
+            each condition once: the result does not depend on the order of the roles.
+        """
+        roles = list(roles)
+        conditional = self._conditional
+        results = {}
+        if every:
+            misses = [role for role in roles if not self.check(role, resource, permission)]
+            return all(conditional(role, resource, permission, context, results) for role in misses)
+        if self.check_any(roles, resource, permission):
+            return True
+        return any(conditional(role, resource, permission, context, results) for role in roles)
+
+    def _discard_conditions(self, role, resource, permission=None):
+        """ Remove the conditional grants of a role over a resource [with a permission] """
+        resources = self._conditions.get(role)
+        if resources is None or resource not in resources:
+            return
+        permissions = resources[resource]
+        permissions.pop(permission, None)
+        if permission is not None and permissions:
+            return
+        del resources[resource]
+        if not resources:
+            del self._conditions[role]
+
+    #endregion
+
+    #region Cache
+
+    def _changed(self, role=None):
+        """ Record a change of the grants [of a single role]
+
+            Bumps the generation, which invalidates the memoized results,
+            and drops the cached effective grants of the role and everything that inherits from it [of all roles].
+        """
+        self._generation += 1
+        if not self._effective_grants:
+            return
+        if role is None:
+            self._effective_grants.clear()
+        else:
+            self._effective_grants.pop(role, None)
+            for child in self._descendants(role):
+                self._effective_grants.pop(child, None)
+
+    def _memoize(self, key, compute, copy):
+        """ Get a result from the LRU cache, or compute it
+
+            The cache is dropped as soon as the generation changes, so stale results are never returned.
+            Cached results are never handed out: the caller gets a copy.
+
+        :param key: Cache key
+        :param compute: Function that computes the result
+        :param copy: Function that copies the result
+        """
+        if not self._cache_size:
+            return compute()
+
+        cache = self._cache
+        if self._cache_generation != self._generation:
+            cache.clear()
+            self._cache_generation = self._generation
+
+        try:
+            ret = cache.pop(key)
+        except KeyError:
+            ret = compute()
+            while len(cache) >= self._cache_size:
+                try:
+                    cache.popitem(last=False)  # least recently used
+                except KeyError:
+                    break
+        cache[key] = ret
+        return copy(ret)
+
+    #endregion
+
     #region Add
 
-    def add_role(self, role):
+    @_logged(parents=list)
+    def add_role(self, role, parents=None):
         """ Define a role.
 
             Existing roles are not overwritten nor duplicated.
 
+            A role can inherit all grants from its parents, and their parents, recursively.
+            Parents are added to the existing ones, and are defined if missing.
+
         :param role: Role to define.
             Any hashable object will do.
         :type role: str
+        :param parents: Roles to inherit the grants from
+        :type parents: list(str)
         :rtype: Acl
+        :raises ValueError: the inheritance would make a cycle
         """
+        parents = set(parents or ())
+        if any(parent == role or role in self._ancestors(parent) for parent in parents):
+            raise ValueError('Role {!r} can not inherit from itself'.format(role))
         self._roles.add(role)
+        if parents:
+            self._roles.update(parents)
+            self._changed(role)
+            self._parents.setdefault(role, set()).update(parents)
+            for parent in parents:
+                self._children.setdefault(parent, set()).add(role)
         return self
 
+    @_logged(roles=list)
     def add_roles(self, roles):
         """ Define multiple roles
 
@@ -39,6 +675,7 @@ class Acl(object):
         self._roles.update(set(roles))
         return self
 
+    @_logged()
     def add_resource(self, resource):
         """ Define a resource.
 
@@ -53,6 +690,7 @@ class Acl(object):
             self._structure[resource] = set()
         return self
 
+    @_logged()
     def add_permission(self, resource, permission):
         """ Define permission on a resource
 
@@ -66,8 +704,11 @@ class Acl(object):
         :rtype: Acl
         """
         self._structure[resource].add(permission)
+        if '*' in self._bits.get(resource, ()):
+            self._bit(resource, permission)
         return self
 
+    @_logged(structure=_copy_grants)
     def add(self, structure):
         """ Define the whole structure of resources and permissions
 
@@ -76,14 +717,38 @@ class Acl(object):
         :rtype: Acl
         """
         for resource, permissions in structure.items():
-            for permission in permissions:
-                self._structure[resource].add(permission)
+            self._structure[resource].update(permissions)
+            if '*' in self._bits.get(resource, ()):
+                for permission in permissions:
+                    self._bit(resource, permission)
+        return self
+
+    @_logged(implied=list)
+    def add_implied(self, permission, implied):
+        """ Make a permission imply other permissions
+
+            Whoever is granted the permission over a resource also has the implied permissions, recursively.
+            Grants are expanded when they're made, so checks are not any slower.
+
+        :param permission: The implying permission, like 'write'
+        :type permission: str
+        :param implied: The permissions it implies, like ['read']
+        :type implied: list(str)
+        :rtype: Acl
+        """
+        self._implied.setdefault(permission, set()).update(implied)
+        self._expanding = True
+        for resource, bits in list(self._bits.items()):
+            for granted in list(bits):
+                self._expand_bits(resource, granted)
+        self._changed()
         return self
 
     #endregion
 
     #region Delete
 
+    @_logged()
     def clear(self):
         """ Clear the Acl completely
 
@@ -94,10 +759,23 @@ class Acl(object):
         self._roles.clear()
         self._structure.clear()
         self._grants.clear()
+        self._role_grants.clear()
+        self._resource_grants.clear()
+        self._permission_grants.clear()
+        self._bits.clear()
+        self._perms.clear()
+        self._trie.clear()
+        self._implied.clear()
+        self._expanding = False
+        self._conditions.clear()
+        self._parents.clear()
+        self._children.clear()
+        self._changed()
         return self
 
+    @_logged()
     def del_role(self, role):
-        """ Remove a role. The grants remain.
+        """ Remove a role and its grants.
 
             Undefined roles are silently ignored
 
@@ -106,11 +784,31 @@ class Acl(object):
         :rtype: Acl
         """
         self._roles.discard(role)
-        self._grants = set([x for x in self._grants if x[0] != role])
+        self._unlink_role(role)
+        self._conditions.pop(role, None)
+        for resource, mask in self._role_grants.pop(role, {}).items():
+            for permission in self._decode(resource, mask):
+                self._grants.remove((role, resource, permission))
+                self._discard_holder(role, resource, permission)
         return self
 
+    @_logged(roles=list)
+    def del_roles(self, roles):
+        """ Remove multiple roles and their grants.
+
+            Undefined roles are silently ignored
+
+        :param roles: Roles to remove
+        :type roles: list(str)
+        :rtype: Acl
+        """
+        for role in roles:
+            self.del_role(role)
+        return self
+
+    @_logged()
     def del_resource(self, resource):
-        """ Remove a resource and its permissions. The grants remain.
+        """ Remove a resource, its permissions and grants.
 
             Undefined resources are silently ignored
 
@@ -120,11 +818,27 @@ class Acl(object):
         """
         if resource in self._structure:
             del self._structure[resource]
-        self._grants = set([x for x in self._grants if x[1] != resource])
+        for permission, roles in self._resource_grants.pop(resource, {}).items():
+            holders = self._permission_grants[permission]
+            del holders[resource]
+            if not holders:
+                del self._permission_grants[permission]
+            for role in roles:
+                self._grants.remove((role, resource, permission))
+                resources = self._role_grants.get(role)
+                if resources is not None:  # already dropped with another permission
+                    resources.pop(resource, None)
+                    if not resources:
+                        del self._role_grants[role]
+        for role in list(self._conditions):
+            self._discard_conditions(role, resource)
+        self._free_bits(resource)
+        self._changed()
         return self
 
+    @_logged()
     def del_permission(self, resource, permission):
-        """ Remove a permission from the resource. The grants remain.
+        """ Remove a permission from the resource, and its grants over the resource.
 
             Undefined resources and permissions are silently ignored
 
@@ -136,7 +850,12 @@ class Acl(object):
         """
         if resource in self._structure:
             self._structure[resource].discard(permission)
-        self._grants = set([x for x in self._grants if x[2] != permission])
+        for role in list(self._resource_grants.get(resource, {}).get(permission, ())):
+            self._remove_grant(role, resource, permission)
+        for role in list(self._conditions):
+            self._discard_conditions(role, resource, permission)
+        self._free_bits(resource, permission)
+        self._changed()
         return self
 
     #endregion
@@ -168,6 +887,24 @@ class Acl(object):
             return set()
         return set(self._structure[resource])
 
+    def get_parents(self, role):
+        """ Get the set of roles the role directly inherits from
+
+        :param role: The role to get the parents of
+        :type role: str
+        :rtype: set(str)
+        """
+        return set(self._parents.get(role, ()))
+
+    def get_implied(self, permission):
+        """ Get the set of permissions that the permission directly implies
+
+        :param permission: The permission to get the implied permissions of
+        :type permission: str
+        :rtype: set(str)
+        """
+        return set(self._implied.get(permission, ()))
+
     def get(self):
         """ Get the whole structure of resources and permissions
 
@@ -184,25 +921,102 @@ class Acl(object):
 
     #region Grant Permissions
 
-    def grant(self, role, resource, permission):
+    def _holders_set(self, resource, permission):
+        """ Get the set of roles granted a permission over a resource, adding it to both indexes if missing
+
+        :rtype: set
+        """
+        holders = self._resource_grants.setdefault(resource, {}).get(permission)
+        if holders is None:
+            holders = self._resource_grants[resource][permission] = set()
+            self._permission_grants.setdefault(permission, {})[resource] = holders
+        return holders
+
+    def _discard_holder(self, role, resource, permission):
+        """ Remove a role from the holders of a permission over a resource, in both indexes """
+        _index_discard(self._resource_grants, resource, permission, role)
+        # The set is shared: this only drops the entries it emptied
+        _index_discard(self._permission_grants, permission, resource, role)
+
+    def _holders_of(self, resource, permission):
+        """ Get the roles granted a permission over a resource directly, or None when there are none
+
+            This is the negative fast path of checks: most denials are for pairs that no role holds,
+            and they're answered by two dict lookups, whatever the number of roles.
+            Without hierarchical resources or implied permissions, a role can only hold a permission
+            through a direct grant, to itself or to an ancestor.
+
+        :rtype: set|None
+        """
+        return self._resource_grants.get(resource, _EMPTY).get(permission)
+
+    def _holders(self, resource, mask):
+        """ Get the roles granted any of the permissions of a bitmask over a resource. Not inherited.
+
+        :rtype: set
+        """
+        holders = self._resource_grants.get(resource, _EMPTY)
+        return set().union(*(holders.get(permission, ()) for permission in self._decode(resource, mask)))
+
+    def _add_grant(self, role, resource, permission):
+        """ Store a single grant and update the indexes """
+        self._grants.add((role, resource, permission))
+        resources = self._role_grants.setdefault(role, {})
+        resources[resource] = resources.get(resource, 0) | 1 << self._bit(resource, permission)
+        self._holders_set(resource, permission).add(role)
+        self._changed(role)
+
+    def _remove_grant(self, role, resource, permission):
+        """ Remove a single grant and update the indexes """
+        grant = (role, resource, permission)
+        if grant not in self._grants:
+            return
+        self._grants.remove(grant)
+        resources = self._role_grants[role]
+        resources[resource] &= ~self._mask(resource, permission)
+        if not resources[resource]:
+            del resources[resource]
+            if not resources:
+                del self._role_grants[role]
+        self._discard_holder(role, resource, permission)
+        self._changed(role)
+
+    @_logged()
+    def grant(self, role, resource, permission, condition=None):
         """ Grant a permission over resource to the role.
 
             Missing entities are added to the structure
 
+            A conditional grant only holds when its condition does, for the context given to `check()`.
+            The condition is either a callable that takes the context, or an expression over the context keys,
+            like "user == author". Granting again replaces the condition, or makes the grant unconditional.
+
         :param role: The role to grant the access to
         :type role: str
         :param resource: The resource to grant the access over
         :type resource: str
         :param permission: The permission to grant with
         :type permission: str
+        :param condition: The condition of the grant. Default: unconditional
+        :type condition: callable|str
         :rtype: Acl
+        :raises ValueError: Invalid condition expression
         """
+        if condition is not None:
+            condition = Condition(condition)
         self.add_role(role)
         self.add_resource(resource)
         self.add_permission(resource, permission)
-        self._grants.add((role, resource, permission))
+        if condition is None:
+            if self._conditions:
+                self._discard_conditions(role, resource, permission)
+            self._add_grant(role, resource, permission)
+        else:
+            self._remove_grant(role, resource, permission)
+            self._conditions.setdefault(role, {}).setdefault(resource, {})[permission] = condition
         return self
 
+    @_logged(grants=_copy_structure)
     def grants(self, grants):
         """ Add a structure of grants to the Acl
 
@@ -214,13 +1028,73 @@ class Acl(object):
         """
         for role, gs in grants.items():
             self.add_role(role)
-            for resource, permissions in gs.items():
+            for resource in gs:
                 self.add_resource(resource)
-                for permission in permissions:
-                    self.add_permission(resource, permission)
-                    self._grants.add((role, resource, permission))
+        return self.grant_many(
+            (role, resource, permission)
+            for role, gs in grants.items()
+            for resource, permissions in gs.items()
+            for permission in permissions
+        )
+
+    @_logged(grants=list)
+    def grant_many(self, grants):
+        """ Grant multiple permissions at once
+
+            Input: iterable of (role, resource, permission)
+
+            Missing entities are added to the structure.
+            This is the fast way to load lots of grants: the structure and the indexes
+            are updated in a single pass, without a method call per grant.
+
+        :param grants: Iterable of grants to add
+        :type grants: collections.Iterable(tuple(str, str, str))
+        :rtype: Acl
+        :raises ValueError: A grant is not a (role, resource, permission) triple. Nothing is granted then
+        """
+        all_grants = self._grants
+        structure = self._structure
+        role_grants = self._role_grants
+        resource_grants = self._resource_grants
+        permission_grants = self._permission_grants
+        conditions = self._conditions
+        bit = self._bit
+        roles = set()
+
+        # Unpacked beforehand: malformed grants fail before anything changes
+        grants = [(role, resource, permission) for role, resource, permission in grants]
+
+        try:
+            for role, resource, permission in grants:
+                grant = (role, resource, permission)
+                if grant in all_grants:
+                    continue
+                if conditions:
+                    self._discard_conditions(role, resource, permission)
+                all_grants.add(grant)
+                roles.add(role)
+                structure[resource].add(permission)
+
+                resources = role_grants.get(role)
+                if resources is None:
+                    resources = role_grants[role] = {}
+                resources[resource] = resources.get(resource, 0) | 1 << bit(resource, permission)
+
+                permissions = resource_grants.get(resource)
+                if permissions is None:
+                    permissions = resource_grants[resource] = {}
+                holders = permissions.get(permission)
+                if holders is None:
+                    holders = permissions[permission] = set()
+                    permission_grants.setdefault(permission, {})[resource] = holders
+                holders.add(role)
+        finally:
+            self._roles.update(roles)
+            for role in roles:
+                self._changed(role)
         return self
 
+    @_logged()
     def revoke(self, role, resource, permission):
         """ Revoke a permission over a resource from the specified role.
 
@@ -232,9 +1106,34 @@ class Acl(object):
         :type permission: str
         :rtype: Acl
         """
-        self._grants.discard((role, resource, permission))
+        self._remove_grant(role, resource, permission)
+        if self._conditions:
+            self._discard_conditions(role, resource, permission)
+        return self
+
+    @_logged(grants=list)
+    def revoke_many(self, grants):
+        """ Revoke multiple permissions at once
+
+            Input: iterable of (role, resource, permission)
+
+            Grants that do not exist are silently ignored.
+
+        :param grants: Iterable of grants to revoke
+        :type grants: collections.Iterable(tuple(str, str, str))
+        :rtype: Acl
+        :raises ValueError: A grant is not a (role, resource, permission) triple. Nothing is revoked then
+        """
+        remove_grant = self._remove_grant
+        conditions = self._conditions
+        grants = [(role, resource, permission) for role, resource, permission in grants]
+        for role, resource, permission in grants:
+            remove_grant(role, resource, permission)
+            if conditions:
+                self._discard_conditions(role, resource, permission)
         return self
 
+    @_logged()
     def revoke_all(self, role, resource=None):
         """ Revoke all permissions from the specified role [over the specified resource]
 
@@ -244,14 +1143,23 @@ class Acl(object):
         :type resource: str
         :rtype: Acl
         """
-        self._grants = { g for g in self._grants if not (g[0] == role and (resource is None or g[1] == resource)) }
+        if resource is None:
+            self._conditions.pop(role, None)
+        else:
+            self._discard_conditions(role, resource)
+        resources = self._role_grants.get(role, {})
+        if resource is not None:
+            resources = {resource: resources[resource]} if resource in resources else {}
+        for resource, mask in list(resources.items()):
+            for permission in self._decode(resource, mask):
+                self._remove_grant(role, resource, permission)
         return self
 
     #endregion
 
     #region Check
 
-    def check(self, role, resource, permission):
+    def check(self, role, resource, permission, context=None):
         """ Test whether the given role has access to the resource with the specified permission.
 
         :param role: The role to check the access for
@@ -260,11 +1168,20 @@ class Acl(object):
         :type resource: str
         :param permission: The permission to check the access with
         :type permission: str
+        :param context: The context to test the conditional grants against. Default: they do not hold
+        :type context: dict
         :rtype: bool
         """
-        return (role, resource, permission) in self._grants
-
-    def check_any(self, roles, resource, permission):
+        if (role, resource, permission) in self._grants:
+            return True
+        if self._trie or self._expanding:
+            if self._allows(self._grants_of(role), resource, permission):
+                return True
+        elif role in self._parents and self._grants_of(role).get(resource, 0) & self._mask(resource, permission):
+            return True
+        return context is not None and self._conditional(role, resource, permission, context)
+
+    def check_any(self, roles, resource, permission, context=None):
         """ Test whether ANY of the given roles have access to the resource with the specified permission.
 
         :param roles: Roles collection to check the access for
@@ -273,6 +1190,8 @@ class Acl(object):
         :type resource: str
         :param permission: The permission to check the access with
         :type permission: str
+        :param context: The context to test the conditional grants against. Default: they do not hold
+        :type context: dict
         :rtype: bool
         """
         # No roles
@@ -280,9 +1199,18 @@ class Acl(object):
             return False
 
         # Any
-        return any((role, resource, permission) in self._grants for role in roles)
+        if context is not None and self._conditions:
+            return self._check_roles_conditional(roles, resource, permission, context, False)
+        if self._trie or self._expanding:
+            return any(self.check(role, resource, permission) for role in roles)
+        holders = self._holders_of(resource, permission)
+        if holders is None:
+            return False
+        if self._parents:
+            return any(self.check(role, resource, permission) for role in roles)
+        return not holders.isdisjoint(roles)
 
-    def check_all(self, roles, resource, permission):
+    def check_all(self, roles, resource, permission, context=None):
         """ Test whether ALL of the given roles have access to the resource with the specified permission.
 
         :param roles: Roles collection to check the access for
@@ -291,6 +1219,8 @@ class Acl(object):
         :type resource: str
         :param permission: The permission to check the access with
         :type permission: str
+        :param context: The context to test the conditional grants against. Default: they do not hold
+        :type context: dict
         :rtype: bool
         """
         # No roles
@@ -298,7 +1228,45 @@ class Acl(object):
             return False
 
         # all
-        return all((role, resource, permission) in self._grants for role in roles)
+        if context is not None and self._conditions:
+            return self._check_roles_conditional(roles, resource, permission, context, True)
+        if self._trie or self._expanding:
+            return all(self.check(role, resource, permission) for role in roles)
+        holders = self._holders_of(resource, permission)
+        if holders is None:
+            return False
+        if self._parents:
+            return all(self.check(role, resource, permission) for role in roles)
+        return holders.issuperset(roles)
+
+    def check_many(self, roles, resources, permissions, contexts=None):
+        """ Test many (role, resource, permission) triples at once.
+
+            The arguments are parallel sequences: the i-th check is `(roles[i], resources[i], permissions[i])`.
+            Use `itertools.repeat()` to check the same role or permission against many resources.
+
+            This is the fast way to authorize a whole page of objects:
+            a single call replaces a Python-level loop over `check()`.
+            Conditional grants are only tested for the checks that the unconditional ones do not pass,
+            and every condition is tested once per context.
+
+        :param roles: Roles to check the access for
+        :type roles: collections.Iterable(str)
+        :param resources: Resources to check the access for
+        :type resources: collections.Iterable(str)
+        :param permissions: Permissions to check the access with
+        :type permissions: collections.Iterable(str)
+        :param contexts: Contexts to test the conditional grants against, one per check
+        :type contexts: collections.Iterable(dict)
+        :return: List of booleans, one per check
+        :rtype: list(bool)
+        """
+        if contexts is not None and self._conditions:
+            return self._check_many_conditional(roles, resources, permissions, contexts)
+        if self._parents or self._trie or self._expanding:
+            return [self.check(*grant) for grant in zip(roles, resources, permissions)]
+        grants = self._grants
+        return [grant in grants for grant in zip(roles, resources, permissions)]
 
     #endregion
 
@@ -311,7 +1279,7 @@ class Acl(object):
         :type role: str
         :rtype: set(str)
         """
-        return {permission for r, res, permission in self._grants if r == role and res == resource}
+        return self._permissions_in(self._grants_of(role), resource)
 
     def which_permissions_any(self, roles, resource):
         """ List permissions that any of the provided roles have over the resource
@@ -322,10 +1290,17 @@ class Acl(object):
         """
         if not roles:
             return {}
-
-        # Collect permissions per role
-        roles = set(roles)
-        return {permission for r, res, permission in self._grants if r in roles and res == resource}
+        roles = frozenset(roles)
+
+        # Union of the permission bitmasks
+        def union():
+            if self._trie:
+                return set().union(*(self._permissions_in(self._grants_of(role), resource) for role in roles))
+            mask = 0
+            for role in roles:
+                mask |= self._grants_of(role).get(resource, 0)
+            return self._decode(resource, mask) if mask else set()
+        return self._memoize(('which_permissions_any', roles, resource), union, set)
 
     def which_permissions_all(self, roles, resource):
         """ List permissions that all of the provided roles have over the resource
@@ -336,34 +1311,33 @@ class Acl(object):
         """
         if not roles:
             return {}
-        roles = set(roles)
-
-        # Collect permissions per role
-        ppr = {
-            role: set(
-                permission
-                for r, res, permission in self._grants
-                if r == role and res == resource)
-            for role in roles
-        }
-
-        # Intersect them
-        return set.intersection(*ppr.values())
+        roles = frozenset(roles)
+
+        # Intersection of the permission bitmasks
+        def intersection():
+            if self._trie:
+                return set.intersection(*(self._permissions_in(self._grants_of(role), resource) for role in roles))
+            mask = -1
+            for role in roles:
+                mask &= self._grants_of(role).get(resource, 0)
+                if not mask:
+                    return set()
+            return self._decode(resource, mask)
+        return self._memoize(('which_permissions_all', roles, resource), intersection, set)
 
     def which(self, role):
         """ Collect grants that the provided role has
 
             Returns: { resource: set(permission) }
 
+            Wildcard grants are listed as they are: they're not expanded into the resources they cover.
+
         :param role: The role to show the grants for
         :type role: str
         :rtype: dict(set(str))
         """
-        ret = defaultdict(set)
-        for (r, resource, permission) in self._grants:
-            if r == role:
-                ret[resource].add(permission)
-        return dict(ret)
+        return {resource: self._decode(resource, mask)
+                for resource, mask in self._grants_of(role).items()}
 
     def which_any(self, roles):
         """ Collect grants that ANY of the provided roles have
@@ -375,16 +1349,18 @@ class Acl(object):
         :rtype: dict(set(str))
         """
         # No roles
-        roles = set(roles)
+        roles = frozenset(roles)
         if not roles:
             return {}
 
-        # Union
-        ret = defaultdict(set)
-        for (r, resource, permission) in self._grants:
-            if r in roles:
-                ret[resource].add(permission)
-        return dict(ret)
+        # Union of the permission bitmasks
+        def union():
+            masks = defaultdict(int)
+            for role in roles:
+                for resource, mask in self._grants_of(role).items():
+                    masks[resource] |= mask
+            return {resource: self._decode(resource, mask) for resource, mask in masks.items()}
+        return self._memoize(('which_any', roles), union, _copy_grants)
 
     def which_all(self, roles):
         """ Collect grants that ALL of the provided roles have
@@ -396,56 +1372,534 @@ class Acl(object):
         :rtype: dict(set(str))
         """
         # No roles
-        roles = set(roles)
+        roles = frozenset(roles)
         if not roles:
             return {}
 
-        # Collect grants for each role
-        grants = {role: self.which(role) for role in roles}
-
-        # Start with the first one
-        if not grants:
-            return dict()
-        ret = grants.popitem()[1]
+        def intersection():
+            # Start with the first one
+            others = iter(roles)
+            masks = self._grants_of(next(others))
 
-        # Intersect them
-        for role, gs in grants.items():
-            for resource in list(ret.keys()):
-                if resource in gs:
-                    ret[resource] &= gs[resource]
-                else:
-                    del ret[resource]
+            # Intersect the permission bitmasks
+            for role in others:
+                resources = self._grants_of(role)
+                masks = {resource: mask & resources[resource]
+                         for resource, mask in masks.items()
+                         if resource in resources}
 
-        # Finish
-        return dict(ret)
+            # Finish
+            return {resource: self._decode(resource, mask) for resource, mask in masks.items()}
+        return self._memoize(('which_all', roles), intersection, _copy_grants)
 
     def show(self):
         """ Show all current grants
 
             Returns: { role: { resource: set(permission) } }
 
+            Inherited and implied grants are not included.
+
         :rtype: dict(dict(set(str))
         """
-        ret = defaultdict(lambda: defaultdict(set))
-        for (role, resource, permission) in self._grants:
-            ret[role][resource].add(permission)
-        return dict(ret)
+        return {role: {resource: self._decode(resource, mask) for resource, mask in resources.items()}
+                for role, resources in self._role_grants.items()}
+
+    def who(self, resource, permission):
+        """ List roles that have the permission over the resource
+
+            The reverse of `check()`: the roles it passes for, including the ones that inherit the permission,
+            have it implied, or are granted a wildcard resource that covers this one.
+            Conditional grants are not included.
+
+            Served by the resource index: the cost is proportional to the number of roles found.
+
+        :param resource: The resource
+        :type resource: str
+        :param permission: The permission
+        :type permission: str
+        :rtype: set(str)
+        """
+        roles = set()
+        for source in chain((resource,), self._covering(resource)) if self._trie else (resource,):
+            mask = self._implying_mask(source, permission)
+            if mask:
+                roles |= self._holders(source, mask)
+
+        # Children inherit the permission
+        if self._children:
+            stack = list(roles)
+            while stack:
+                for child in self._children.get(stack.pop(), ()):
+                    if child not in roles:
+                        roles.add(child)
+                        stack.append(child)
+        return roles
+
+    def who_any(self, resource, permissions):
+        """ List roles that have ANY of the permissions over the resource
+
+        :param resource: The resource
+        :type resource: str
+        :param permissions: The permissions
+        :type permissions: list(str)
+        :rtype: set(str)
+        """
+        return set().union(*(self.who(resource, permission) for permission in permissions))
+
+    def who_all(self, resource, permissions):
+        """ List roles that have ALL of the permissions over the resource
+
+        :param resource: The resource
+        :type resource: str
+        :param permissions: The permissions
+        :type permissions: list(str)
+        :rtype: set(str)
+        """
+        permissions = list(permissions)
+        if not permissions:
+            return set()
+        roles = self.who(resource, permissions[0])
+        for permission in permissions[1:]:
+            if not roles:
+                break
+            roles &= self.who(resource, permission)
+        return roles
+
+    def resources_with(self, permission):
+        """ List resources that any role has the permission over
+
+            Like `which()`, wildcard resources are listed as they are, and conditional grants are not included.
+
+            Served by the permission index: the cost is proportional to the number of resources found.
+
+        :param permission: The permission
+        :type permission: str
+        :rtype: set(str)
+        """
+        resources = set(self._permission_grants.get(permission, _EMPTY))
+        if self._expanding:
+            for implying in self._implying(permission):
+                for resource in self._permission_grants.get(implying, _EMPTY):
+                    if resource in resources:
+                        continue
+                    if self._implying_mask(resource, permission) & self._mask(resource, implying):
+                        resources.add(resource)
+        return resources
+
+    #endregion
+
+    #region Iterate & View
+
+    def _iter_masks(self, roles, resource, permission):
+        """ Iterate over the grants of (role, { resource: mask }) pairs [on a resource] [with a permission]
+
+        :rtype: collections.Iterator(tuple)
+        """
+        for role, resources in roles:
+            for res, mask in resources.items() if resource is None else ((resource, resources.get(resource, 0)),):
+                if not mask:
+                    continue
+                if permission is None:
+                    for perm in self._iter_mask(res, mask):
+                        yield role, res, perm
+                elif mask & self._mask(res, permission):
+                    yield role, res, permission
+
+    def _iter_holders(self, resource, permission):
+        """ Iterate over the grants on a resource, or with a permission, or both, from the indexes
+
+        :rtype: collections.Iterator(tuple)
+        """
+        if resource is not None:
+            holders = self._resource_grants.get(resource, _EMPTY)
+            for perm, roles in holders.items() if permission is None else ((permission, holders.get(permission, ())),):
+                for role in roles:
+                    yield role, resource, perm
+        else:
+            for res, roles in self._permission_grants.get(permission, _EMPTY).items():
+                for role in roles:
+                    yield role, res, permission
+
+    def iter_grants(self, role=None, resource=None, permission=None):
+        """ Iterate over the grants [of a role] [on a resource] [with a permission]
+
+            The streaming variant of `show()`: yields (role, resource, permission) tuples one at a time,
+            picking the index that matches the filters. Inherited and implied grants are not included.
+            Do not modify the Acl while iterating.
+
+        :param role: Only the grants of this role
+        :type role: str
+        :param resource: Only the grants on this resource
+        :type resource: str
+        :param permission: Only the grants with this permission
+        :type permission: str
+        :rtype: collections.Iterator(tuple(str, str, str))
+        """
+        if role is None and (resource is not None or permission is not None):
+            return self._iter_holders(resource, permission)
+        roles = self._role_grants.items() if role is None else ((role, self._role_grants.get(role, _EMPTY)),)
+        return self._iter_masks(roles, resource, permission)
+
+    def iter_which(self, role):
+        """ Iterate over the grants that the provided role has
+
+            The streaming variant of `which()`: yields (resource, permission) tuples one at a time.
+            Do not modify the Acl while iterating.
+
+        :param role: The role to iterate the grants of
+        :type role: str
+        :rtype: collections.Iterator(tuple(str, str))
+        """
+        for resource, mask in self._grants_of(role).items():
+            for permission in self._iter_mask(resource, mask):
+                yield resource, permission
+
+    def view_roles(self):
+        """ Get a read-only view of the set of roles
+
+            Unlike `get_roles()`, nothing is copied: the view follows the changes of the Acl.
+
+        :rtype: collections.Set
+        """
+        return SetView(self._roles)
+
+    def view_structure(self):
+        """ Get a read-only view of the structure: { resource: set(permission) }
+
+            Unlike `get()`, nothing is copied: the view follows the changes of the Acl.
+
+        :rtype: collections.Mapping
+        """
+        return MappingView(self._structure, lambda resource, permissions: SetView(permissions))
+
+    def view_grants(self):
+        """ Get a read-only view of all grants: { role: { resource: set(permission) } }
+
+            Unlike `show()`, nothing is copied, and permissions are only decoded when iterated.
+            Inherited and implied grants are not included.
+            The sets of permissions are snapshots, but the mappings follow the changes of the Acl.
+
+        :rtype: collections.Mapping
+        """
+        def permissions(resource, mask):
+            return MaskView(self._bits[resource], self._perms[resource], mask)
+        return MappingView(self._role_grants, lambda role, masks: MappingView(masks, permissions))
+
+    #endregion
+
+    #region Changes
+
+    def _start_changelog(self, changelog):
+        """ Start recording the changes, see `__init__()` """
+        self._changelog = deque(maxlen=None if changelog is True else changelog)
+
+        # Recording wrappers are only installed here, so that Acls without a changelog do not pay for them
+        for name, converters in _LOGGED.items():
+            setattr(self, name, _recorder(self, name, converters))
+
+    def get_version(self):
+        """ Get the version of the Acl: the number of the last change recorded in the changelog,
+            or applied with `apply_changes()`
+
+        :rtype: int
+        """
+        return self._version
+
+    def changes_since(self, version):
+        """ Get the changes made after the given version
+
+            Returns a list of (version, method name, arguments), which can be pickled and sent to replicas:
+
+                replica.apply_changes(acl.changes_since(replica.get_version()))
+
+        :param version: Version of the replica
+        :type version: int
+        :rtype: list(tuple(int, str, dict))
+        :raises ValueError: The changelog is disabled, or does not have these changes anymore:
+            the replica has to load a fresh copy with `dumps()`
+        """
+        changelog = self._changelog
+        if changelog is None:
+            raise ValueError('The changelog is disabled')
+        if version >= self._version:
+            return []
+        if not changelog or changelog[0][0] > version + 1:
+            raise ValueError('Changes since version {} are not in the changelog anymore'.format(version))
+        return list(islice(changelog, version + 1 - changelog[0][0], None))
+
+    def apply_changes(self, changes):
+        """ Apply the changes made to another Acl, as returned by its `changes_since()`
+
+            Changes up to the current version are skipped, so applying the same changes twice is harmless.
+            The version of the Acl becomes the version of the last change.
+
+        :param changes: Changes to apply
+        :type changes: list(tuple(int, str, dict))
+        :rtype: Acl
+        :raises ValueError: Some changes are missing, or unknown
+        """
+        for version, name, kwargs in changes:
+            if version <= self._version:
+                continue
+            if version != self._version + 1:
+                raise ValueError('Missing changes: the Acl is at version {}, got version {}'.format(self._version, version))
+            if name not in _LOGGED:
+                raise ValueError('Unknown change: {!r}'.format(name))
+            getattr(self, name)(**kwargs)
+            self._version = version
+        return self
+
+    #endregion
+
+    #region Instrumentation & Audit
+
+    def instrument(self, metrics=None):
+        """ Start collecting metrics of the calls: counts, latency histograms, and slow calls
+
+            Timing wrappers are bound over the methods of this Acl, until `uninstrument()`:
+            Acls that are not instrumented pay nothing.
+
+        :param metrics: The metrics to collect into. Default: new `Metrics`
+        :type metrics: miracle.Metrics
+        :rtype: miracle.Metrics
+        :raises ValueError: The Acl is already instrumented
+        """
+        if self._metrics is not None:
+            raise ValueError('The Acl is already instrumented')
+        return (Metrics() if metrics is None else metrics).attach(self)
+
+    def uninstrument(self):
+        """ Stop collecting metrics: the methods are restored
+
+        :rtype: Acl
+        """
+        if self._metrics is not None:
+            self._metrics.detach()
+        return self
+
+    def audit(self, log):
+        """ Start recording the decisions of the checks into a log, until `unaudit()`
+
+            Only this Acl's check methods are wrapped: Acls that are not audited pay nothing.
+
+        :param log: The log
+        :type log: miracle.DecisionLog
+        :rtype: miracle.DecisionLog
+        :raises ValueError: The Acl is already audited
+        """
+        if self._decisions is not None:
+            raise ValueError('The Acl is already audited')
+        return log.attach(self)
+
+    def unaudit(self):
+        """ Stop recording the decisions: the check methods are restored
+
+        :rtype: Acl
+        """
+        if self._decisions is not None:
+            self._decisions.detach()
+        return self
+
+    def _cardinality(self):
+        """ Count the roles, resources and grants, for the gauges of `Metrics`
+
+        :rtype: tuple(int, int, int)
+        """
+        return len(self._roles), len(self._structure), len(self._grants)
 
     #endregion
 
     #region Export & Import
 
+    def freeze(self):
+        """ Get an immutable snapshot of the Acl
+
+            The snapshot has all the read methods with faster checks, and is safe to share between threads.
+            Changes made to the Acl later are not reflected in the snapshot.
+
+        :rtype: miracle.frozen.FrozenAcl
+        """
+        from .frozen import FrozenAcl
+        return FrozenAcl(self)
+
     def __getstate__(self):
-        return {
+        state = {
             'roles': self.get_roles(),
             'struct': self.get(),
             'grants': self.show()
         }
+        if self._parents:
+            state['parents'] = {role: set(parents) for role, parents in self._parents.items()}
+        if self._version:
+            state['version'] = self._version
+        if self._separator is not None:
+            state['separator'] = self._separator
+        if self._implied:
+            state['implied'] = {permission: set(implied) for permission, implied in self._implied.items()}
+        if self._conditions:
+            state['conditions'] = {
+                role: {resource: {permission: condition.source for permission, condition in permissions.items()}
+                       for resource, permissions in resources.items()}
+                for role, resources in self._conditions.items()
+            }
+        return state
 
     def __setstate__(self, state):
+        self._separator = state.get('separator', self._separator)
         self.add_roles(state['roles'])
+        for permission, implied in state.get('implied', {}).items():
+            self.add_implied(permission, implied)
+        for role, parents in state.get('parents', {}).items():
+            self.add_role(role, parents)
         self.add(state['struct'])
         self.grants(state['grants'])
+        for role, resources in state.get('conditions', {}).items():
+            for resource, permissions in resources.items():
+                for permission, condition in permissions.items():
+                    self.grant(role, resource, permission, condition)
+        self._version = state.get('version', 0)
         return self
 
+    def __reduce__(self):
+        # Pickle with the binary format: it's much faster
+        changelog = self._changelog is not None and (self._changelog.maxlen or True)
+        return _unpickle, (self.__class__, self.dumps(), self._cache_size, changelog)
+
+    def dumps(self):
+        """ Export the Acl into a compact binary string
+
+            Roles and resources are stored once, in tables, and the grants are packed into integer arrays
+            of (role, resource, permissions bitmask). Loading it back does not replay any method calls.
+
+        :rtype: bytes
+        """
+        with _gc_paused():
+            return self._dumps()
+
+    def _dumps(self):
+        roles = list(self._roles)
+        role_ids = {role: i for i, role in enumerate(roles)}
+        resources = list(self._structure)
+        resource_ids = {resource: i for i, resource in enumerate(resources)}
+
+        # Grants: columns of (role id, resource id, mask)
+        role_column, resource_column, masks = array('I'), array('I'), []
+        for role, grants in self._role_grants.items():
+            role_id = role_ids[role]
+            for resource, mask in grants.items():
+                role_column.append(role_id)
+                resource_column.append(resource_ids[resource])
+                masks.append(mask)
+        try:
+            mask_column = array('L', masks)
+        except OverflowError:
+            mask_column = masks  # a resource has too many permissions for a machine word
+
+        return pickle.dumps((
+            DUMP_FORMAT,
+            roles,
+            resources,
+            [list(self._structure[resource]) for resource in resources],
+            [list(self._perms.get(resource, ())) for resource in resources],
+            [(role_ids[role], [role_ids[parent] for parent in parents]) for role, parents in self._parents.items()],
+            role_column, resource_column, mask_column,
+            self._version, self._separator,
+            [(permission, list(implied)) for permission, implied in self._implied.items()],
+            [(role_ids[role], resource_ids[resource], permission, condition.source)
+             for role, resources in self._conditions.items()
+             for resource, permissions in resources.items()
+             for permission, condition in permissions.items()],
+        ), pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def loads(cls, data):
+        """ Load an Acl from the binary string made by `dumps()`
+
+        :param data: The result of `dumps()`
+        :type data: bytes
+        :rtype: Acl
+        :raises ValueError: Unsupported format
+        """
+        with _gc_paused():
+            return cls._loads(data)
+
+    @classmethod
+    def _loads(cls, data):
+        state = pickle.loads(data)
+        if state[0] != DUMP_FORMAT:
+            raise ValueError('Unsupported Acl dump format: {!r}'.format(state[0]))
+        _, roles, resources, structure, perms, parents, role_column, resource_column, mask_column, version, separator, implied, conditions = state
+
+        acl = cls(separator=separator)
+        acl._roles.update(roles)
+        for resource, permissions, bits in zip(resources, structure, perms):
+            acl._structure[resource] = set(permissions)
+            if bits:
+                acl._perms[resource] = bits
+                acl._bits[resource] = {permission: bit for bit, permission in enumerate(bits) if permission is not None}
+                acl._trie_add(resource)
+                if '*' in acl._bits[resource]:
+                    acl._expanding = True
+        for permission, permissions in implied:
+            acl._implied[permission] = set(permissions)
+            acl._expanding = True
+        for role, role_parents in parents:
+            acl.add_role(roles[role], [roles[parent] for parent in role_parents])
+        acl._load_masks(
+            (roles[role], resources[resource], mask)
+            for role, resource, mask in zip(role_column, resource_column, mask_column)
+        )
+        for role, resource, permission, condition in conditions:
+            acl._conditions.setdefault(roles[role], {}).setdefault(resources[resource], {})[permission] = Condition(condition)
+        acl._version = version
+        return acl
+
+    def dump(self, file):
+        """ Export the Acl into a binary file. See `dumps()`
+
+        :param file: File object, opened for writing in binary mode
+        """
+        file.write(self.dumps())
+
+    @classmethod
+    def load(cls, file):
+        """ Load an Acl from a binary file made by `dump()`
+
+        :param file: File object, opened for reading in binary mode
+        :rtype: Acl
+        """
+        return cls.loads(file.read())
+
+    def _load_masks(self, masks):
+        """ Load grants into the empty Acl
+
+            Bit positions must already be defined.
+
+        :param masks: Iterable of (role, resource, mask)
+        """
+        grants = self._grants
+        role_grants = self._role_grants
+        resource_grants = self._resource_grants
+        perms = self._perms
+
+        for role, resource, mask in masks:
+            resources = role_grants.get(role)
+            if resources is None:
+                resources = role_grants[role] = {}
+            resources[resource] = mask
+
+            names = perms[resource]
+            holders = resource_grants.get(resource)
+            if holders is None:
+                holders = resource_grants[resource] = {}
+            for bit in range(mask.bit_length()):
+                if mask >> bit & 1:
+                    permission = names[bit]
+                    grants.add((role, resource, permission))
+                    roles = holders.get(permission)
+                    if roles is None:
+                        roles = self._holders_set(resource, permission)
+                    roles.add(role)
+        self._changed()
+
     #endregion
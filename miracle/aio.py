@@ -0,0 +1,316 @@
+""" Acl for asyncio. Python 3.5+ only: import it explicitly. """
+
+import asyncio
+import time
+from collections import OrderedDict
+from functools import partial
+
+from .storage import Storage, MemoryStorage
+
+
+class AsyncStorage(object):
+    """ Async storage of Acl data
+
+        Same methods as `miracle.storage.Storage`, but coroutines.
+        Blocking storages are adapted with `ExecutorStorage`.
+    """
+
+    async def get_roles(self):
+        raise NotImplementedError()
+
+    async def get_structure(self):
+        raise NotImplementedError()
+
+    async def get_grants(self, role):
+        raise NotImplementedError()
+
+    async def add_roles(self, roles):
+        raise NotImplementedError()
+
+    async def add(self, structure):
+        raise NotImplementedError()
+
+    async def grant_many(self, grants):
+        raise NotImplementedError()
+
+    async def revoke_many(self, grants):
+        raise NotImplementedError()
+
+
+def _blocking(name):
+    """ Make a coroutine that runs a method of the blocking storage in the executor """
+    async def method(self, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, getattr(self._storage, name), *args)
+    method.__name__ = name
+    method.__doc__ = getattr(Storage, name).__doc__
+    return method
+
+
+class ExecutorStorage(AsyncStorage):
+    """ Async adapter of a blocking `Storage`: its methods run in an executor """
+
+    def __init__(self, storage, executor=None):
+        """ Adapt a blocking storage
+
+        :param storage: The storage
+        :type storage: miracle.storage.Storage
+        :param executor: The executor to run the methods in. Default: the default executor of the loop
+        :type executor: concurrent.futures.Executor
+        """
+        self._storage = storage
+        self._executor = executor
+
+    get_roles = _blocking('get_roles')
+    get_structure = _blocking('get_structure')
+    get_grants = _blocking('get_grants')
+    add_roles = _blocking('add_roles')
+    add = _blocking('add')
+    grant_many = _blocking('grant_many')
+    revoke_many = _blocking('revoke_many')
+
+
+class AsyncAcl(object):
+    """ Acl for asyncio, backed by a storage
+
+        All methods are coroutines: `await acl.check(...)`.
+
+        The grants of a role are loaded from the storage when the role is first checked,
+        and kept in a local LRU cache for `ttl` seconds: only the roles in use are held in memory.
+        Concurrent lookups of the same role wait for a single query.
+
+        Writes go straight to the storage, and drop the roles they change from the cache.
+        Changes made by other processes are seen when the cache expires, or after `invalidate()`.
+
+        Role inheritance, hierarchical resources, implied permissions and conditional grants are not supported.
+    """
+
+    def __init__(self, storage=None, ttl=60, cache_size=1000):
+        """ Create an async Acl
+
+        :param storage: The storage. Blocking storages are run in the default executor.
+            Default: a new `MemoryStorage`
+        :type storage: AsyncStorage|miracle.storage.Storage
+        :param ttl: Number of seconds to cache the grants of a role for
+        :type ttl: float
+        :param cache_size: Number of roles to cache
+        :type cache_size: int
+        """
+        if storage is None:
+            storage = MemoryStorage()
+        if isinstance(storage, Storage):
+            storage = ExecutorStorage(storage)
+        self._storage = storage
+        self._ttl = ttl
+        self._cache_size = cache_size
+
+        #: Cached grants: LRU { role: (expiration time, { resource: set(permission) }) }
+        self._cache = OrderedDict()
+
+        #: Lookups in progress: { role: Future }
+        self._loading = {}
+
+    #region Cache
+
+    async def _grants(self, role):
+        """ Get the grants of a role: from the cache, or from the storage
+
+        :rtype: dict
+        """
+        entry = self._cache.get(role)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._cache.move_to_end(role)
+                return entry[1]
+            del self._cache[role]
+
+        future = self._loading.get(role)
+        if future is None:
+            future = self._loading[role] = asyncio.ensure_future(self._storage.get_grants(role))
+            future.add_done_callback(partial(self._loaded, role))
+        # A cancelled caller does not cancel the lookup: others may be waiting for it
+        return await asyncio.shield(future)
+
+    def _loaded(self, role, future):
+        """ Cache the grants of a role once loaded, unless they were changed in the meantime """
+        if self._loading.get(role) is not future:
+            return
+        del self._loading[role]
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._cache[role] = (time.monotonic() + self._ttl, future.result())
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)  # least recently used
+
+    def invalidate(self, roles=None):
+        """ Drop cached grants [of some roles], so that they're loaded from the storage again
+
+        :param roles: The roles to drop. Default: all
+        :type roles: collections.Iterable
+        """
+        if roles is None:
+            self._cache.clear()
+            self._loading.clear()
+        else:
+            for role in roles:
+                self._cache.pop(role, None)
+                self._loading.pop(role, None)
+
+    #endregion
+
+    #region Write
+
+    async def add_roles(self, roles):
+        """ Define multiple roles
+
+        :type roles: list(str)
+        :rtype: AsyncAcl
+        """
+        await self._storage.add_roles(list(roles))
+        return self
+
+    async def add(self, structure):
+        """ Define the whole structure of resources and permissions
+
+        :param structure: A dict {resource: [permissions]}
+        :type structure: dict(list(str))
+        :rtype: AsyncAcl
+        """
+        await self._storage.add(structure)
+        return self
+
+    async def grant(self, role, resource, permission):
+        """ Grant a permission over resource to the role
+
+        :rtype: AsyncAcl
+        """
+        return await self.grant_many([(role, resource, permission)])
+
+    async def grant_many(self, grants):
+        """ Grant multiple permissions at once
+
+        :param grants: Iterable of (role, resource, permission)
+        :type grants: collections.Iterable(tuple(str, str, str))
+        :rtype: AsyncAcl
+        """
+        grants = list(grants)
+        await self._storage.grant_many(grants)
+        self.invalidate({role for role, resource, permission in grants})
+        return self
+
+    async def revoke(self, role, resource, permission):
+        """ Revoke a permission over a resource from the role
+
+        :rtype: AsyncAcl
+        """
+        return await self.revoke_many([(role, resource, permission)])
+
+    async def revoke_many(self, grants):
+        """ Revoke multiple permissions at once
+
+        :param grants: Iterable of (role, resource, permission)
+        :type grants: collections.Iterable(tuple(str, str, str))
+        :rtype: AsyncAcl
+        """
+        grants = list(grants)
+        await self._storage.revoke_many(grants)
+        self.invalidate({role for role, resource, permission in grants})
+        return self
+
+    #endregion
+
+    #region Get
+
+    async def get_roles(self):
+        """ Get the set of roles
+
+        :rtype: set(str)
+        """
+        return await self._storage.get_roles()
+
+    async def get_resources(self):
+        """ Get the set of resources
+
+        :rtype: set(str)
+        """
+        return set(await self._storage.get_structure())
+
+    async def get_permissions(self, resource):
+        """ Get the set of permissions on a resource
+
+        :rtype: set(str)
+        """
+        return (await self._storage.get_structure()).get(resource, set())
+
+    async def get(self):
+        """ Get the whole structure of resources and permissions: { resource: set(permission) }
+
+        :rtype: dict(set(str))
+        """
+        return await self._storage.get_structure()
+
+    #endregion
+
+    #region Check
+
+    async def check(self, role, resource, permission):
+        """ Test whether the given role has access to the resource with the specified permission
+
+        :rtype: bool
+        """
+        return permission in (await self._grants(role)).get(resource, ())
+
+    async def check_any(self, roles, resource, permission):
+        """ Test whether ANY of the given roles have access to the resource with the specified permission
+
+        :rtype: bool
+        """
+        roles = set(roles)
+        if not roles:
+            return False
+        grants = await asyncio.gather(*[self._grants(role) for role in roles])
+        return any(permission in resources.get(resource, ()) for resources in grants)
+
+    async def check_all(self, roles, resource, permission):
+        """ Test whether ALL of the given roles have access to the resource with the specified permission
+
+        :rtype: bool
+        """
+        roles = set(roles)
+        if not roles:
+            return False
+        grants = await asyncio.gather(*[self._grants(role) for role in roles])
+        return all(permission in resources.get(resource, ()) for resources in grants)
+
+    async def check_many(self, roles, resources, permissions):
+        """ Test many (role, resource, permission) triples at once
+
+            The grants of all the roles are loaded concurrently.
+
+        :return: List of booleans, one per check
+        :rtype: list(bool)
+        """
+        checks = list(zip(roles, resources, permissions))
+        roles = list({role for role, resource, permission in checks})
+        grants = dict(zip(roles, await asyncio.gather(*[self._grants(role) for role in roles])))
+        return [permission in grants[role].get(resource, ()) for role, resource, permission in checks]
+
+    #endregion
+
+    #region Show Grants
+
+    async def which_permissions(self, role, resource):
+        """ List permissions that the provided role has over the resource
+
+        :rtype: set(str)
+        """
+        return set((await self._grants(role)).get(resource, ()))
+
+    async def which(self, role):
+        """ Collect grants that the provided role has: { resource: set(permission) }
+
+        :rtype: dict(set(str))
+        """
+        return {resource: set(permissions) for resource, permissions in (await self._grants(role)).items()}
+
+    #endregion
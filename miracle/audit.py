@@ -0,0 +1,314 @@
+import json
+import os
+import pickle
+import random
+import struct
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from .bindings import bind, unbind
+
+#: Binary format: batches of records, each a length and a pickled list of tuples
+_BATCH = struct.Struct('<I')
+
+#: Fields of a decision
+_FIELDS = ('time', 'method', 'roles', 'resource', 'permission', 'allowed')
+
+
+def _encode_json(batch):
+    """ Encode a batch of decisions as JSON lines
+
+    :rtype: bytes
+    """
+    return ''.join(json.dumps(dict(zip(_FIELDS, record)), default=repr) + '\n' for record in batch).encode('utf-8')
+
+
+def _encode_binary(batch):
+    """ Encode a batch of decisions in the binary format
+
+    :rtype: bytes
+    """
+    data = pickle.dumps(batch, pickle.HIGHEST_PROTOCOL)
+    return _BATCH.pack(len(data)) + data
+
+
+def _read_json(path):
+    """ Read decisions from JSON lines """
+    with open(path, 'rb') as f:
+        for line in f:
+            yield json.loads(line.decode('utf-8'))
+
+
+def _read_binary(path):
+    """ Read decisions from batches in the binary format """
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(_BATCH.size)
+            if len(header) < _BATCH.size:
+                return
+            for record in pickle.loads(f.read(_BATCH.unpack(header)[0])):
+                yield dict(zip(_FIELDS, record))
+
+
+#: Formats: { name: encode(batch) }
+_FORMATS = {
+    'json': _encode_json,
+    'binary': _encode_binary,
+}
+
+
+class DecisionLog(object):
+    """ Log of the decisions of check(), check_any(), check_all() and check_many(), written in the background
+
+        Attach it to an Acl with `acl.audit(log)`: decisions are sampled, then pushed to a bounded buffer,
+        and a background thread writes them to the file in batches. Checks never wait for the disk:
+        when the buffer is full, decisions are dropped, and counted.
+
+        The buffer is a deque: appending and popping are atomic, so neither checks nor the writer take a lock.
+    """
+
+    def __init__(self, path, format='json', allowed_rate=0.0, denied_rate=1.0,
+                 capacity=65536, batch_size=4096, interval=1.0, max_bytes=0, backups=5):
+        """ Open the log, and start the writer
+
+        :param path: Path of the log file. Decisions are appended.
+        :type path: str
+        :param format: 'json' for JSON lines, or 'binary' for batches of pickled tuples: see `read()`
+        :type format: str
+        :param allowed_rate: Ratio of the allowed decisions to record, between 0 and 1
+        :type allowed_rate: float
+        :param denied_rate: Ratio of the denied decisions to record, between 0 and 1
+        :type denied_rate: float
+        :param capacity: Number of decisions the buffer holds. Decisions are dropped when it's full.
+        :type capacity: int
+        :param batch_size: Number of decisions written at once
+        :type batch_size: int
+        :param interval: Number of seconds between writes. A buffer half full is written at once.
+        :type interval: float
+        :param max_bytes: Size of the file to rotate it at, or 0 to never rotate
+        :type max_bytes: int
+        :param backups: Number of rotated files to keep: path.1 ... path.N
+        :type backups: int
+        :raises ValueError: Unknown format
+        """
+        if format not in _FORMATS:
+            raise ValueError('Unknown format: {!r}'.format(format))
+        self._path = path
+        self._format = format
+        self._encode = _FORMATS[format]
+        self._allowed_rate = allowed_rate
+        self._denied_rate = denied_rate
+        self._capacity = capacity
+        self._batch_size = batch_size
+        self._interval = interval
+        self._max_bytes = max_bytes
+        self._backups = backups
+
+        #: Decisions waiting to be written: (time, method, roles, resource, permission, allowed)
+        self._buffer = deque()
+
+        #: Number of decisions written, and dropped
+        self._written = 0
+        self._dropped = 0
+
+        #: The Acl, and the bindings of the wrappers
+        self._acl = None
+        self._bindings = []
+
+        #: Per-thread: whether a check is being recorded. Nested checks are not
+        self._local = threading.local()
+
+        self._file = open(path, 'ab')
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='miracle-decision-log')
+        self._thread.daemon = True
+        self._thread.start()
+
+    #region Record
+
+    def record(self, method, roles, resource, permission, allowed):
+        """ Record a decision, if it's sampled. Never blocks.
+
+        :param method: Name of the check method
+        :type method: str
+        :param roles: The roles checked
+        :type roles: list
+        :param allowed: The decision
+        :type allowed: bool
+        """
+        rate = self._allowed_rate if allowed else self._denied_rate
+        if rate < 1.0 and (rate <= 0.0 or random.random() >= rate):
+            return
+        buffer = self._buffer
+        if len(buffer) >= self._capacity:
+            self._dropped += 1
+            return
+        buffer.append((time.time(), method, roles, resource, permission, allowed))
+        if len(buffer) * 2 >= self._capacity:
+            self._wakeup.set()
+
+    def _wrap(self, name, method):
+        """ Wrap a check method to record its decisions. Only the outermost calls are recorded. """
+        local = self._local
+        record = self.record
+
+        def call(*args, **kwargs):
+            local.checking = True
+            try:
+                return method(*args, **kwargs)
+            finally:
+                local.checking = False
+
+        if name == 'check':
+            @wraps(method)
+            def wrapper(role, resource, permission, *args, **kwargs):
+                if getattr(local, 'checking', False):
+                    return method(role, resource, permission, *args, **kwargs)
+                allowed = call(role, resource, permission, *args, **kwargs)
+                record(name, [role], resource, permission, allowed)
+                return allowed
+        elif name == 'check_many':
+            @wraps(method)
+            def wrapper(roles, resources, permissions, *args, **kwargs):
+                if getattr(local, 'checking', False):
+                    return method(roles, resources, permissions, *args, **kwargs)
+                checks = list(zip(roles, resources, permissions))  # the arguments may be iterators
+                ret = call([check[0] for check in checks], [check[1] for check in checks],
+                           [check[2] for check in checks], *args, **kwargs)
+                for (role, resource, permission), allowed in zip(checks, ret):
+                    record(name, [role], resource, permission, allowed)
+                return ret
+        else:
+            @wraps(method)
+            def wrapper(roles, resource, permission, *args, **kwargs):
+                if getattr(local, 'checking', False):
+                    return method(roles, resource, permission, *args, **kwargs)
+                roles = list(roles)
+                allowed = call(roles, resource, permission, *args, **kwargs)
+                record(name, roles, resource, permission, allowed)
+                return allowed
+        return wrapper
+
+    def attach(self, acl):
+        """ Start recording the decisions of an Acl
+
+        :param acl: The Acl: any object with check(), check_any(), check_all() or check_many()
+        :type acl: miracle.Acl
+        :rtype: DecisionLog
+        :raises ValueError: Already attached to an Acl
+        """
+        if self._acl is not None:
+            raise ValueError('The decision log is already attached to an Acl')
+        names = [name for name in ('check', 'check_any', 'check_all', 'check_many') if hasattr(acl, name)]
+        self._bindings = bind(acl, names, self._wrap)
+        self._acl = acl
+        acl._decisions = self
+        return self
+
+    def detach(self):
+        """ Stop recording the decisions of the Acl: its methods are restored as they were
+
+        :rtype: DecisionLog
+        :raises ValueError: Other wrappers were bound over the methods since, like `Metrics`: detach them first
+        """
+        acl = self._acl
+        if acl is None:
+            return self
+        unbind(acl, self._bindings)
+        self._bindings = []
+        acl._decisions = None
+        self._acl = None
+        return self
+
+    #endregion
+
+    #region Write
+
+    def _run(self):
+        """ Writer thread """
+        while not self._closed:
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _rotate(self):
+        """ Rotate the files: path -> path.1 -> ... -> path.N """
+        self._file.close()
+        if self._backups:
+            for i in range(self._backups - 1, 0, -1):
+                source = '{}.{}'.format(self._path, i)
+                if os.path.exists(source):
+                    os.rename(source, '{}.{}'.format(self._path, i + 1))
+            os.rename(self._path, self._path + '.1')
+            self._file = open(self._path, 'ab')
+        else:
+            self._file = open(self._path, 'wb')
+
+    def flush(self):
+        """ Write the buffered decisions now
+
+        :rtype: DecisionLog
+        """
+        buffer = self._buffer
+        with self._write_lock:
+            while buffer:
+                batch = []
+                while buffer and len(batch) < self._batch_size:
+                    batch.append(buffer.popleft())
+                try:
+                    data = self._encode(batch)
+                    if self._max_bytes and self._file.tell() and self._file.tell() + len(data) > self._max_bytes:
+                        self._rotate()
+                    self._file.write(data)
+                    self._file.flush()
+                except (IOError, OSError, ValueError):
+                    self._dropped += len(batch)  # the disk must not break the checks
+                else:
+                    self._written += len(batch)
+        return self
+
+    def close(self):
+        """ Detach, write the remaining decisions, and close the file """
+        self.detach()
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_stats(self):
+        """ Count the decisions: { 'written': n, 'dropped': n, 'pending': n }
+
+            Dropped decisions are the ones that did not fit into the buffer, or failed to be written.
+
+        :rtype: dict(str, int)
+        """
+        return {'written': self._written, 'dropped': self._dropped, 'pending': len(self._buffer)}
+
+    #endregion
+
+    @staticmethod
+    def read(path, format='json'):
+        """ Read the decisions from a log file
+
+        :param path: Path of the log file
+        :type path: str
+        :param format: Format of the file: 'json' or 'binary'
+        :type format: str
+        :return: Iterator of { 'time', 'method', 'roles', 'resource', 'permission', 'allowed' }
+        :rtype: collections.Iterator(dict)
+        :raises ValueError: Unknown format
+        """
+        if format not in _FORMATS:
+            raise ValueError('Unknown format: {!r}'.format(format))
+        return _read_json(path) if format == 'json' else _read_binary(path)
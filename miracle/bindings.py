@@ -0,0 +1,38 @@
+#: Marks a method that was not bound on the instance
+_MISSING = object()
+
+
+def bind(obj, names, wrap):
+    """ Bind wrappers over methods of an object, on the instance only: `obj.name = wrap(name, obj.name)`
+
+        Wrappers stack: methods already bound on the instance, like the changelog's, are wrapped in turn.
+
+    :param names: Names of the methods
+    :type names: collections.Iterable(str)
+    :param wrap: Make the wrapper of a method: wrap(name, method)
+    :type wrap: callable
+    :return: The bindings, for `unbind()`
+    :rtype: list(tuple)
+    """
+    bindings = []
+    for name in names:
+        wrapper = wrap(name, getattr(obj, name))
+        bindings.append((name, vars(obj).get(name, _MISSING), wrapper))
+        setattr(obj, name, wrapper)
+    return bindings
+
+
+def unbind(obj, bindings):
+    """ Restore the methods of an object as they were before `bind()`
+
+    :param bindings: The result of `bind()`
+    :type bindings: list(tuple)
+    :raises ValueError: Other wrappers were bound over these since: unbind them first
+    """
+    if any(vars(obj).get(name) is not wrapper for name, original, wrapper in bindings):
+        raise ValueError('Methods were wrapped again since: unbind the last wrappers first')
+    for name, original, wrapper in bindings:
+        if original is _MISSING:
+            delattr(obj, name)
+        else:
+            setattr(obj, name, original)
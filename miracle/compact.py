@@ -0,0 +1,250 @@
+from .acl import Acl
+
+
+class CompactAcl(Acl):
+    """ Memory-efficient Acl
+
+        Behaves exactly like `Acl`, but does not keep a `(role, resource, permission)` tuple per grant.
+        Instead, grants only live in the bitmask indexes: like in `Acl`, each (role, resource) pair
+        keeps its granted permissions as a single integer bitmask.
+
+        The price is a slightly slower `check()`: it performs a few dict lookups instead of a single set probe.
+    """
+
+    def __init__(self, cache_size=0, changelog=False, separator=None):
+        super(CompactAcl, self).__init__(cache_size, changelog, separator)
+
+        # Not used: grants are kept as bitmasks in the indexes
+        del self._grants
+
+        #: Grants index by resource: { resource: { role: mask } }
+        self._resource_grants = {}
+
+        # Not used: `resources_with()` scans the resource index instead
+        del self._permission_grants
+
+    #region Delete
+
+    def clear(self):
+        self._roles.clear()
+        self._structure.clear()
+        self._role_grants.clear()
+        self._resource_grants.clear()
+        self._bits.clear()
+        self._perms.clear()
+        self._trie.clear()
+        self._implied.clear()
+        self._expanding = False
+        self._conditions.clear()
+        self._parents.clear()
+        self._children.clear()
+        self._changed()
+        return self
+
+    def del_role(self, role):
+        self._roles.discard(role)
+        self._unlink_role(role)
+        self._conditions.pop(role, None)
+        for resource in self._role_grants.pop(role, {}):
+            holders = self._resource_grants[resource]
+            del holders[role]
+            if not holders:
+                del self._resource_grants[resource]
+        return self
+
+    def del_resource(self, resource):
+        if resource in self._structure:
+            del self._structure[resource]
+        for role in self._resource_grants.pop(resource, {}):
+            resources = self._role_grants[role]
+            del resources[resource]
+            if not resources:
+                del self._role_grants[role]
+        for role in list(self._conditions):
+            self._discard_conditions(role, resource)
+        self._free_bits(resource)
+        self._changed()
+        return self
+
+    def del_permission(self, resource, permission):
+        if resource in self._structure:
+            self._structure[resource].discard(permission)
+        mask = self._mask(resource, permission)
+        if mask:
+            for role in list(self._resource_grants.get(resource, ())):
+                self._set_mask(role, resource, self._resource_grants[resource][role] & ~mask)
+            self._free_bits(resource, permission)
+        for role in list(self._conditions):
+            self._discard_conditions(role, resource, permission)
+        self._changed()
+        return self
+
+    #endregion
+
+    #region Grant Permissions
+
+    def _set_mask(self, role, resource, mask):
+        """ Store the permissions bitmask of a (role, resource) pair in both indexes """
+        if mask:
+            self._role_grants.setdefault(role, {})[resource] = mask
+            self._resource_grants.setdefault(resource, {})[role] = mask
+        elif resource in self._role_grants.get(role, ()):
+            del self._role_grants[role][resource]
+            if not self._role_grants[role]:
+                del self._role_grants[role]
+            del self._resource_grants[resource][role]
+            if not self._resource_grants[resource]:
+                del self._resource_grants[resource]
+        self._changed(role)
+
+    def _holders(self, resource, mask):
+        return {role for role, granted in self._resource_grants.get(resource, {}).items() if granted & mask}
+
+    def _add_grant(self, role, resource, permission):
+        mask = self._role_grants.get(role, {}).get(resource, 0)
+        self._set_mask(role, resource, mask | 1 << self._bit(resource, permission))
+
+    def _remove_grant(self, role, resource, permission):
+        mask = self._role_grants.get(role, {}).get(resource, 0)
+        if mask:
+            self._set_mask(role, resource, mask & ~self._mask(resource, permission))
+
+    def grant_many(self, grants):
+        structure = self._structure
+        role_grants = self._role_grants
+        resource_grants = self._resource_grants
+        conditions = self._conditions
+        bit = self._bit
+        roles = set()
+
+        grants = [(role, resource, permission) for role, resource, permission in grants]
+        try:
+            for role, resource, permission in grants:
+                if conditions:
+                    self._discard_conditions(role, resource, permission)
+                roles.add(role)
+                structure[resource].add(permission)
+
+                resources = role_grants.get(role)
+                if resources is None:
+                    resources = role_grants[role] = {}
+                holders = resource_grants.get(resource)
+                if holders is None:
+                    holders = resource_grants[resource] = {}
+                resources[resource] = holders[role] = resources.get(resource, 0) | 1 << bit(resource, permission)
+        finally:
+            self._roles.update(roles)
+            for role in roles:
+                self._changed(role)
+        return self
+
+    def _load_masks(self, masks):
+        role_grants = self._role_grants
+        resource_grants = self._resource_grants
+        for role, resource, mask in masks:
+            resources = role_grants.get(role)
+            if resources is None:
+                resources = role_grants[role] = {}
+            holders = resource_grants.get(resource)
+            if holders is None:
+                holders = resource_grants[resource] = {}
+            resources[resource] = holders[role] = mask
+        self._changed()
+
+    def revoke_all(self, role, resource=None):
+        if resource is None:
+            self._conditions.pop(role, None)
+        else:
+            self._discard_conditions(role, resource)
+        resources = self._role_grants.get(role, {})
+        for resource in ([resource] if resource is not None else list(resources)):
+            self._set_mask(role, resource, 0)
+        return self
+
+    #endregion
+
+    #region Check
+
+    def check(self, role, resource, permission, context=None):
+        if self._trie:
+            if self._allows(self._grants_of(role), resource, permission):
+                return True
+        elif self._grants_of(role).get(resource, 0) & self._mask(resource, permission):
+            return True
+        return context is not None and self._conditional(role, resource, permission, context)
+
+    def check_any(self, roles, resource, permission, context=None):
+        if not roles:
+            return False
+        if context is not None and self._conditions:
+            return self._check_roles_conditional(roles, resource, permission, context, False)
+        if self._trie:
+            return any(self.check(role, resource, permission) for role in roles)
+        mask = self._mask(resource, permission)
+        if not mask:
+            return False  # never granted
+        grants_of = self._grants_of
+        return any(grants_of(role).get(resource, 0) & mask for role in roles)
+
+    def check_all(self, roles, resource, permission, context=None):
+        if not roles:
+            return False
+        if context is not None and self._conditions:
+            return self._check_roles_conditional(roles, resource, permission, context, True)
+        if self._trie:
+            return all(self.check(role, resource, permission) for role in roles)
+        mask = self._mask(resource, permission)
+        if not mask:
+            return False  # never granted
+        grants_of = self._grants_of
+        return all(grants_of(role).get(resource, 0) & mask for role in roles)
+
+    def check_many(self, roles, resources, permissions, contexts=None):
+        if contexts is not None and self._conditions:
+            return self._check_many_conditional(roles, resources, permissions, contexts)
+        if self._trie or self._expanding:
+            return [self.check(*grant) for grant in zip(roles, resources, permissions)]
+        role_grants = self._role_grants
+        parents = self._parents
+        grants_of = self._grants_of
+        bits = self._bits
+        empty = {}
+        ret = []
+        for role, resource, permission in zip(roles, resources, permissions):
+            bit = bits.get(resource, empty).get(permission)
+            granted = grants_of(role) if role in parents else role_grants.get(role, empty)
+            ret.append(bit is not None and granted.get(resource, 0) >> bit & 1 == 1)
+        return ret
+
+    #endregion
+
+    #region Show Grants
+
+    def _iter_holders(self, resource, permission):
+        if resource is None:
+            return self._iter_masks(self._role_grants.items(), None, permission)
+        holders = self._resource_grants.get(resource, {})
+        return self._iter_masks(((role, {resource: mask}) for role, mask in holders.items()), resource, permission)
+
+    def resources_with(self, permission):
+        """ List resources that any role has the permission over
+
+            Scans the resources that have grants: CompactAcl does not keep a permission index.
+        """
+        ret = set()
+        for resource, holders in self._resource_grants.items():
+            mask = self._implying_mask(resource, permission)
+            if mask and any(granted & mask for granted in holders.values()):
+                ret.add(resource)
+        return ret
+
+    #endregion
+
+    #region Instrumentation
+
+    def _cardinality(self):
+        # Grants are only kept as bitmasks
+        grants = sum(bin(mask).count('1') for resources in self._role_grants.values() for mask in resources.values())
+        return len(self._roles), len(self._structure), grants
+
+    #endregion
@@ -0,0 +1,216 @@
+import threading
+from contextlib import contextmanager
+
+from .acl import Acl
+
+
+def _read(name):
+    """ Make a read method that queries the published snapshot, without locking """
+    def method(self, *args, **kwargs):
+        return getattr(self._snapshot, name)(*args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = getattr(Acl, name).__doc__
+    return method
+
+
+def _write(name):
+    """ Make a write method that modifies the Acl under the lock, then publishes a new snapshot """
+    def method(self, *args, **kwargs):
+        with self.batch() as acl:
+            getattr(acl, name)(*args, **kwargs)
+        return self
+    method.__name__ = name
+    method.__doc__ = getattr(Acl, name).__doc__
+    return method
+
+
+def _unpickle(function, args):
+    """ Unpickle a ConcurrentAcl from its reduced writable Acl """
+    return ConcurrentAcl(function(*args))
+
+
+class ConcurrentAcl(object):
+    """ Thread-safe Acl
+
+        Reads never block: they are served from an immutable `FrozenAcl` snapshot.
+        Writes are serialized with a lock and applied to a private `Acl`,
+        and a new snapshot is published atomically when they're done.
+
+        Publishing a snapshot copies the whole Acl, so group your changes with `batch()`:
+
+            with acl.batch() as a:
+                a.grant(...)
+                a.revoke(...)
+
+        Readers see either all of the batch, or none of it.
+        There is no rollback: if the batch fails, the changes made so far are published.
+    """
+
+    def __init__(self, acl=None):
+        """ Create a thread-safe Acl
+
+        :param acl: The Acl to manage. It must not be used directly afterwards.
+            Default: a new empty `Acl`
+        :type acl: Acl
+        """
+        #: The writable Acl
+        self._acl = Acl() if acl is None else acl
+
+        #: Writers lock
+        self._lock = threading.RLock()
+
+        #: Nesting level of batch()
+        self._batches = 0
+
+        #: The published snapshot
+        self._snapshot = self._acl.freeze()
+
+        #: Metrics of the calls, or None when not instrumented
+        self._metrics = None
+
+        #: Log of the decisions of the checks, or None when not audited
+        self._decisions = None
+
+    @contextmanager
+    def batch(self):
+        """ Apply several changes at once and publish them with a single snapshot
+
+            Yields the writable Acl. Other writers wait until the batch is over;
+            readers keep using the previous snapshot, and see all changes at once when the batch finishes.
+            Batches can be nested: the snapshot is published by the outermost one.
+
+        :rtype: Acl
+        """
+        with self._lock:
+            self._batches += 1
+            try:
+                yield self._acl
+            finally:
+                self._batches -= 1
+                if not self._batches:
+                    self._snapshot = self._acl.freeze()
+
+    def freeze(self):
+        """ Get the current snapshot
+
+        :rtype: miracle.frozen.FrozenAcl
+        """
+        return self._snapshot
+
+    #region Write
+
+    add_role = _write('add_role')
+    add_roles = _write('add_roles')
+    add_resource = _write('add_resource')
+    add_permission = _write('add_permission')
+    add = _write('add')
+    add_implied = _write('add_implied')
+
+    clear = _write('clear')
+    del_role = _write('del_role')
+    del_roles = _write('del_roles')
+    del_resource = _write('del_resource')
+    del_permission = _write('del_permission')
+
+    grant = _write('grant')
+    grants = _write('grants')
+    grant_many = _write('grant_many')
+    revoke = _write('revoke')
+    revoke_many = _write('revoke_many')
+    revoke_all = _write('revoke_all')
+
+    apply_changes = _write('apply_changes')
+
+    #endregion
+
+    #region Read
+
+    get_roles = _read('get_roles')
+    get_resources = _read('get_resources')
+    get_permissions = _read('get_permissions')
+    get_parents = _read('get_parents')
+    get_implied = _read('get_implied')
+    get = _read('get')
+
+    check = _read('check')
+    check_any = _read('check_any')
+    check_all = _read('check_all')
+    check_many = _read('check_many')
+
+    which_permissions = _read('which_permissions')
+    which_permissions_any = _read('which_permissions_any')
+    which_permissions_all = _read('which_permissions_all')
+    which = _read('which')
+    which_any = _read('which_any')
+    which_all = _read('which_all')
+    show = _read('show')
+    who = _read('who')
+    who_any = _read('who_any')
+    who_all = _read('who_all')
+    resources_with = _read('resources_with')
+
+    iter_grants = _read('iter_grants')
+    iter_which = _read('iter_which')
+    view_roles = _read('view_roles')
+    view_structure = _read('view_structure')
+    view_grants = _read('view_grants')
+
+    #endregion
+
+    #region Changes
+
+    get_version = _read('get_version')
+
+    def changes_since(self, version):
+        with self._lock:
+            return self._acl.changes_since(version)
+    changes_since.__doc__ = Acl.changes_since.__doc__
+
+    #endregion
+
+    #region Instrumentation & Audit
+
+    instrument = vars(Acl)['instrument']
+    uninstrument = vars(Acl)['uninstrument']
+    audit = vars(Acl)['audit']
+    unaudit = vars(Acl)['unaudit']
+
+    def _cardinality(self):
+        return self._snapshot._cardinality()
+
+    #endregion
+
+    #region Export & Import
+
+    dumps = _read('dumps')
+    dump = _read('dump')
+
+    @classmethod
+    def loads(cls, data):
+        """ Load a ConcurrentAcl from the binary string made by `dumps()`
+
+        :rtype: ConcurrentAcl
+        """
+        return cls(Acl.loads(data))
+
+    @classmethod
+    def load(cls, file):
+        """ Load a ConcurrentAcl from a binary file made by `dump()`
+
+        :rtype: ConcurrentAcl
+        """
+        return cls(Acl.load(file))
+
+    def __getstate__(self):
+        return self._snapshot.__getstate__()
+
+    def __setstate__(self, state):
+        self.__init__(Acl().__setstate__(state))
+        return self
+
+    def __reduce__(self):
+        # Pickle the writable Acl, which keeps its options, like its changelog
+        with self._lock:
+            return _unpickle, self._acl.__reduce__()
+
+    #endregion
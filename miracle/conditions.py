@@ -0,0 +1,87 @@
+import ast
+import sys
+
+#: Literal nodes: `Constant` since Python 3.8, which deprecates the older ones
+_LITERALS = ('Constant',) if sys.version_info >= (3, 8) else ('Num', 'Str', 'Bytes', 'NameConstant')
+
+#: Syntax allowed in condition expressions: comparisons, boolean logic, arithmetic, literals,
+#: and context values with their items and attributes. No calls, no private names.
+_NODES = tuple(getattr(ast, name) for name in (
+    'Expression', 'Expr',
+    'BoolOp', 'And', 'Or', 'UnaryOp', 'Not', 'USub', 'UAdd',
+    'Compare', 'Eq', 'NotEq', 'Lt', 'LtE', 'Gt', 'GtE', 'In', 'NotIn', 'Is', 'IsNot',
+    'BinOp', 'Add', 'Sub', 'Mult', 'Div', 'FloorDiv', 'Mod',
+    'Name', 'Load', 'Attribute', 'Subscript', 'Index', 'Slice', 'Tuple', 'List', 'Set',
+) + _LITERALS if hasattr(ast, name))
+
+#: Globals of condition functions: nothing
+_GLOBALS = {'__builtins__': {}}
+
+#: Names that are constants, in Python 2
+_CONSTANTS = {'True', 'False', 'None'}
+
+
+class _ContextNames(ast.NodeTransformer):
+    """ Turn the names of an expression into lookups in the context: `user` -> `_context['user']` """
+
+    def visit_Name(self, node):
+        if node.id in _CONSTANTS:
+            return node
+        lookup = ast.parse('_context[{!r}]'.format(node.id), '<condition>', 'eval').body
+        return ast.copy_location(lookup, node)
+
+
+def _compile(expression):
+    """ Compile a condition expression into a function of the context
+
+    :rtype: callable
+    :raises ValueError: Invalid expression
+    """
+    try:
+        tree = ast.parse(expression, '<condition>', 'eval')
+    except SyntaxError as e:
+        raise ValueError('Invalid condition {!r}: {}'.format(expression, e))
+    for node in ast.walk(tree):
+        if not isinstance(node, _NODES):
+            raise ValueError('Invalid condition {!r}: {} is not allowed'.format(expression, node.__class__.__name__))
+        name = getattr(node, 'id', None) or getattr(node, 'attr', None)
+        if name and name.startswith('_'):
+            raise ValueError('Invalid condition {!r}: private name {!r}'.format(expression, name))
+
+    # Make it the body of `lambda _context: ...`, so that testing it is a plain function call
+    function = ast.parse('lambda _context: None', '<condition>', 'eval')
+    function.body.body = _ContextNames().visit(tree.body)
+    ast.fix_missing_locations(function)
+    return eval(compile(function, '<condition>', 'eval'), _GLOBALS)
+
+
+class Condition(object):
+    """ Condition of a grant, tested against the context of a check
+
+        Either a callable that takes the context, or an expression over the context keys,
+        like "user == author and status != 'locked'". Expressions are compiled once.
+    """
+    __slots__ = ('source', 'test')
+
+    def __init__(self, source):
+        """ Compile a condition
+
+        :param source: Callable, or expression
+        :type source: callable|str
+        :raises ValueError: Invalid expression
+        """
+        #: The condition, as given
+        self.source = source
+
+        #: Test the condition: test(context) -> bool
+        self.test = source if callable(source) else _compile(source)
+
+    def holds(self, context):
+        """ Test the condition against a context. A key missing from the context fails it.
+
+        :rtype: bool
+        """
+        try:
+            return bool(self.test(context))
+        except KeyError:
+            return False
@@ -0,0 +1,180 @@
+from .acl import Acl
+
+
+#: Shared empty mapping for lookups that miss. Never modified.
+_NONE = {}
+
+
+def _immutable(self, *args, **kwargs):
+    """ Mutating methods of FrozenAcl """
+    raise TypeError('FrozenAcl is immutable')
+
+
+class FrozenAcl(Acl):
+    """ Immutable snapshot of an Acl
+
+        Created by `Acl.freeze()`. All read methods are available, and checks are faster:
+        permissions are precomputed as { role: { resource: frozenset(permission) } },
+        so `check()` does not allocate anything.
+        All mutating methods raise `TypeError`.
+
+        Being immutable, a FrozenAcl can be shared between threads without any locking.
+    """
+
+    def __init__(self, acl):
+        """ Take a snapshot of the Acl
+
+        :param acl: The Acl to freeze
+        :type acl: Acl
+        """
+        # No memoization: the LRU cache would be modified by the readers of a snapshot shared between threads
+        super(FrozenAcl, self).__init__(separator=acl._separator)
+
+        # Not used: grants are kept as precomputed sets of permissions
+        del self._grants
+
+        self._roles = frozenset(acl._roles)
+        self._structure = {resource: frozenset(permissions) for resource, permissions in acl._structure.items()}
+        self._bits = {resource: dict(bits) for resource, bits in acl._bits.items()}
+        self._perms = {resource: tuple(perms) for resource, perms in acl._perms.items()}
+        for resource in self._bits:
+            self._trie_add(resource)
+        self._role_grants = {role: dict(resources) for role, resources in acl._role_grants.items()}
+        self._implied = {permission: frozenset(implied) for permission, implied in acl._implied.items()}
+        self._expanding = acl._expanding
+        self._conditions = {role: {resource: dict(permissions) for resource, permissions in resources.items()}
+                            for role, resources in acl._conditions.items()}
+        self._parents = {role: frozenset(parents) for role, parents in acl._parents.items()}
+        self._children = {role: frozenset(children) for role, children in acl._children.items()}
+        self._effective_grants = {role: dict(acl._grants_of(role)) for role in self._parents}
+        self._version = acl._version
+
+        #: Effective permissions, including the inherited and implied ones: { role: { resource: frozenset(permission) } }
+        self._permissions = {}
+        for role in set(self._role_grants) | set(self._parents):
+            resources = self._grants_of(role)
+            if resources:
+                self._permissions[role] = {resource: frozenset(self._decode(resource, mask))
+                                           for resource, mask in resources.items()}
+
+        # Grants index by resource: { resource: { permission: frozenset(role) } }
+        resource_grants = {}
+        for role, resources in self._permissions.items():
+            for resource, permissions in resources.items():
+                for permission in permissions:
+                    resource_grants.setdefault(resource, {}).setdefault(permission, set()).add(role)
+        self._resource_grants = {
+            resource: {permission: frozenset(roles) for permission, roles in permissions.items()}
+            for resource, permissions in resource_grants.items()
+        }
+
+        # Grants index by permission: { permission: { resource: frozenset(role) } }
+        self._permission_grants = {}
+        for resource, permissions in self._resource_grants.items():
+            for permission, roles in permissions.items():
+                self._permission_grants.setdefault(permission, {})[resource] = roles
+
+    def freeze(self):
+        return self
+
+    #region Mutation
+
+    add_role = add_roles = add_resource = add_permission = add = add_implied = _immutable
+    clear = del_role = del_roles = del_resource = del_permission = _immutable
+    grant = grants = grant_many = revoke = revoke_many = revoke_all = _immutable
+    apply_changes = _immutable
+
+    #endregion
+
+    #region Check
+
+    def check(self, role, resource, permission, context=None):
+        permissions = self._permissions.get(role, _NONE)
+        if permission in permissions.get(resource, ()):
+            return True
+        if self._trie and any(permission in permissions.get(wildcard, ()) for wildcard in self._covering(resource)):
+            return True
+        return context is not None and self._conditional(role, resource, permission, context)
+
+    def check_any(self, roles, resource, permission, context=None):
+        if not roles:
+            return False
+        if context is not None and self._conditions:
+            return self._check_roles_conditional(roles, resource, permission, context, False)
+        if self._trie:
+            return any(self.check(role, resource, permission) for role in roles)
+        # Effective holders: inherited and implied grants included
+        holders = self._resource_grants.get(resource, _NONE).get(permission)
+        return holders is not None and not holders.isdisjoint(roles)
+
+    def check_all(self, roles, resource, permission, context=None):
+        if not roles:
+            return False
+        if context is not None and self._conditions:
+            return self._check_roles_conditional(roles, resource, permission, context, True)
+        if self._trie:
+            return all(self.check(role, resource, permission) for role in roles)
+        holders = self._resource_grants.get(resource, _NONE).get(permission)
+        return holders is not None and holders.issuperset(roles)
+
+    def check_many(self, roles, resources, permissions, contexts=None):
+        if contexts is not None and self._conditions:
+            return self._check_many_conditional(roles, resources, permissions, contexts)
+        if self._trie:
+            return [self.check(*grant) for grant in zip(roles, resources, permissions)]
+        grants = self._permissions
+        return [permission in grants.get(role, _NONE).get(resource, ())
+                for role, resource, permission in zip(roles, resources, permissions)]
+
+    #endregion
+
+    #region Show Grants
+
+    def which_permissions(self, role, resource):
+        permissions = self._permissions.get(role, _NONE)
+        ret = set(permissions.get(resource, ()))
+        if self._trie:
+            for wildcard in self._covering(resource):
+                ret.update(permissions.get(wildcard, ()))
+        return ret
+
+    def which(self, role):
+        return {resource: set(permissions) for resource, permissions in self._permissions.get(role, _NONE).items()}
+
+    def who(self, resource, permission):
+        roles = set(self._resource_grants.get(resource, _NONE).get(permission, ()))
+        if self._trie:
+            for wildcard in self._covering(resource):
+                roles.update(self._resource_grants.get(wildcard, _NONE).get(permission, ()))
+        return roles
+
+    def resources_with(self, permission):
+        return set(self._permission_grants.get(permission, _NONE))
+
+    def _iter_holders(self, resource, permission):
+        # The indexes by resource and by permission have the effective grants: scan the direct ones
+        return self._iter_masks(self._role_grants.items(), resource, permission)
+
+    def iter_which(self, role):
+        for resource, permissions in self._permissions.get(role, _NONE).items():
+            for permission in permissions:
+                yield resource, permission
+
+    #endregion
+
+    #region Instrumentation
+
+    def _cardinality(self):
+        # Grants are only kept as bitmasks
+        grants = sum(bin(mask).count('1') for resources in self._role_grants.values() for mask in resources.values())
+        return len(self._roles), len(self._structure), grants
+
+    #endregion
+
+    #region Export & Import
+
+    @classmethod
+    def loads(cls, data):
+        return Acl.loads(data).freeze()
+
+    #endregion
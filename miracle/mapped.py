@@ -0,0 +1,449 @@
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+
+#: File signature
+_MAGIC = b'MIRACLEM'
+
+#: Version of the file format
+_VERSION = 2
+
+#: Header: magic, version, byte order, counts (roles, resources, permissions, pairs, resource hash slots),
+#: section offsets
+_HEADER = struct.Struct('<8sI8s5I12Q')
+
+#: Byte order of the arrays. Files are shared by processes on the same machine, so it's native.
+_BYTEORDER = sys.byteorder.encode('ascii').ljust(8, b'\0')
+
+
+def _encode(value, what):
+    """ Encode a role, resource or permission name for the string table """
+    try:
+        return value.encode('utf-8')
+    except AttributeError:
+        raise TypeError('MappedAcl only supports string {}s, got: {!r}'.format(what, value))
+
+
+def _hash(key):
+    """ Hash a byte string for the resources hash table. Must be stable across processes. """
+    return zlib.crc32(key) & 0xffffffff
+
+
+def _string_table(strings):
+    """ Pack a list of byte strings into (offsets, blob) """
+    offsets = array('I', [0])
+    for s in strings:
+        offsets.append(offsets[-1] + len(s))
+    return offsets.tobytes(), b''.join(strings)
+
+
+class MappedAcl(object):
+    """ Read-only Acl stored in a file, and memory-mapped
+
+        Write an Acl with `MappedAcl.write(acl, path)`, then open it in every process with `MappedAcl(path)`.
+        Queries run against the mapped file: nothing is loaded into memory,
+        so all the processes share a single copy of the data, and opening is instant.
+
+        The file has sorted string tables of roles, resources and permissions, a hash table of resources,
+        and packed arrays of (role, resource, permissions bitmask) sorted by role and resource,
+        so every lookup is a hash probe or a binary search.
+        Inherited grants are resolved when writing.
+
+        Limitations: roles, resources and permissions must be strings,
+        a resource can have at most 64 permissions, resources can not be hierarchical,
+        and grants can not be conditional.
+        The file can only be used on machines with the same byte order.
+        Requires Python 3.3: the arrays are read through `memoryview.cast()`.
+    """
+
+    def __init__(self, path):
+        """ Open a file made by `MappedAcl.write()`
+
+        :param path: Path to the file
+        :type path: str
+        :raises ValueError: Not a MappedAcl file
+        """
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._map(self._mm, path)
+        except ValueError:
+            self._mm.close()
+            raise
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """ Open an Acl packed by `MappedAcl.pack()` in a buffer, e.g. shared memory
+
+            Nothing is copied: the buffer must stay open until the MappedAcl is closed.
+
+        :param buffer: Object that supports the buffer protocol
+        :rtype: MappedAcl
+        :raises ValueError: Not a packed MappedAcl
+        """
+        self = cls.__new__(cls)
+        self._mm = None
+        self._map(buffer, 'buffer')
+        return self
+
+    def _map(self, buffer, name):
+        """ Read the header, and make views of the sections of a buffer """
+        buf = memoryview(buffer)
+        header = _HEADER.unpack_from(buf, 0) if buf.nbytes >= _HEADER.size else (None, None, None)
+        if header[:3] != (_MAGIC, _VERSION, _BYTEORDER):
+            buf.release()
+            raise ValueError('Not a MappedAcl file, or not for this machine: {}'.format(name))
+        (self._n_roles, self._n_resources, self._n_permissions, self._n_pairs, self._n_slots,
+         roles_offsets, self._roles_blob,
+         resources_offsets, self._resources_blob, resources_slots,
+         permissions_starts, permissions_offsets, self._permissions_blob, defined,
+         role_starts, pair_resources, pair_masks) = header[3:]
+
+        #: Sliced for strings: mmaps and bytes give bytes, other buffers give memoryviews
+        self._data = buffer if isinstance(buffer, (bytes, mmap.mmap)) else buf
+
+        # Arrays
+        self._views = [buf]
+
+        def view(offset, count, typecode):
+            ret = buf[offset:offset + count * array(typecode).itemsize].cast(typecode)
+            self._views.append(ret)
+            return ret
+
+        self._roles_offsets = view(roles_offsets, self._n_roles + 1, 'I')
+        self._resources_offsets = view(resources_offsets, self._n_resources + 1, 'I')
+        self._resources_slots = view(resources_slots, self._n_slots, 'I')
+        self._permissions_starts = view(permissions_starts, self._n_resources + 1, 'I')
+        self._permissions_offsets = view(permissions_offsets, self._n_permissions + 1, 'I')
+        self._defined = view(defined, self._n_resources, 'Q')
+        self._role_starts = view(role_starts, self._n_roles + 1, 'I')
+        self._pair_resources = view(pair_resources, self._n_pairs, 'I')
+        self._pair_masks = view(pair_masks, self._n_pairs, 'Q')
+
+        #: Cache of role ids: there are few roles, and they're looked up all the time
+        self._role_ids = {}
+
+    def close(self):
+        """ Unmap the file, or release the buffer """
+        for view in reversed(self._views):
+            view.release()
+        if self._mm is not None:
+            self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @classmethod
+    def write(cls, acl, path):
+        """ Write an Acl into a file
+
+        :param acl: The Acl to write
+        :type acl: miracle.Acl
+        :param path: Path to the file
+        :type path: str
+        :raises TypeError: A role, resource or permission is not a string
+        :raises ValueError: A resource has more than 64 permissions, the resources are hierarchical,
+            or there are conditional grants
+        """
+        data = cls.pack(acl)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    @classmethod
+    def pack(cls, acl):
+        """ Pack an Acl into the bytes of a MappedAcl file, to open with `MappedAcl.from_buffer()`
+
+        :param acl: The Acl to pack
+        :type acl: miracle.Acl
+        :rtype: bytes
+        :raises TypeError: A role, resource or permission is not a string
+        :raises ValueError: A resource has more than 64 permissions, the resources are hierarchical,
+            or there are conditional grants
+        """
+        if acl._separator is not None:
+            raise ValueError('MappedAcl does not support hierarchical resources')
+        if acl._conditions:
+            raise ValueError('MappedAcl does not support conditional grants')
+        roles = sorted(acl._roles, key=lambda role: _encode(role, 'role'))
+        resources = sorted(acl._structure, key=lambda resource: _encode(resource, 'resource'))
+        resource_ids = {resource: i for i, resource in enumerate(resources)}
+
+        # Permissions: sorted per resource. Their index is the new bit position.
+        # Implied permissions have bits without being defined on the resource: `defined` masks them out
+        permissions, permissions_starts, defined, remap = [], array('I', [0]), array('Q'), {}
+        for resource in resources:
+            allocated = [name for name in acl._perms.get(resource, ()) if name is not None]
+            names = sorted(acl._structure[resource].union(allocated),
+                           key=lambda permission: _encode(permission, 'permission'))
+            if len(names) > 64:
+                raise ValueError('MappedAcl supports at most 64 permissions per resource: {!r}'.format(resource))
+            permissions.extend(names)
+            permissions_starts.append(len(permissions))
+            bits = {name: bit for bit, name in enumerate(names)}
+            defined.append(sum(1 << bits[name] for name in acl._structure[resource]))
+            remap[resource] = [None if name is None else bits[name] for name in acl._perms.get(resource, ())]
+
+        # Grants: (resource id, mask) pairs sorted per role
+        role_starts, pair_resources, pair_masks = array('I', [0]), array('I'), array('Q')
+        for role in roles:
+            pairs = []
+            for resource, mask in acl._grants_of(role).items():
+                bits = remap[resource]
+                pairs.append((resource_ids[resource],
+                              sum(1 << bits[bit] for bit in range(mask.bit_length()) if mask >> bit & 1)))
+            pairs.sort()
+            pair_resources.extend(resource_id for resource_id, mask in pairs)
+            pair_masks.extend(mask for resource_id, mask in pairs)
+            role_starts.append(len(pair_resources))
+
+        # Resources hash table, with linear probing: slots of (resource id + 1), 0 when empty
+        encoded_resources = [_encode(resource, 'resource') for resource in resources]
+        n_slots = 1
+        while n_slots < 2 * len(resources):
+            n_slots *= 2
+        slots = array('I', [0]) * n_slots
+        for resource_id, resource in enumerate(encoded_resources):
+            slot = _hash(resource) & (n_slots - 1)
+            while slots[slot]:
+                slot = (slot + 1) & (n_slots - 1)
+            slots[slot] = resource_id + 1
+
+        # Sections
+        roles_offsets, roles_blob = _string_table([_encode(role, 'role') for role in roles])
+        resources_offsets, resources_blob = _string_table(encoded_resources)
+        permissions_offsets, permissions_blob = _string_table([_encode(permission, 'permission') for permission in permissions])
+        sections = [
+            roles_offsets, roles_blob,
+            resources_offsets, resources_blob, slots.tobytes(),
+            permissions_starts.tobytes(), permissions_offsets, permissions_blob, defined.tobytes(),
+            role_starts.tobytes(), pair_resources.tobytes(), pair_masks.tobytes(),
+        ]
+
+        # Sections are aligned to 8 bytes
+        sections = [section + b'\0' * (-len(section) % 8) for section in sections]
+        offsets, offset = [], _HEADER.size + (-_HEADER.size % 8)
+        for section in sections:
+            offsets.append(offset)
+            offset += len(section)
+
+        header = _HEADER.pack(_MAGIC, _VERSION, _BYTEORDER,
+                              len(roles), len(resources), len(permissions), len(pair_masks), n_slots,
+                              *offsets)
+        return b''.join([header, b'\0' * (-len(header) % 8)] + sections)
+
+    #region Lookups
+
+    def _string(self, offsets, blob, i):
+        """ Get the i-th string from a string table
+
+        :rtype: bytes
+        """
+        ret = self._data[blob + offsets[i]:blob + offsets[i + 1]]
+        return ret if ret.__class__ is bytes else ret.tobytes()
+
+    def _search(self, offsets, blob, lo, hi, key):
+        """ Binary search for a string in a sorted range of a string table
+
+        :return: Index, or None when missing
+        :rtype: int|None
+        """
+        try:
+            key = key.encode('utf-8')
+        except AttributeError:
+            return None
+        end = hi
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string(offsets, blob, mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < end and self._string(offsets, blob, lo) == key:
+            return lo
+        return None
+
+    def _role_id(self, role):
+        try:
+            return self._role_ids[role]
+        except (KeyError, TypeError):
+            pass
+        role_id = self._search(self._roles_offsets, self._roles_blob, 0, self._n_roles, role)
+        if role_id is not None:
+            self._role_ids[role] = role_id
+        return role_id
+
+    def _resource_id(self, resource):
+        try:
+            key = resource.encode('utf-8')
+        except AttributeError:
+            return None
+        slots = self._resources_slots
+        mask = self._n_slots - 1
+        slot = _hash(key) & mask
+        while slots[slot]:
+            resource_id = slots[slot] - 1
+            if self._string(self._resources_offsets, self._resources_blob, resource_id) == key:
+                return resource_id
+            slot = (slot + 1) & mask
+        return None
+
+    def _mask(self, role_id, resource_id):
+        """ Get the permissions bitmask of a (role, resource) pair """
+        end = self._role_starts[role_id + 1]
+        i = bisect_left(self._pair_resources, resource_id, self._role_starts[role_id], end)
+        if i < end and self._pair_resources[i] == resource_id:
+            return self._pair_masks[i]
+        return 0
+
+    def _decode(self, resource_id, mask):
+        """ Convert a bitmask of permissions on a resource into a set of permissions """
+        start, end = self._permissions_starts[resource_id], self._permissions_starts[resource_id + 1]
+        return {self._string(self._permissions_offsets, self._permissions_blob, start + bit).decode('utf-8')
+                for bit in range(end - start) if mask >> bit & 1}
+
+    def _permission_mask(self, resource_id, permission):
+        """ Get the bitmask of a permission on a resource, or 0 """
+        start, end = self._permissions_starts[resource_id], self._permissions_starts[resource_id + 1]
+        i = self._search(self._permissions_offsets, self._permissions_blob, start, end, permission)
+        return 0 if i is None else 1 << (i - start)
+
+    def _role_masks(self, roles, resource):
+        """ Get the masks of roles over a resource, and the resource id """
+        resource_id = self._resource_id(resource)
+        if resource_id is None:
+            return None, [0 for role in roles]
+        masks = []
+        for role in roles:
+            role_id = self._role_id(role)
+            masks.append(0 if role_id is None else self._mask(role_id, resource_id))
+        return resource_id, masks
+
+    #endregion
+
+    #region Get
+
+    def get_roles(self):
+        """ Get the set of roles.
+
+        :rtype: set(str)
+        """
+        return {self._string(self._roles_offsets, self._roles_blob, i).decode('utf-8') for i in range(self._n_roles)}
+
+    def get_resources(self):
+        """ Get the set of resources
+
+        :rtype: set(str)
+        """
+        return {self._string(self._resources_offsets, self._resources_blob, i).decode('utf-8')
+                for i in range(self._n_resources)}
+
+    def get_permissions(self, resource):
+        """ Get the set of permissions on a resource
+
+        :rtype: set(str)
+        """
+        resource_id = self._resource_id(resource)
+        return set() if resource_id is None else self._decode(resource_id, self._defined[resource_id])
+
+    #endregion
+
+    #region Check
+
+    def check(self, role, resource, permission):
+        """ Test whether the given role has access to the resource with the specified permission.
+
+        :rtype: bool
+        """
+        return self.check_any([role], resource, permission)
+
+    def check_any(self, roles, resource, permission):
+        """ Test whether ANY of the given roles have access to the resource with the specified permission.
+
+        :rtype: bool
+        """
+        if not roles:
+            return False
+        resource_id, masks = self._role_masks(roles, resource)
+        return resource_id is not None and any(mask & self._permission_mask(resource_id, permission) for mask in masks)
+
+    def check_all(self, roles, resource, permission):
+        """ Test whether ALL of the given roles have access to the resource with the specified permission.
+
+        :rtype: bool
+        """
+        if not roles:
+            return False
+        resource_id, masks = self._role_masks(roles, resource)
+        if resource_id is None:
+            return False
+        permission_mask = self._permission_mask(resource_id, permission)
+        return all(mask & permission_mask for mask in masks)
+
+    def check_many(self, roles, resources, permissions):
+        """ Test many (role, resource, permission) triples at once.
+
+        :rtype: list(bool)
+        """
+        return [self.check(*grant) for grant in zip(roles, resources, permissions)]
+
+    #endregion
+
+    #region Show Grants
+
+    def which_permissions(self, role, resource):
+        """ List permissions that the provided role has over the resource
+
+        :rtype: set(str)
+        """
+        return self.which_permissions_any([role], resource)
+
+    def which_permissions_any(self, roles, resource):
+        """ List permissions that any of the provided roles have over the resource
+
+        :rtype: set(str)
+        """
+        if not roles:
+            return {}
+        resource_id, masks = self._role_masks(roles, resource)
+        mask = 0
+        for m in masks:
+            mask |= m
+        return self._decode(resource_id, mask) if mask else set()
+
+    def which_permissions_all(self, roles, resource):
+        """ List permissions that all of the provided roles have over the resource
+
+        :rtype: set(str)
+        """
+        if not roles:
+            return {}
+        resource_id, masks = self._role_masks(roles, resource)
+        mask = -1
+        for m in masks:
+            mask &= m
+        return self._decode(resource_id, mask) if mask else set()
+
+    def which(self, role):
+        """ Collect grants that the provided role has
+
+            Returns: { resource: set(permission) }
+
+        :rtype: dict(set(str))
+        """
+        role_id = self._role_id(role)
+        if role_id is None:
+            return {}
+        ret = {}
+        for i in range(self._role_starts[role_id], self._role_starts[role_id + 1]):
+            resource_id = self._pair_resources[i]
+            resource = self._string(self._resources_offsets, self._resources_blob, resource_id).decode('utf-8')
+            ret[resource] = self._decode(resource_id, self._pair_masks[i])
+        return ret
+
+    #endregion
@@ -0,0 +1,225 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+from .bindings import bind, unbind
+
+try:
+    _clock = time.perf_counter
+except AttributeError:  # Python 2
+    _clock = time.time
+
+#: Default upper bounds of the latency buckets, in seconds
+BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 0.1, 1.0)
+
+#: Methods that are never instrumented
+_SKIPPED = frozenset(['instrument', 'uninstrument', 'audit', 'unaudit'])
+
+
+def _methods(cls):
+    """ Get the names of the public methods of a class. Class and static methods are skipped.
+
+    :rtype: list(str)
+    """
+    ret, seen = [], set()
+    for klass in cls.__mro__:
+        for name, attr in vars(klass).items():
+            if name in seen:
+                continue
+            seen.add(name)
+            if name.startswith('_') or name in _SKIPPED or isinstance(attr, (classmethod, staticmethod)):
+                continue
+            if callable(attr):
+                ret.append(name)
+    return sorted(ret)
+
+
+def _format(value):
+    """ Format a number for the Prometheus text format """
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics(object):
+    """ Call counts, latency histograms and slow calls of the methods of an Acl
+
+        Created by `acl.instrument()`, which binds timing wrappers over the methods of that Acl only:
+        an Acl that is not instrumented runs its methods as they are, at no cost.
+        Only the outermost calls are timed: `check_any()` calling `check()` counts as a single call.
+        Iterators and views are timed when they're created, not when they're consumed.
+    """
+
+    def __init__(self, buckets=BUCKETS, slow=None, slow_threshold=0.1, prefix='miracle'):
+        """ Create a collection of metrics
+
+        :param buckets: Upper bounds of the latency buckets, in seconds
+        :type buckets: collections.Iterable(float)
+        :param slow: Called with every slow call: slow(method name, args, kwargs, seconds)
+        :type slow: callable
+        :param slow_threshold: Number of seconds a call must last to be slow
+        :type slow_threshold: float
+        :param prefix: Prefix of the names of the exported metrics
+        :type prefix: str
+        """
+        self._buckets = tuple(sorted(buckets))
+        self._slow = slow
+        self._slow_threshold = slow_threshold
+        self._prefix = prefix
+
+        #: Stats: { method name: [count, total seconds, [count per bucket, then above the last one]] }
+        self._stats = {}
+        self._lock = threading.Lock()
+
+        #: Per-thread: whether a call is being timed. Nested calls are not
+        self._local = threading.local()
+
+        #: The instrumented Acl, and the bindings of the wrappers
+        self._acl = None
+        self._bindings = []
+
+    #region Instrumenting
+
+    def _timed(self, name, method):
+        """ Wrap a method to time its calls """
+        local = self._local
+        observe = self._observe
+
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            if getattr(local, 'timing', False):
+                return method(*args, **kwargs)
+            local.timing = True
+            start = _clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                local.timing = False
+                observe(name, _clock() - start, args, kwargs)
+        return wrapper
+
+    def attach(self, acl):
+        """ Start timing the methods of an Acl
+
+            Wrappers are bound on the instance, over the methods of the class, or the instance's own bindings,
+            like the changelog's.
+
+        :param acl: The Acl: any class with a `_cardinality()` method
+        :type acl: miracle.Acl
+        :rtype: Metrics
+        :raises ValueError: Already attached to an Acl
+        """
+        if self._acl is not None:
+            raise ValueError('Metrics are already attached to an Acl')
+        self._bindings = bind(acl, _methods(type(acl)), self._timed)
+        self._acl = acl
+        acl._metrics = self
+        return self
+
+    def detach(self):
+        """ Stop timing the methods of the Acl: its methods are restored as they were
+
+        :rtype: Metrics
+        :raises ValueError: Other wrappers were bound over the methods since, like a `DecisionLog`: detach it first
+        """
+        acl = self._acl
+        if acl is None:
+            return self
+        unbind(acl, self._bindings)
+        self._bindings = []
+        acl._metrics = None
+        self._acl = None
+        return self
+
+    def _observe(self, name, seconds, args, kwargs):
+        """ Record a call """
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = [0, 0.0, [0] * (len(self._buckets) + 1)]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2][bisect_left(self._buckets, seconds)] += 1
+        if self._slow is not None and seconds >= self._slow_threshold:
+            self._slow(name, args, kwargs, seconds)
+
+    #endregion
+
+    #region Read
+
+    def get_calls(self):
+        """ Get the number of calls of every method called so far: { method name: count }
+
+        :rtype: dict(str, int)
+        """
+        with self._lock:
+            return {name: stats[0] for name, stats in self._stats.items()}
+
+    def get_latency(self, name):
+        """ Get the latency histogram of a method
+
+            Returns (count, total seconds, [(upper bound, number of calls up to it)]), cumulative like Prometheus'.
+            The last bound is infinity.
+
+        :param name: Name of the method
+        :type name: str
+        :rtype: tuple(int, float, list(tuple(float, int)))
+        """
+        with self._lock:
+            count, total, buckets = self._stats.get(name, (0, 0.0, [0] * (len(self._buckets) + 1)))
+            buckets = list(buckets)
+        ret, cumulative = [], 0
+        for bound, n in zip(self._buckets + (float('inf'),), buckets):
+            cumulative += n
+            ret.append((bound, cumulative))
+        return count, total, ret
+
+    def get_cardinality(self):
+        """ Get the number of roles, resources and grants of the Acl
+
+        :rtype: dict(str, int)
+        :raises ValueError: Not attached to an Acl
+        """
+        if self._acl is None:
+            raise ValueError('Metrics are not attached to an Acl')
+        return dict(zip(('roles', 'resources', 'grants'), self._acl._cardinality()))
+
+    def reset(self):
+        """ Forget the calls so far
+
+        :rtype: Metrics
+        """
+        with self._lock:
+            self._stats.clear()
+        return self
+
+    def prometheus(self):
+        """ Export the metrics in the Prometheus text format
+
+            `<prefix>_call_seconds` is a histogram of the calls, labelled by method,
+            and `<prefix>_roles`, `<prefix>_resources` and `<prefix>_grants` are gauges of the Acl.
+
+        :rtype: str
+        """
+        prefix = self._prefix
+        lines = [
+            '# HELP {}_call_seconds Latency of the calls of Acl methods'.format(prefix),
+            '# TYPE {}_call_seconds histogram'.format(prefix),
+        ]
+        with self._lock:
+            names = sorted(self._stats)
+        for name in names:
+            count, total, buckets = self.get_latency(name)
+            for bound, n in buckets:
+                lines.append('{}_call_seconds_bucket{{method="{}",le="{}"}} {}'.format(
+                    prefix, name, '+Inf' if bound == float('inf') else _format(bound), n))
+            lines.append('{}_call_seconds_sum{{method="{}"}} {}'.format(prefix, name, _format(total)))
+            lines.append('{}_call_seconds_count{{method="{}"}} {}'.format(prefix, name, count))
+
+        if self._acl is not None:
+            for what, n in sorted(self.get_cardinality().items()):
+                lines.append('# HELP {}_{} Number of {} of the Acl'.format(prefix, what, what))
+                lines.append('# TYPE {}_{} gauge'.format(prefix, what))
+                lines.append('{}_{} {}'.format(prefix, what, n))
+        return '\n'.join(lines) + '\n'
+
+    #endregion
@@ -0,0 +1,392 @@
+""" Multi-process check server over a Unix socket. Python 3.8+ only: import it explicitly. """
+
+import itertools
+import json
+import multiprocessing
+import os
+import selectors
+import socket
+import struct
+from multiprocessing.shared_memory import SharedMemory
+
+from .mapped import MappedAcl
+
+#: Frame header: length of the JSON payload
+_FRAME = struct.Struct('<I')
+
+#: Largest frame accepted
+_MAX_FRAME = 1 << 26
+
+#: Size of the reads from a socket
+_CHUNK = 1 << 16
+
+#: Stop reading from a connection that has this many bytes of responses waiting to be sent
+_MAX_OUTBOX = 1 << 22
+
+#: Methods served, and how the client decodes their results
+_METHODS = {
+    'get_roles': set,
+    'get_resources': set,
+    'get_permissions': set,
+    'check': None,
+    'check_any': None,
+    'check_all': None,
+    'check_many': None,
+    'which_permissions': set,
+    'which_permissions_any': lambda result: set(result) if isinstance(result, list) else result,
+    'which_permissions_all': lambda result: set(result) if isinstance(result, list) else result,
+    'which': lambda result: {resource: set(permissions) for resource, permissions in result.items()},
+}
+
+
+class ServerError(Exception):
+    """ A request failed in the server """
+
+
+def _frame(message):
+    """ Encode a message into a frame
+
+    :rtype: bytes
+    """
+    payload = json.dumps(message, separators=(',', ':'), default=list).encode('utf-8')
+    return _FRAME.pack(len(payload)) + payload
+
+
+def _unframe(inbox):
+    """ Decode the complete frames at the start of a buffer, and remove them
+
+    :type inbox: bytearray
+    :rtype: list
+    :raises ValueError: A frame is too large
+    """
+    messages, offset = [], 0
+    while len(inbox) - offset >= _FRAME.size:
+        size, = _FRAME.unpack_from(inbox, offset)
+        if size > _MAX_FRAME:
+            raise ValueError('Frame too large: {} bytes'.format(size))
+        end = offset + _FRAME.size + size
+        if len(inbox) < end:
+            break
+        messages.append(json.loads(inbox[offset + _FRAME.size:end].decode('utf-8')))
+        offset = end
+    del inbox[:offset]
+    return messages
+
+
+#region Worker
+
+class _Snapshot(object):
+    """ The current Acl of a worker, attached from shared memory """
+
+    def __init__(self, generation, name, lock):
+        self._generation = generation
+        self._name = name
+        self._lock = lock
+        self._seen = None
+        self._shm = None
+        self._acl = None
+
+    def get(self):
+        """ Get the Acl, after attaching the new snapshot if one was published
+
+        :rtype: MappedAcl
+        """
+        if self._generation.value != self._seen:
+            with self._lock:  # the publisher does not unlink the snapshot while it's attached
+                self._seen = self._generation.value
+                shm = SharedMemory(self._name.value.decode('ascii'))
+            self.close()
+            self._shm = shm
+            self._acl = MappedAcl.from_buffer(shm.buf)
+        return self._acl
+
+    def close(self):
+        if self._acl is not None:
+            self._acl.close()
+            self._shm.close()
+            self._acl = self._shm = None
+
+
+def _answer(acl, request):
+    """ Answer a request: [id, method, args] -> [id, result, error] """
+    try:
+        request_id, method, args = request
+    except (TypeError, ValueError):
+        return [None, None, 'Invalid request: {!r}'.format(request)]
+    if method not in _METHODS:
+        return [request_id, None, 'Unknown method: {!r}'.format(method)]
+    try:
+        return [request_id, getattr(acl, method)(*args), None]
+    except Exception as e:
+        return [request_id, None, '{}: {}'.format(e.__class__.__name__, e)]
+
+
+def _serve(listener, generation, name, lock):
+    """ Worker: answer the requests of many connections, from the latest snapshot """
+    snapshot = _Snapshot(generation, name, lock)
+    selector = selectors.DefaultSelector()
+    listener.setblocking(False)
+    selector.register(listener, selectors.EVENT_READ)
+    # Connections: { socket: [inbox, outbox] }
+    connections = {}
+
+    def close(sock):
+        selector.unregister(sock)
+        del connections[sock]
+        sock.close()
+
+    while True:
+        for key, events in selector.select():
+            sock = key.fileobj
+            if sock is listener:
+                try:
+                    sock, address = listener.accept()
+                except BlockingIOError:
+                    continue  # another worker got it
+                sock.setblocking(False)
+                connections[sock] = [bytearray(), bytearray()]
+                selector.register(sock, selectors.EVENT_READ)
+                continue
+
+            inbox, outbox = connections[sock]
+            if events & selectors.EVENT_READ:
+                try:
+                    data = sock.recv(_CHUNK)
+                except ConnectionError:
+                    data = b''
+                if not data:
+                    close(sock)
+                    continue
+                inbox += data
+                try:
+                    requests = _unframe(inbox)
+                except ValueError:
+                    close(sock)
+                    continue
+                if requests:
+                    acl = snapshot.get()
+                    for request in requests:
+                        outbox += _frame(_answer(acl, request))
+
+            if outbox:
+                try:
+                    del outbox[:sock.send(outbox)]
+                except BlockingIOError:
+                    pass
+                except ConnectionError:
+                    close(sock)
+                    continue
+            # Wait for the client to read its responses before reading more requests
+            wanted = (selectors.EVENT_READ if len(outbox) < _MAX_OUTBOX else 0) | \
+                     (selectors.EVENT_WRITE if outbox else 0)
+            if wanted != key.events:
+                selector.modify(sock, wanted)
+
+#endregion
+
+
+class AclServer(object):
+    """ Pool of worker processes that answer checks over a Unix socket
+
+        The Acl is packed once into shared memory (see `MappedAcl`), and every worker maps it:
+        there is one copy of the data, however many workers. Each worker serves many connections,
+        and requests are pipelined: a client sends a batch of requests without waiting for the responses.
+
+        Throughput scales with the number of workers, as long as there are as many concurrent connections.
+
+        Limitations: those of `MappedAcl`. Python 3.8+, Unix only.
+    """
+
+    def __init__(self, acl, path, workers=None, backlog=128):
+        """ Publish an Acl, and start the workers
+
+        :param acl: The Acl to serve
+        :type acl: miracle.Acl
+        :param path: Path of the Unix socket
+        :type path: str
+        :param workers: Number of worker processes. Default: the number of CPUs
+        :type workers: int
+        :param backlog: Number of connections waiting to be accepted
+        :type backlog: int
+        """
+        context = multiprocessing.get_context()
+        self._path = path
+        self._generation = context.Value('Q', 0, lock=False)
+        self._name = context.Array('c', 64, lock=False)
+        self._lock = context.Lock()
+        self._shm = None
+        self.publish(acl)
+
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(path)
+        self._listener.listen(backlog)
+
+        self._workers = [
+            context.Process(target=_serve, args=(self._listener, self._generation, self._name, self._lock),
+                            daemon=True)
+            for i in range(workers or os.cpu_count() or 1)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def publish(self, acl):
+        """ Publish a new version of the Acl
+
+            Workers switch to it before their next batch of requests.
+
+        :type acl: miracle.Acl
+        :rtype: AclServer
+        """
+        data = MappedAcl.pack(acl)
+        shm = SharedMemory(create=True, size=len(data))
+        shm.buf[:len(data)] = data
+        with self._lock:
+            old, self._shm = self._shm, shm
+            self._name.value = shm.name.encode('ascii')
+            self._generation.value += 1
+        if old is not None:
+            # Workers that mapped it keep their copy until they switch
+            old.close()
+            old.unlink()
+        return self
+
+    def close(self):
+        """ Stop the workers, and remove the socket and the shared memory """
+        for worker in self._workers:
+            worker.terminate()
+        for worker in self._workers:
+            worker.join()
+        self._listener.close()
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _remote(method):
+    """ Make a client method that calls the method in the server """
+    def call(self, *args):
+        return self.call(method, *args)
+    call.__name__ = method
+    call.__doc__ = getattr(MappedAcl, method).__doc__
+    return call
+
+
+class AclClient(object):
+    """ Connection to an `AclServer`
+
+        Has the check and show methods of `MappedAcl`. Each call is a round trip:
+        send many calls at once with `pipeline()`, and many checks with `check_many()`.
+
+        Not thread-safe: open a client per thread.
+    """
+
+    def __init__(self, path, timeout=None):
+        """ Connect to a server
+
+        :param path: Path of the Unix socket
+        :type path: str
+        :param timeout: Number of seconds to wait for the responses. Default: forever
+        :type timeout: float
+        """
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(path)
+        self._sock.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._sock, selectors.EVENT_READ)
+        self._timeout = timeout
+        self._ids = itertools.count()
+
+    def close(self):
+        """ Disconnect """
+        self._selector.close()
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def call(self, method, *args):
+        """ Call a method in the server
+
+        :param method: Name of the method, e.g. 'check'
+        :type method: str
+        :raises ServerError: The call failed
+        """
+        return self.pipeline([(method, args)])[0]
+
+    def pipeline(self, calls):
+        """ Make many calls in a single round trip
+
+            All the requests are sent before waiting for the responses.
+
+        :param calls: Iterable of (method, args)
+        :type calls: collections.Iterable(tuple(str, tuple))
+        :return: The results, in order
+        :rtype: list
+        :raises ServerError: A call failed
+        :raises TimeoutError: The server did not answer in time
+        """
+        outbox, ids, methods = bytearray(), {}, []
+        for i, (method, args) in enumerate(calls):
+            if method not in _METHODS:
+                raise ValueError('Unknown method: {!r}'.format(method))
+            request_id = next(self._ids)
+            ids[request_id] = i
+            methods.append(method)
+            outbox += _frame([request_id, method, list(args)])
+
+        # Send and receive at the same time, so that neither side blocks on a full socket
+        inbox, responses = bytearray(), [None] * len(methods)
+        pending = len(methods)
+        while pending:
+            self._selector.modify(self._sock, selectors.EVENT_READ | (selectors.EVENT_WRITE if outbox else 0))
+            events = self._selector.select(self._timeout)
+            if not events:
+                raise TimeoutError('No response from the server in {} seconds'.format(self._timeout))
+            if outbox and events[0][1] & selectors.EVENT_WRITE:
+                try:
+                    del outbox[:self._sock.send(outbox)]
+                except BlockingIOError:
+                    pass
+            if events[0][1] & selectors.EVENT_READ:
+                try:
+                    data = self._sock.recv(_CHUNK)
+                except BlockingIOError:
+                    continue
+                if not data:
+                    raise ConnectionError('The server closed the connection')
+                inbox += data
+                for request_id, result, error in _unframe(inbox):
+                    responses[ids[request_id]] = (result, error)
+                    pending -= 1
+
+        results = []
+        for method, (result, error) in zip(methods, responses):
+            if error is not None:
+                raise ServerError(error)
+            decode = _METHODS[method]
+            results.append(result if decode is None else decode(result))
+        return results
+
+    get_roles = _remote('get_roles')
+    get_resources = _remote('get_resources')
+    get_permissions = _remote('get_permissions')
+    check = _remote('check')
+    check_any = _remote('check_any')
+    check_all = _remote('check_all')
+    check_many = _remote('check_many')
+    which_permissions = _remote('which_permissions')
+    which_permissions_any = _remote('which_permissions_any')
+    which_permissions_all = _remote('which_permissions_all')
+    which = _remote('which')
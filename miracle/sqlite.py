@@ -0,0 +1,539 @@
+import sqlite3
+import threading
+
+from .acl import Acl
+from .storage import Storage
+
+
+#: Tables. Columns have no type, so that SQLite keeps the values as they are: strings, numbers or bytes
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS roles (
+    role NOT NULL PRIMARY KEY
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS resources (
+    resource NOT NULL PRIMARY KEY
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS permissions (
+    resource NOT NULL,
+    permission NOT NULL,
+    PRIMARY KEY (resource, permission)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS grants (
+    role NOT NULL,
+    resource NOT NULL,
+    permission NOT NULL,
+    PRIMARY KEY (role, resource, permission)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS grants_by_resource ON grants (resource, permission, role);
+
+CREATE TABLE IF NOT EXISTS parents (
+    role NOT NULL,
+    parent NOT NULL,
+    PRIMARY KEY (role, parent)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS parents_by_parent ON parents (parent, role);
+'''
+
+
+def _effective(name, n):
+    """ Make a recursive CTE of the given roles and all their ancestors
+
+    :param name: Name of the CTE
+    :param n: Number of roles: they're the query parameters
+    :rtype: str
+    """
+    return '''{name}(role) AS (
+        VALUES {values}
+        UNION SELECT parent FROM parents JOIN {name} USING (role)
+    )'''.format(name=name, values=', '.join(['(?)'] * n))
+
+
+
+def _heirs(name, n):
+    """ Make a recursive CTE of the roles granted any of the permissions over a resource, and all their descendants
+
+    :param name: Name of the CTE
+    :param n: Number of permissions: the query parameters are the resource, then the permissions
+    :rtype: str
+    """
+    return '''{name}(role) AS (
+        SELECT role FROM grants WHERE resource = ? AND permission IN ({marks})
+        UNION SELECT parents.role FROM parents JOIN {name} ON parents.parent = {name}.role
+    )'''.format(name=name, marks=', '.join(['?'] * n))
+
+
+#: Check that any of the roles has a permission. Inherited grants are only looked up when there's no direct grant
+_CHECK_ANY = '''
+SELECT EXISTS (SELECT 1 FROM grants WHERE role IN ({marks}) AND resource = ? AND permission = ?)
+    OR EXISTS (WITH RECURSIVE ancestors(role) AS (
+                   SELECT parent FROM parents WHERE role IN ({marks})
+                   UNION SELECT parent FROM parents JOIN ancestors USING (role)
+               )
+               SELECT 1 FROM grants WHERE role IN (SELECT role FROM ancestors) AND resource = ? AND permission = ?)
+'''
+
+#: Check that a role has a permission
+_CHECK = _CHECK_ANY.format(marks='?')
+
+
+class SqliteStorage(Storage):
+    """ Storage in an SQLite database
+
+        Roles, resources and permissions must be strings, numbers or bytes.
+        The storage can be used from several threads: queries are serialized.
+    """
+
+    def __init__(self, path=':memory:'):
+        """ Open the database, and create the tables if missing
+
+        :param path: Path to the database file. Default: in memory
+        :type path: str
+        """
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.executescript(_SCHEMA)
+
+    def close(self):
+        """ Close the database """
+        self._db.close()
+
+    def _query(self, sql, *args):
+        """ Run a query, and fetch all rows
+
+        :rtype: list(tuple)
+        """
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def _iter_query(self, sql, *args):
+        """ Run a query, and fetch the rows in batches, as they're iterated
+
+        :rtype: collections.Iterator(tuple)
+        """
+        with self._lock:
+            cursor = self._db.execute(sql, args)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(1000)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+
+    def _write(self, statements):
+        """ Run statements in a single transaction
+
+        :param statements: List of (sql, rows) for executemany()
+        """
+        with self._lock, self._db:
+            for sql, rows in statements:
+                self._db.executemany(sql, rows)
+
+    def get_roles(self):
+        return {role for role, in self._query('SELECT role FROM roles')}
+
+    def get_structure(self):
+        ret = {resource: set() for resource, in self._query('SELECT resource FROM resources')}
+        for resource, permission in self._query('SELECT resource, permission FROM permissions'):
+            ret[resource].add(permission)
+        return ret
+
+    def get_grants(self, role):
+        ret = {}
+        for resource, permission in self._query('SELECT resource, permission FROM grants WHERE role = ?', role):
+            ret.setdefault(resource, set()).add(permission)
+        return ret
+
+    def add_roles(self, roles):
+        self._write([('INSERT OR IGNORE INTO roles VALUES (?)', [(role,) for role in roles])])
+
+    def add(self, structure):
+        structure = list(structure.items())
+        self._write([
+            ('INSERT OR IGNORE INTO resources VALUES (?)', [(resource,) for resource, permissions in structure]),
+            ('INSERT OR IGNORE INTO permissions VALUES (?, ?)',
+             [(resource, permission) for resource, permissions in structure for permission in permissions]),
+        ])
+
+    def grant_many(self, grants):
+        grants = list(grants)
+        self._write([
+            ('INSERT OR IGNORE INTO roles VALUES (?)', [(role,) for role, resource, permission in grants]),
+            ('INSERT OR IGNORE INTO resources VALUES (?)', [(resource,) for role, resource, permission in grants]),
+            ('INSERT OR IGNORE INTO permissions VALUES (?, ?)',
+             [(resource, permission) for role, resource, permission in grants]),
+            ('INSERT OR IGNORE INTO grants VALUES (?, ?, ?)', grants),
+        ])
+
+    def revoke_many(self, grants):
+        grants = [(role, resource, permission) for role, resource, permission in grants]
+        self._write([('DELETE FROM grants WHERE role = ? AND resource = ? AND permission = ?', grants)])
+
+
+class SqliteAcl(SqliteStorage):
+    """ Acl stored in an SQLite database
+
+        Has the same API as `Acl`, and keeps nothing in memory:
+        use it for ACLs too large to be loaded into every process, or to persist them.
+
+        Grants are indexed both by (role, resource, permission) and by (resource, permission, role),
+        and bulk methods insert in a single transaction. Inherited grants are resolved with recursive queries,
+        and `which_*_any()` and `which_*_all()` are SQL unions and intersections.
+
+        Roles, resources and permissions must be strings, numbers or bytes.
+        Hierarchical resources, implied permissions, conditional grants and the changelog are not supported,
+        and there are no `view_*()` methods: use the `iter_*()` ones, which stream the rows.
+        It's also a `Storage`, so an `AsyncAcl` can use it.
+    """
+
+    #: Metrics of the calls, or None when not instrumented
+    _metrics = None
+
+    #: Log of the decisions of the checks, or None when not audited
+    _decisions = None
+
+    #region Add
+
+    def add_role(self, role, parents=None):
+        parents = set(parents or ())
+        if any(parent == role or role in self._ancestors([parent]) for parent in parents):
+            raise ValueError('Role {!r} can not inherit from itself'.format(role))
+        self._write([
+            ('INSERT OR IGNORE INTO roles VALUES (?)', [(role,)] + [(parent,) for parent in parents]),
+            ('INSERT OR IGNORE INTO parents VALUES (?, ?)', [(role, parent) for parent in parents]),
+        ])
+        return self
+
+    def add_roles(self, roles):
+        super(SqliteAcl, self).add_roles(roles)
+        return self
+
+    def add_resource(self, resource):
+        self._write([('INSERT OR IGNORE INTO resources VALUES (?)', [(resource,)])])
+        return self
+
+    def add_permission(self, resource, permission):
+        return self.add({resource: [permission]})
+
+    def add(self, structure):
+        super(SqliteAcl, self).add(structure)
+        return self
+
+    #endregion
+
+    #region Delete
+
+    def clear(self):
+        self._write([('DELETE FROM {}'.format(table), [()])
+                     for table in ('roles', 'resources', 'permissions', 'grants', 'parents')])
+        return self
+
+    def del_role(self, role):
+        return self.del_roles([role])
+
+    def del_roles(self, roles):
+        roles = [(role,) for role in roles]
+        self._write([
+            ('DELETE FROM roles WHERE role = ?', roles),
+            ('DELETE FROM grants WHERE role = ?', roles),
+            ('DELETE FROM parents WHERE role = ?', roles),
+            ('DELETE FROM parents WHERE parent = ?', roles),
+        ])
+        return self
+
+    def del_resource(self, resource):
+        self._write([
+            ('DELETE FROM {} WHERE resource = ?'.format(table), [(resource,)])
+            for table in ('resources', 'permissions', 'grants')
+        ])
+        return self
+
+    def del_permission(self, resource, permission):
+        self._write([
+            ('DELETE FROM {} WHERE resource = ? AND permission = ?'.format(table), [(resource, permission)])
+            for table in ('permissions', 'grants')
+        ])
+        return self
+
+    #endregion
+
+    #region Get
+
+    def get_resources(self):
+        return {resource for resource, in self._query('SELECT resource FROM resources')}
+
+    def get_permissions(self, resource):
+        return {permission for permission, in self._query(
+            'SELECT permission FROM permissions WHERE resource = ?', resource)}
+
+    def get_parents(self, role):
+        return {parent for parent, in self._query('SELECT parent FROM parents WHERE role = ?', role)}
+
+    def get(self):
+        return self.get_structure()
+
+    def _ancestors(self, roles):
+        """ Get the roles and all their ancestors
+
+        :rtype: set
+        """
+        roles = list(roles)
+        return {role for role, in self._query(
+            'WITH RECURSIVE {} SELECT role FROM effective'.format(_effective('effective', len(roles))), *roles)}
+
+    #endregion
+
+    #region Grant Permissions
+
+    def grant(self, role, resource, permission):
+        return self.grant_many([(role, resource, permission)])
+
+    def grants(self, grants):
+        self.add_roles(grants)
+        self.add({resource: () for resources in grants.values() for resource in resources})
+        return self.grant_many(
+            (role, resource, permission)
+            for role, resources in grants.items()
+            for resource, permissions in resources.items()
+            for permission in permissions
+        )
+
+    def grant_many(self, grants):
+        super(SqliteAcl, self).grant_many(grants)
+        return self
+
+    def revoke(self, role, resource, permission):
+        return self.revoke_many([(role, resource, permission)])
+
+    def revoke_many(self, grants):
+        super(SqliteAcl, self).revoke_many(grants)
+        return self
+
+    def revoke_all(self, role, resource=None):
+        if resource is None:
+            self._write([('DELETE FROM grants WHERE role = ?', [(role,)])])
+        else:
+            self._write([('DELETE FROM grants WHERE role = ? AND resource = ?', [(role, resource)])])
+        return self
+
+    #endregion
+
+    #region Check
+
+    def check(self, role, resource, permission):
+        return bool(self._query(_CHECK, role, resource, permission, role, resource, permission)[0][0])
+
+    def check_any(self, roles, resource, permission):
+        roles = list(roles)
+        if not roles:
+            return False
+        return bool(self._query(_CHECK_ANY.format(marks=', '.join(['?'] * len(roles))),
+                                *(roles + [resource, permission]) * 2)[0][0])
+
+    def check_all(self, roles, resource, permission):
+        roles = list(roles)
+        if not roles:
+            return False
+        return bool(self._query(
+            'WITH RECURSIVE {} SELECT {}'.format(
+                ', '.join(_effective('e{}'.format(i), 1) for i in range(len(roles))),
+                ' AND '.join('''EXISTS (SELECT 1 FROM grants
+                                       WHERE role IN (SELECT role FROM e{}) AND resource = ? AND permission = ?)
+                             '''.format(i) for i in range(len(roles)))),
+            *(roles + [resource, permission] * len(roles)))[0][0])
+
+    def check_many(self, roles, resources, permissions):
+        return [self.check(*grant) for grant in zip(roles, resources, permissions)]
+
+    #endregion
+
+    #region Show Grants
+
+    def _which(self, columns, roles, resource, operator):
+        """ Query the effective grants of roles, combined with a set operator
+
+        :param columns: Columns to select
+        :param roles: The roles
+        :param resource: Only the grants over this resource, or None
+        :param operator: 'UNION' or 'INTERSECT'
+        :rtype: list(tuple)
+        """
+        roles = list(roles)
+        if not roles:
+            return []
+        condition = '' if resource is None else ' AND resource = ?'
+        return self._query(
+            'WITH RECURSIVE {} {}'.format(
+                ', '.join(_effective('e{}'.format(i), 1) for i in range(len(roles))),
+                ' {} '.format(operator).join(
+                    'SELECT {} FROM grants WHERE role IN (SELECT role FROM e{}){}'.format(columns, i, condition)
+                    for i in range(len(roles)))),
+            *(roles + ([] if resource is None else [resource] * len(roles))))
+
+    def which_permissions(self, role, resource):
+        return self.which_permissions_any([role], resource)
+
+    def which_permissions_any(self, roles, resource):
+        if not roles:
+            return {}
+        return {permission for permission, in self._which('permission', roles, resource, 'UNION')}
+
+    def which_permissions_all(self, roles, resource):
+        if not roles:
+            return {}
+        return {permission for permission, in self._which('permission', roles, resource, 'INTERSECT')}
+
+    def which(self, role):
+        return self.which_any([role])
+
+    def which_any(self, roles):
+        ret = {}
+        for resource, permission in self._which('resource, permission', roles, None, 'UNION'):
+            ret.setdefault(resource, set()).add(permission)
+        return ret
+
+    def which_all(self, roles):
+        ret = {}
+        for resource, permission in self._which('resource, permission', roles, None, 'INTERSECT'):
+            ret.setdefault(resource, set()).add(permission)
+        return ret
+
+    def show(self):
+        ret = {}
+        for role, resource, permission in self._query('SELECT role, resource, permission FROM grants'):
+            ret.setdefault(role, {}).setdefault(resource, set()).add(permission)
+        return ret
+
+    def who(self, resource, permission):
+        return self.who_any(resource, [permission])
+
+    def who_any(self, resource, permissions):
+        permissions = list(permissions)
+        if not permissions:
+            return set()
+        return {role for role, in self._query(
+            'WITH RECURSIVE {} SELECT role FROM heirs'.format(_heirs('heirs', len(permissions))),
+            resource, *permissions)}
+
+    def who_all(self, resource, permissions):
+        permissions = list(permissions)
+        if not permissions:
+            return set()
+        return {role for role, in self._query(
+            'WITH RECURSIVE {} {}'.format(
+                ', '.join(_heirs('h{}'.format(i), 1) for i in range(len(permissions))),
+                ' INTERSECT '.join('SELECT role FROM h{}'.format(i) for i in range(len(permissions)))),
+            *[arg for permission in permissions for arg in (resource, permission)])}
+
+    def resources_with(self, permission):
+        return {resource for resource, in self._query(
+            'SELECT DISTINCT resource FROM grants WHERE permission = ?', permission)}
+
+    def iter_grants(self, role=None, resource=None, permission=None):
+        filters = [(column, value)
+                   for column, value in zip(('role', 'resource', 'permission'), (role, resource, permission))
+                   if value is not None]
+        where = ' AND '.join('{} = ?'.format(column) for column, value in filters)
+        return self._iter_query('SELECT role, resource, permission FROM grants' + (' WHERE ' + where if where else ''),
+                                *[value for column, value in filters])
+
+    def iter_which(self, role):
+        return self._iter_query(
+            'WITH RECURSIVE {} SELECT DISTINCT resource, permission FROM grants '
+            'WHERE role IN (SELECT role FROM effective)'.format(_effective('effective', 1)), role)
+
+    #endregion
+
+    #region Instrumentation & Audit
+
+    instrument = vars(Acl)['instrument']
+    uninstrument = vars(Acl)['uninstrument']
+    audit = vars(Acl)['audit']
+    unaudit = vars(Acl)['unaudit']
+
+    def _cardinality(self):
+        return self._query('SELECT (SELECT COUNT(*) FROM roles), (SELECT COUNT(*) FROM resources), '
+                           '(SELECT COUNT(*) FROM grants)')[0]
+
+    #endregion
+
+    #region Export & Import
+
+    def freeze(self):
+        """ Load the Acl into memory, as an immutable snapshot
+
+        :rtype: miracle.frozen.FrozenAcl
+        """
+        return Acl().__setstate__(self.__getstate__()).freeze()
+
+    def __getstate__(self):
+        state = {
+            'roles': self.get_roles(),
+            'struct': self.get(),
+            'grants': self.show(),
+        }
+        parents = {}
+        for role, parent in self._query('SELECT role, parent FROM parents'):
+            parents.setdefault(role, set()).add(parent)
+        if parents:
+            state['parents'] = parents
+        return state
+
+    def __setstate__(self, state):
+        unsupported = set(state) & {'separator', 'implied', 'conditions'}
+        if unsupported:
+            raise ValueError('SqliteAcl does not support: {}'.format(', '.join(sorted(unsupported))))
+        if not hasattr(self, '_db'):
+            self.__init__()
+        self.add_roles(state['roles'])
+        for role, parents in state.get('parents', {}).items():
+            self.add_role(role, parents)
+        self.add(state['struct'])
+        self.grants(state['grants'])
+        return self
+
+    def dumps(self):
+        """ Export the Acl into the compact binary string of `Acl.dumps()`
+
+        :rtype: bytes
+        """
+        return Acl().__setstate__(self.__getstate__()).dumps()
+
+    @classmethod
+    def loads(cls, data, path=':memory:'):
+        """ Load an Acl from the binary string made by `dumps()`
+
+        :param data: The result of `dumps()`
+        :type data: bytes
+        :param path: The database to load it into
+        :type path: str
+        :rtype: SqliteAcl
+        :raises ValueError: Unsupported format, or features
+        """
+        return cls(path).__setstate__(Acl.loads(data).__getstate__())
+
+    def dump(self, file):
+        """ Export the Acl into a binary file. See `dumps()`
+
+        :param file: File object, opened for writing in binary mode
+        """
+        file.write(self.dumps())
+
+    @classmethod
+    def load(cls, file, path=':memory:'):
+        """ Load an Acl from a binary file made by `dump()`
+
+        :param file: File object, opened for reading in binary mode
+        :param path: The database to load it into
+        :type path: str
+        :rtype: SqliteAcl
+        """
+        return cls.loads(file.read(), path)
+
+    #endregion
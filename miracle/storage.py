@@ -0,0 +1,109 @@
+class Storage(object):
+    """ Storage of Acl data: roles, resources & permissions, and grants
+
+        Grants are read one role at a time, so that a backend only serves the roles in use.
+        Implementations override all the methods; see `MemoryStorage` and `miracle.sqlite.SqliteStorage`.
+        Use it with `miracle.aio.AsyncAcl`.
+    """
+
+    def get_roles(self):
+        """ Get the set of roles
+
+        :rtype: set
+        """
+        raise NotImplementedError()
+
+    def get_structure(self):
+        """ Get the resources and their permissions: { resource: set(permission) }
+
+        :rtype: dict
+        """
+        raise NotImplementedError()
+
+    def get_grants(self, role):
+        """ Get the grants of a role: { resource: set(permission) }
+
+        :rtype: dict
+        """
+        raise NotImplementedError()
+
+    def add_roles(self, roles):
+        """ Define roles
+
+        :type roles: collections.Iterable
+        """
+        raise NotImplementedError()
+
+    def add(self, structure):
+        """ Define resources and permissions
+
+        :param structure: { resource: permissions }
+        :type structure: dict
+        """
+        raise NotImplementedError()
+
+    def grant_many(self, grants):
+        """ Store grants. Missing roles, resources and permissions are defined.
+
+        :param grants: Iterable of (role, resource, permission)
+        :type grants: collections.Iterable
+        """
+        raise NotImplementedError()
+
+    def revoke_many(self, grants):
+        """ Remove grants. Missing grants are ignored.
+
+        :param grants: Iterable of (role, resource, permission)
+        :type grants: collections.Iterable
+        """
+        raise NotImplementedError()
+
+
+class MemoryStorage(Storage):
+    """ Storage in memory
+
+        The default storage: handy for tests, or to put an async front on data that fits in memory.
+    """
+
+    def __init__(self):
+        #: Set of roles
+        self._roles = set()
+
+        #: Resources & Permissions: { resource: set(permission) }
+        self._structure = {}
+
+        #: Grants: { role: { resource: set(permission) } }
+        self._grants = {}
+
+    def get_roles(self):
+        return set(self._roles)
+
+    def get_structure(self):
+        return {resource: set(permissions) for resource, permissions in self._structure.items()}
+
+    def get_grants(self, role):
+        return {resource: set(permissions) for resource, permissions in self._grants.get(role, {}).items()}
+
+    def add_roles(self, roles):
+        self._roles.update(roles)
+
+    def add(self, structure):
+        for resource, permissions in structure.items():
+            self._structure.setdefault(resource, set()).update(permissions)
+
+    def grant_many(self, grants):
+        for role, resource, permission in grants:
+            self._roles.add(role)
+            self._structure.setdefault(resource, set()).add(permission)
+            self._grants.setdefault(role, {}).setdefault(resource, set()).add(permission)
+
+    def revoke_many(self, grants):
+        for role, resource, permission in grants:
+            permissions = self._grants.get(role, {}).get(resource)
+            if permissions is None:
+                continue
+            permissions.discard(permission)
+            if not permissions:
+                del self._grants[role][resource]
+                if not self._grants[role]:
+                    del self._grants[role]
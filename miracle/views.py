@@ -0,0 +1,99 @@
+try:
+    from collections.abc import Mapping, Set
+except ImportError:  # Python 2
+    from collections import Mapping, Set
+
+
+class SetView(Set):
+    """ Read-only view of a set
+
+        Nothing is copied: the view follows the changes of the set.
+    """
+    __slots__ = ('_set',)
+
+    def __init__(self, values):
+        self._set = values
+
+    def __contains__(self, value):
+        return value in self._set
+
+    def __iter__(self):
+        return iter(self._set)
+
+    def __len__(self):
+        return len(self._set)
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, set(self._set))
+
+
+class MaskView(Set):
+    """ Read-only view of the permissions of a bitmask
+
+        Permissions are only decoded when iterated.
+    """
+    __slots__ = ('_bits', '_perms', '_mask')
+
+    def __init__(self, bits, perms, mask):
+        """
+        :param bits: Bit positions of the permissions of the resource: { permission: bit }
+        :param perms: Permissions of the resource by bit position: [permission|None]
+        :param mask: The bitmask
+        :type mask: int
+        """
+        self._bits = bits
+        self._perms = perms
+        self._mask = mask
+
+    def __contains__(self, permission):
+        bit = self._bits.get(permission)
+        return bit is not None and self._mask >> bit & 1 == 1
+
+    def __iter__(self):
+        perms = self._perms
+        mask = self._mask
+        while mask:
+            low = mask & -mask
+            yield perms[low.bit_length() - 1]
+            mask ^= low
+
+    def __len__(self):
+        return bin(self._mask).count('1')
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, set(self))
+
+
+class MappingView(Mapping):
+    """ Read-only view of a dict, with views of its values
+
+        Nothing is copied: the view follows the changes of the dict.
+    """
+    __slots__ = ('_mapping', '_view')
+
+    def __init__(self, mapping, view):
+        """
+        :param mapping: The dict
+        :type mapping: dict
+        :param view: Make the view of a value: view(key, value)
+        :type view: callable
+        """
+        self._mapping = mapping
+        self._view = view
+
+    def __getitem__(self, key):
+        if key not in self._mapping:  # do not let a defaultdict add it
+            raise KeyError(key)
+        return self._view(key, self._mapping[key])
+
+    def __contains__(self, key):
+        return key in self._mapping
+
+    def __iter__(self):
+        return iter(self._mapping)
+
+    def __len__(self):
+        return len(self._mapping)
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, dict(self.items()))
@@ -1,11 +1,18 @@
+import io
+import pickle
 import unittest
+
 import miracle
 
 
 class TestAclStructure(unittest.TestCase):
+    Acl = miracle.Acl
+    ChangelogAcl = staticmethod(lambda: miracle.Acl(changelog=True))
+    PathAcl = staticmethod(lambda: miracle.Acl(separator='/'))
+
     def test_roles(self):
         """ add_role(), add_roles(), list_roles(), del_role() """
-        acl = miracle.Acl()
+        acl = self.Acl()
 
         # Add roles
         acl.add_role('root')
@@ -28,7 +35,7 @@ class TestAclStructure(unittest.TestCase):
 
     def test_resources(self):
         """ add_resource(), list_resource(), del_resource() """
-        acl = miracle.Acl()
+        acl = self.Acl()
 
         # Add resources
         acl.add_resource('user')
@@ -50,7 +57,7 @@ class TestAclStructure(unittest.TestCase):
 
     def test_permissions(self):
         """ add_permission(), list_permissions(), del_permission() """
-        acl = miracle.Acl()
+        acl = self.Acl()
 
         # Add permissions
         acl.add_permission('user', 'create') # silently creates a resource
@@ -86,7 +93,7 @@ class TestAclStructure(unittest.TestCase):
 
     def test_structure(self):
         """ add(), list() """
-        acl = miracle.Acl()
+        acl = self.Acl()
 
         # Add
         acl.add({
@@ -129,7 +136,7 @@ class TestAclStructure(unittest.TestCase):
 
     def test_grant(self):
         """ grant(), grants(), revoke(), revoke_all(), show() """
-        acl = miracle.Acl()
+        acl = self.Acl()
         acl.grant('root', '/admin', 'enter')
         acl.grant('root', '/admin', 'enter') # dupe
         acl.grant('root', '/article', 'edit')
@@ -180,7 +187,7 @@ class TestAclStructure(unittest.TestCase):
 
     def test_check(self):
         """ check(), check_any(), check_all() ; which(), which_any(), which_all() """
-        acl = miracle.Acl()
+        acl = self.Acl()
         acl.grant('root',   '/admin',   'enter')
         acl.grant('admin',  '/admin',   'enter')
         acl.grant('root',   '/user',    'edit')
@@ -265,9 +272,46 @@ class TestAclStructure(unittest.TestCase):
         self.assertFalse(acl.check_all(['root','admin'], '/user', 'delete'))
         self.assertTrue(acl.check_all(['root','admin'], '/user', 'edit'))
 
+    def test_check_denied(self):
+        """ check_any() and check_all() agree with check(), after changes, and with inheritance """
+        acl = self.Acl()
+        acl.grants({
+            'root': {'/admin': ['enter'], '/user': ['show', 'edit', 'delete']},
+            'admin': {'/admin': ['enter'], '/user': ['show', 'edit']},
+            'user': {'/user': ['show']},
+        })
+        acl.add_role('nobody')
+        role_sets = [['???'], ['nobody'], ['root'], ['root', 'user'], ('admin', 'user'), {'user', 'nobody', '???'},
+                     ['root', 'admin', 'user', 'super']]
+
+        def verify(acl):
+            for resource in ['/admin', '/user', '/???']:
+                for permission in ['enter', 'show', 'edit', 'delete', '???']:
+                    for roles in role_sets:
+                        checks = [acl.check(role, resource, permission) for role in roles]
+                        self.assertEqual(acl.check_any(roles, resource, permission), any(checks))
+                        self.assertEqual(acl.check_all(roles, resource, permission), all(checks))
+
+        verify(acl)
+        acl.revoke('root', '/user', 'delete')
+        acl.del_permission('/user', 'edit')
+        verify(acl)
+        self.assertFalse(acl.check_any(['root', 'admin'], '/user', 'delete'))
+        self.assertFalse(acl.check_any(['root', 'admin'], '/user', 'edit'))
+
+        acl.add_role('super', ['admin'])
+        verify(acl)
+        self.assertTrue(acl.check_any(['???', 'super'], '/admin', 'enter'))
+        self.assertTrue(acl.check_all(['super', 'admin'], '/admin', 'enter'))
+        verify(acl.freeze())
+
+        acl.del_resource('/admin')
+        verify(acl)
+        self.assertFalse(acl.check_any(['super', 'root'], '/admin', 'enter'))
+
     def test_pickle(self):
         """ __getstate__(), __setstate__() """
-        acl = miracle.Acl()
+        acl = self.Acl()
         acl.grant('root',   '/admin',   'enter')
         acl.grant('user',   '/user',   'show')
         acl.grant('author',   '/article',   'post')
@@ -286,7 +330,7 @@ class TestAclStructure(unittest.TestCase):
             }
         })
 
-        acl2 = miracle.Acl()
+        acl2 = self.Acl()
         acl2.__setstate__(acl.__getstate__())
 
         self.assertDictEqual(
@@ -295,8 +339,8 @@ class TestAclStructure(unittest.TestCase):
         )
 
     def test_del(self):
-        """ del_*() does not remove grants """
-        acl = miracle.Acl()
+        """ del_*() removes the grants of what they delete, and only those """
+        acl = self.Acl()
         acl.grants({
             'root': {
                 'a': ['anything'],
@@ -308,6 +352,9 @@ class TestAclStructure(unittest.TestCase):
             'nobody': {
                 'a': {'nothing'},
                 'c': {'nothing'}
+            },
+            'user': {
+                'b': {'anything'},
             }
         })
 
@@ -321,5 +368,681 @@ class TestAclStructure(unittest.TestCase):
             },
             'nobody': {
                 'a': {'nothing'}
+            },
+            'user': {
+                'b': {'anything'},  # other resources keep the permission
             }
         })
+
+        # A role with several permissions over the resource, and no other grants
+        acl.grant('guest', 'd', 'x')
+        acl.grant('guest', 'd', 'y')
+        acl.del_resource('d')
+        self.assertDictEqual(acl.which('guest'), {})
+
+    def test_indexes(self):
+        """ Grant indexes follow grant(), revoke() and del_*() """
+        acl = self.Acl()
+        acl.grants({
+            'root': {'a': ['read', 'write'], 'b': ['read']},
+            'user': {'a': ['read']},
+        })
+
+        read, write = 1 << acl._bits['a']['read'], 1 << acl._bits['a']['write']
+        self.assertDictEqual(acl._role_grants, {
+            'root': {'a': read | write, 'b': 1},
+            'user': {'a': read},
+        })
+        self.assertDictEqual(acl._resource_grants, {
+            'a': {'read': {'root', 'user'}, 'write': {'root'}},
+            'b': {'read': {'root'}},
+        })
+
+        # Empty entries are dropped
+        acl.revoke('root', 'b', 'read')
+        acl.del_permission('a', 'write')
+        acl.revoke_all('user')
+
+        self.assertDictEqual(acl._role_grants, {'root': {'a': read}})
+        self.assertDictEqual(acl._resource_grants, {'a': {'read': {'root'}}})
+        self.assertSetEqual(acl._grants, {('root', 'a', 'read')})
+
+        # The freed bit is reused
+        acl.grant('user', 'a', 'delete')
+        self.assertEqual(1 << acl._bits['a']['delete'], write)
+        self.assertEqual(acl.which_permissions('user', 'a'), {'delete'})
+        self.assertEqual(acl.which_permissions('root', 'a'), {'read'})
+
+    def test_bulk(self):
+        """ grant_many(), revoke_many(), del_roles() """
+        acl = self.Acl()
+        acl.grant_many([
+            ('root', '/admin', 'enter'),
+            ('root', '/admin', 'enter'),  # dupe
+            ('root', '/user', 'edit'),
+            ('user', '/user', 'show'),
+            ('guest', '/user', 'show'),
+        ])
+
+        # Structure
+        self.assertSetEqual(acl.get_roles(), {'root', 'user', 'guest'})
+        self.assertDictEqual(acl.get(), {
+            '/admin': {'enter'},
+            '/user': {'edit', 'show'},
+        })
+
+        # Grants
+        self.assertDictEqual(acl.show(), {
+            'root': {'/admin': {'enter'}, '/user': {'edit'}},
+            'user': {'/user': {'show'}},
+            'guest': {'/user': {'show'}},
+        })
+
+        # Malformed grants: nothing is granted
+        def failing():
+            yield ('nobody', '/user', 'show')
+            raise RuntimeError()
+        self.assertRaises(ValueError, acl.grant_many, [('nobody', '/user', 'show'), ('nobody',)])
+        self.assertRaises(RuntimeError, acl.grant_many, failing())
+        self.assertFalse(acl.check('nobody', '/user', 'show'))
+        self.assertNotIn('nobody', acl.get_roles())
+
+        # revoke_many()
+        acl.revoke_many([
+            ('root', '/user', 'edit'),
+            ('root', '/user', 'edit'),  # dupe
+            ('???', '/user', 'edit'),  # missing
+        ])
+        self.assertRaises(ValueError, acl.revoke_many, [('user', '/user', 'show'), ('user',)])
+        self.assertTrue(acl.check('user', '/user', 'show'))
+        self.assertDictEqual(acl.which('root'), {'/admin': {'enter'}})
+
+        # del_roles()
+        acl.del_roles(['root', 'guest', '???'])
+        self.assertSetEqual(acl.get_roles(), {'user'})
+        self.assertDictEqual(acl.show(), {
+            'user': {'/user': {'show'}},
+        })
+
+    def test_check_many(self):
+        """ check_many() """
+        acl = self.Acl()
+        acl.grant('root', '/admin', 'enter')
+        acl.grant('root', '/user', 'edit')
+        acl.grant('user', '/user', 'show')
+
+        self.assertEqual(acl.check_many([], [], []), [])
+        self.assertEqual(
+            acl.check_many(
+                ['root', 'root', 'user', 'user', '???', 'root'],
+                ['/admin', '/user', '/user', '/admin', '/user', '/???'],
+                ['enter', 'edit', 'show', 'enter', 'show', 'enter'],
+            ),
+            [True, True, True, False, False, False]
+        )
+
+        # Same role & permission for many resources
+        from itertools import repeat
+        self.assertEqual(
+            acl.check_many(repeat('root'), ['/admin', '/user', '/???'], repeat('enter')),
+            [True, False, False]
+        )
+
+    def test_inheritance(self):
+        """ add_role(parents), get_parents() """
+        acl = self.Acl()
+        acl.grants({
+            'guest': {'/page': ['view']},
+            'user': {'/page': ['comment'], '/profile': ['edit']},
+            'editor': {'/page': ['edit']},
+        })
+        acl.add_role('user', ['guest'])
+        acl.add_role('admin', ['user', 'editor'])
+        acl.add_role('root', ['admin'])
+
+        # Structure
+        self.assertSetEqual(acl.get_parents('admin'), {'user', 'editor'})
+        self.assertSetEqual(acl.get_parents('guest'), set())
+        self.assertSetEqual(acl.get_roles(), {'guest', 'user', 'editor', 'admin', 'root'})
+        self.assertRaises(ValueError, acl.add_role, 'guest', ['root'])  # cycle
+        self.assertRaises(ValueError, acl.add_role, 'guest', ['guest'])  # cycle
+        self.assertRaises(ValueError, acl.add_role, 'self', ['self'])
+        self.assertNotIn('self', acl.get_roles())  # nothing changed
+
+        # Inherited grants
+        self.assertTrue(acl.check('root', '/page', 'view'))
+        self.assertTrue(acl.check('root', '/page', 'edit'))
+        self.assertFalse(acl.check('user', '/page', 'edit'))
+        self.assertTrue(acl.check_any(['guest', 'user'], '/profile', 'edit'))
+        self.assertTrue(acl.check_all(['root', 'user'], '/page', 'view'))
+        self.assertFalse(acl.check_all(['root', 'user'], '/page', 'edit'))
+        self.assertEqual(acl.check_many(['root', 'guest'], ['/profile'] * 2, ['edit'] * 2), [True, False])
+        self.assertEqual(acl.which_permissions('admin', '/page'), {'view', 'comment', 'edit'})
+        self.assertEqual(acl.which_permissions_all(['user', 'editor'], '/page'), set())
+        self.assertEqual(acl.which_permissions_any(['user', 'editor'], '/page'), {'view', 'comment', 'edit'})
+        self.assertDictEqual(acl.which('root'), {'/page': {'view', 'comment', 'edit'}, '/profile': {'edit'}})
+        self.assertDictEqual(acl.which_all(['root', 'user']), acl.which('user'))
+
+        # show() only has the direct grants
+        self.assertNotIn('root', acl.show())
+
+        # Changes propagate
+        acl.grant('guest', '/page', 'vote')
+        self.assertTrue(acl.check('root', '/page', 'vote'))
+        acl.revoke('guest', '/page', 'vote')
+        self.assertFalse(acl.check('root', '/page', 'vote'))
+        acl.del_permission('/page', 'edit')
+        self.assertFalse(acl.check('root', '/page', 'edit'))
+        acl.grant('root', '/page', 'edit')
+        self.assertTrue(acl.check('root', '/page', 'edit'))
+
+        # Deleting a role breaks the inheritance
+        acl.del_role('user')
+        self.assertSetEqual(acl.get_parents('admin'), {'editor'})
+        self.assertFalse(acl.check('root', '/page', 'view'))
+        self.assertTrue(acl.check('root', '/page', 'edit'))
+
+        # Pickle
+        acl2 = self.Acl()
+        acl2.__setstate__(acl.__getstate__())
+        self.assertDictEqual(acl2.__getstate__(), acl.__getstate__())
+        self.assertSetEqual(acl2.get_parents('root'), {'admin'})
+        self.assertDictEqual(acl2.which('root'), acl.which('root'))
+
+    def test_dumps(self):
+        """ dumps(), loads(), dump(), load(), pickle """
+        acl = self.Acl()
+        acl.add_role('nobody')
+        acl.add_resource('/empty')
+        acl.grants({
+            'root': {'/admin': ['enter', 'kill'], '/user': ['show', 'edit', 'delete']},
+            'user': {'/user': ['show'], '/wide': ['p{}'.format(i) for i in range(100)]},
+        })
+        acl.add_role('admin', ['user'])
+        acl.add_permission('/user', 'create')
+        acl.revoke_all('root', '/admin')
+        acl.del_permission('/user', 'edit')  # a hole in the bits
+
+        def assertSameAcl(acl2):
+            self.assertIsInstance(acl2, acl.__class__)
+            self.assertDictEqual(acl2.__getstate__(), acl.__getstate__())
+            self.assertDictEqual(acl2.which('admin'), acl.which('admin'))
+            self.assertTrue(acl2.check('user', '/wide', 'p99'))
+            self.assertFalse(acl2.check('root', '/user', 'edit'))
+
+            # Still usable
+            acl2.grant('root', '/user', 'edit')
+            acl2.grant('root', '/user', 'vote')
+            self.assertEqual(acl2.which_permissions('root', '/user'), {'show', 'edit', 'delete', 'vote'})
+            acl2.del_role('root')
+            expected = acl.show()
+            del expected['root']
+            self.assertDictEqual(acl2.show(), expected)
+
+        assertSameAcl(acl.loads(acl.dumps()))
+        assertSameAcl(pickle.loads(pickle.dumps(acl)))
+
+        f = io.BytesIO()
+        acl.dump(f)
+        f.seek(0)
+        assertSameAcl(acl.load(f))
+
+        self.assertRaises(ValueError, acl.loads, pickle.dumps((0,)))
+
+        # Pickles keep the options
+        self.assertEqual(pickle.loads(pickle.dumps(miracle.Acl(cache_size=10)))._cache_size, 10)
+
+    def test_changelog(self):
+        """ changes_since(), apply_changes() """
+        acl = self.ChangelogAcl()
+        replica = self.Acl()
+        self.assertRaises(ValueError, replica.changes_since, 0)  # disabled
+
+        acl.add_role('user')
+        acl.add_role('admin', parents=iter(['user']))
+        acl.add({'/blog': ['post', 'view']})
+        acl.grant('user', '/blog', 'view')
+        acl.grant_many(grant for grant in [('admin', '/blog', 'post'), ('admin', '/page', 'edit')])
+        acl.revoke('admin', '/page', 'edit')
+
+        # Nested calls are not recorded
+        self.assertEqual(acl.get_version(), 6)
+        changes = acl.changes_since(0)
+        self.assertEqual([(version, name) for version, name, kwargs in changes], [
+            (1, 'add_role'), (2, 'add_role'), (3, 'add'), (4, 'grant'), (5, 'grant_many'), (6, 'revoke'),
+        ])
+        self.assertEqual(acl.changes_since(4), changes[4:])
+        self.assertEqual(acl.changes_since(6), [])
+
+        def assertSameAcl():
+            self.assertEqual(replica.get_version(), acl.get_version())
+            self.assertDictEqual(replica.__getstate__(), acl.__getstate__())
+            self.assertDictEqual(replica.which('admin'), acl.which('admin'))
+
+        # Apply, twice
+        replica.apply_changes(pickle.loads(pickle.dumps(changes)))
+        assertSameAcl()
+        replica.apply_changes(changes)
+        assertSameAcl()
+
+        # Catch up. Failed calls change nothing, and are not recorded
+        self.assertRaises(ValueError, acl.add_role, 'admin', ['admin'])
+        self.assertRaises(ValueError, acl.add_role, 'editor', ['editor'])
+        self.assertRaises(ValueError, acl.grant_many, [('editor', '/blog', 'view'), ('editor',)])
+        self.assertRaises(ValueError, acl.revoke_many, [('user', '/blog', 'view'), ('user',)])
+        self.assertEqual(acl.get_version(), 6)
+        acl.grants({'root': {'/admin': ['enter']}})
+        acl.del_permission('/blog', 'view')
+        acl.revoke_all('admin')
+        acl.del_role('user')
+        acl.del_resource('/page')
+        replica.apply_changes(acl.changes_since(replica.get_version()))
+        assertSameAcl()
+
+        # Version survives dumps(), and pickles keep recording
+        self.assertEqual(miracle.Acl.loads(acl.dumps()).get_version(), acl.get_version())
+        copy = pickle.loads(pickle.dumps(acl))
+        self.assertEqual(copy.get_version(), acl.get_version())
+        copy.add_role('guest')
+        self.assertEqual(copy.changes_since(acl.get_version())[0][1:], ('add_role', {'role': 'guest', 'parents': None}))
+        self.assertRaises(ValueError, copy.changes_since, 0)  # the changelog starts empty
+
+        # Errors
+        self.assertRaises(ValueError, replica.apply_changes, [(100, 'grant', {})])
+        self.assertRaises(ValueError, replica.apply_changes, [(replica.get_version() + 1, 'check', {})])
+
+        # Bounded changelog
+        acl = miracle.Acl(changelog=2)
+        acl.grant('a', 'b', 'c').grant('a', 'b', 'd').grant('a', 'b', 'e')
+        self.assertRaises(ValueError, acl.changes_since, 0)
+        self.assertEqual(len(acl.changes_since(1)), 2)
+
+    def test_implied(self):
+        """ '*' permission, add_implied() """
+        acl = self.Acl()
+        acl.add({'page': ['read', 'write', 'delete']})
+        acl.add_implied('write', ['read'])
+        acl.add_implied('delete', ['write'])
+        self.assertSetEqual(acl.get_implied('delete'), {'write'})
+        self.assertSetEqual(acl.get_implied('read'), set())
+
+        acl.grant('admin', 'page', '*')
+        acl.grant('editor', 'page', 'delete')
+        acl.grant('user', 'page', 'read')
+        acl.add_role('chief', ['editor'])
+
+        # Check
+        self.assertTrue(acl.check('admin', 'page', 'delete'))
+        self.assertTrue(acl.check('editor', 'page', 'read'))  # recursively
+        self.assertTrue(acl.check('chief', 'page', 'read'))
+        self.assertFalse(acl.check('user', 'page', 'write'))
+        self.assertTrue(acl.check_all(['admin', 'editor', 'chief'], 'page', 'read'))
+        self.assertTrue(acl.check_any(['user', 'editor'], 'page', 'write'))
+        self.assertEqual(acl.check_many(['admin', 'user'], ['page', 'page'], ['write', 'write']), [True, False])
+
+        # Show
+        self.assertSetEqual(acl.which_permissions('editor', 'page'), {'read', 'write', 'delete'})
+        self.assertSetEqual(acl.which_permissions_all(['editor', 'user'], 'page'), {'read'})
+        self.assertDictEqual(acl.which('admin'), {'page': {'*', 'read', 'write', 'delete'}})
+        self.assertDictEqual(acl.show(), {
+            'admin': {'page': {'*'}},
+            'editor': {'page': {'delete'}},
+            'user': {'page': {'read'}},
+        })
+
+        # '*' covers permissions defined later
+        acl.add_permission('page', 'publish')
+        acl.grant('user', 'page', 'comment')
+        self.assertTrue(acl.check('admin', 'page', 'publish'))
+        self.assertTrue(acl.check('admin', 'page', 'comment'))
+
+        # Implications declared later
+        acl.add_implied('read', ['comment'])
+        self.assertTrue(acl.check('chief', 'page', 'comment'))
+
+        # Reverse lookups
+        self.assertSetEqual(acl.who('page', 'write'), {'admin', 'editor', 'chief'})
+        self.assertSetEqual(acl.who('page', 'comment'), {'admin', 'editor', 'chief', 'user'})
+        self.assertSetEqual(acl.who('page', 'publish'), {'admin'})
+        acl.grant('user', 'book', 'delete')
+        self.assertSetEqual(acl.resources_with('read'), {'page', 'book'})
+        self.assertSetEqual(acl.resources_with('publish'), {'page'})
+        acl.revoke('user', 'book', 'delete')
+
+        # Copies
+        for copy in (acl.loads(acl.dumps()), pickle.loads(pickle.dumps(acl)), acl.freeze()):
+            self.assertTrue(copy.check('chief', 'page', 'comment'))
+            self.assertSetEqual(copy.which_permissions('admin', 'page'),
+                                {'*', 'read', 'write', 'delete', 'publish', 'comment'})
+
+        # Revoke
+        acl.revoke('editor', 'page', 'delete')
+        self.assertFalse(acl.check('chief', 'page', 'read'))
+        acl.del_permission('page', '*')
+        self.assertFalse(acl.check('admin', 'page', 'read'))
+
+        # Deleting a permission that granted permissions imply keeps it
+        acl.add_implied('approve', ['review'])
+        acl.grant('manager', 'doc', 'approve')
+        acl.del_permission('doc', 'review')
+        self.assertTrue(acl.check('manager', 'doc', 'review'))
+        acl.add_permission('doc', 'review')
+        acl.grant('reviewer', 'doc', 'review')
+        acl.revoke('reviewer', 'doc', 'review')
+        self.assertTrue(acl.check('manager', 'doc', 'review'))
+        self.assertSetEqual(acl.which_permissions('manager', 'doc'), {'approve', 'review'})
+        for copy in (acl.loads(acl.dumps()), pickle.loads(pickle.dumps(acl))):
+            self.assertTrue(copy.check('manager', 'doc', 'review'))
+
+    def test_conditions(self):
+        """ Conditional grants, check(context=) """
+        acl = self.Acl()
+        acl.grant('author', 'post', 'view')
+        acl.grant('author', 'post', 'edit', condition='user == author')
+        acl.grant('user', 'post', 'comment', condition=lambda context: not context['locked'])
+        acl.add_role('editor', ['author'])
+
+        own = {'user': 1, 'author': 1, 'locked': False}
+        other = {'user': 1, 'author': 2, 'locked': True}
+
+        # Check
+        self.assertTrue(acl.check('author', 'post', 'view'))
+        self.assertFalse(acl.check('author', 'post', 'edit'))  # no context
+        self.assertTrue(acl.check('author', 'post', 'edit', own))
+        self.assertFalse(acl.check('author', 'post', 'edit', other))
+        self.assertTrue(acl.check('editor', 'post', 'edit', own))  # inherited
+        self.assertTrue(acl.check('user', 'post', 'comment', context=own))
+        self.assertTrue(acl.check_any(['author', 'user'], 'post', 'comment', own))
+        self.assertFalse(acl.check_all(['author', 'user'], 'post', 'comment', own))
+        self.assertEqual(acl.check_many(['author', 'author', 'author', 'user'], ['post'] * 4,
+                                        ['edit', 'edit', 'view', 'comment'], [own, other, None, other]),
+                         [True, False, True, False])
+        self.assertEqual(acl.check_many(['author'], ['post'], ['edit']), [False])
+
+        # Unconditional grants of all the roles come first. A key missing from the context fails the condition
+        acl.grant('owner', 'post', 'delete', condition='owner == 1')
+        acl.grant('admin', 'post', 'delete')
+        for copy in (acl, acl.freeze()):
+            self.assertFalse(copy.check('owner', 'post', 'delete', {}))
+            self.assertTrue(copy.check_any(['owner', 'admin'], 'post', 'delete', {}))
+            self.assertTrue(copy.check_any(['admin', 'owner'], 'post', 'delete', {}))
+            self.assertFalse(copy.check_all(['owner', 'admin'], 'post', 'delete', {}))
+            self.assertTrue(copy.check_all(['admin', 'owner'], 'post', 'delete', {'owner': 1}))
+            self.assertEqual(copy.check_many(['owner', 'admin'], ['post'] * 2, ['delete'] * 2, [{}, {}]), [False, True])
+
+        # Conditional grants are not listed
+        self.assertDictEqual(acl.which('author'), {'post': {'view'}})
+
+        # Copies: with expressions, as lambdas can't be pickled
+        acl.grant('user', 'post', 'comment', condition='not locked')
+        for copy in (acl.loads(acl.dumps()), pickle.loads(pickle.dumps(acl)), acl.freeze()):
+            self.assertTrue(copy.check('editor', 'post', 'edit', own))
+            self.assertFalse(copy.check('user', 'post', 'comment', other))
+
+        # Granting again replaces the condition
+        acl.grant('author', 'post', 'edit')
+        self.assertTrue(acl.check('author', 'post', 'edit', other))
+        acl.grant('author', 'post', 'edit', condition='user == author')
+        self.assertFalse(acl.check('author', 'post', 'edit', other))
+
+        # Revoke
+        acl.revoke('author', 'post', 'edit')
+        self.assertFalse(acl.check('author', 'post', 'edit', own))
+        acl.del_role('user')
+        self.assertFalse(acl.check('user', 'post', 'comment', own))
+
+        # Invalid expressions
+        self.assertRaises(ValueError, acl.grant, 'a', 'b', 'c', condition='user ==')
+        self.assertRaises(ValueError, acl.grant, 'a', 'b', 'c', condition='open("/etc/passwd")')
+        self.assertRaises(ValueError, acl.grant, 'a', 'b', 'c', condition='user.__class__')
+        self.assertNotIn('a', acl.get_roles())
+
+    def test_hierarchy(self):
+        """ Wildcard resources cover their descendants """
+        acl = self.PathAcl()
+        acl.grant('user', 'project/42/*', 'view')
+        acl.grant('user', 'project/42/doc/7', 'edit')
+        acl.grant('user', ('project', 1), 'view')  # not a path
+        acl.grant('admin', '*', 'delete')
+        acl.add_role('manager', ['user'])
+
+        # Check
+        self.assertTrue(acl.check('user', 'project/42/doc/7', 'view'))
+        self.assertTrue(acl.check('user', 'project/42/doc/7', 'edit'))
+        self.assertTrue(acl.check('user', 'project/42/1', 'view'))
+        self.assertFalse(acl.check('user', 'project/42', 'view'))  # descendants only
+        self.assertFalse(acl.check('user', 'project/43/doc', 'view'))
+        self.assertFalse(acl.check('user', 'project/42/doc/8', 'edit'))
+        self.assertTrue(acl.check('manager', 'project/42/doc/8', 'view'))
+        self.assertTrue(acl.check('admin', 'project', 'delete'))
+        self.assertFalse(acl.check('admin', ('project', 1), 'delete'))
+        self.assertTrue(acl.check_any(['admin', 'user'], 'project/42/x', 'view'))
+        self.assertFalse(acl.check_all(['admin', 'user'], 'project/42/x', 'view'))
+        self.assertEqual(acl.check_many(['user', 'admin', 'user'], ['project/42/doc/7', 'x', 'x'], ['edit', 'delete', 'view']),
+                         [True, True, False])
+
+        # Show
+        self.assertEqual(acl.which_permissions('manager', 'project/42/doc/7'), {'view', 'edit'})
+        self.assertEqual(acl.which_permissions_any(['user', 'admin'], 'project/42/doc/7'), {'view', 'edit', 'delete'})
+        self.assertEqual(acl.which_permissions_all(['user', 'admin'], 'project/42/doc/7'), set())
+        self.assertDictEqual(acl.which('user'), {
+            'project/42/*': {'view'},
+            'project/42/doc/7': {'edit'},
+            ('project', 1): {'view'},
+        })
+        self.assertSetEqual(acl.who('project/42/doc/7', 'view'), {'user', 'manager'})
+        self.assertSetEqual(acl.who('project/42', 'view'), set())
+        self.assertSetEqual(acl.who('project/42/doc/7', 'delete'), {'admin'})
+        self.assertSetEqual(acl.resources_with('view'), {'project/42/*', ('project', 1)})
+
+        # Copies
+        for copy in (miracle.Acl.loads(acl.dumps()), pickle.loads(pickle.dumps(acl)), acl.freeze()):
+            self.assertTrue(copy.check('manager', 'project/42/doc/8', 'view'))
+            self.assertEqual(copy.which_permissions('manager', 'project/42/doc/7'), {'view', 'edit'})
+
+        # Delete
+        acl.del_resource('project/42/*')
+        self.assertFalse(acl.check('user', 'project/42/doc/8', 'view'))
+        self.assertTrue(acl.check('user', 'project/42/doc/7', 'edit'))
+        acl.del_resource('*')
+        self.assertFalse(acl.check('admin', 'project', 'delete'))
+        if isinstance(acl, miracle.Acl):
+            self.assertDictEqual(acl._trie, {})
+
+        # Flat resources
+        acl = self.Acl()
+        acl.grant('user', 'project/*', 'view')
+        self.assertFalse(acl.check('user', 'project/1', 'view'))
+
+    def test_who(self):
+        """ who(), who_any(), who_all(), resources_with() """
+        acl = self.Acl()
+        acl.grants({
+            'root': {'doc/7': ['view', 'edit', 'delete'], 'doc/8': ['delete']},
+            'editor': {'doc/7': ['view', 'edit']},
+            'user': {'doc/7': ['view']},
+        })
+        acl.add_role('chief', ['editor'])
+        acl.add_role('intern', ['chief'])
+        acl.add_role('nobody')
+
+        # who()
+        self.assertSetEqual(acl.who('doc/7', 'view'), {'root', 'editor', 'chief', 'intern', 'user'})
+        self.assertSetEqual(acl.who('doc/7', 'edit'), {'root', 'editor', 'chief', 'intern'})
+        self.assertSetEqual(acl.who('doc/8', 'delete'), {'root'})
+        self.assertSetEqual(acl.who('doc/8', 'view'), set())
+        self.assertSetEqual(acl.who('doc/???', 'view'), set())
+
+        # who_any(), who_all()
+        self.assertSetEqual(acl.who_any('doc/7', ['edit', 'delete']), {'root', 'editor', 'chief', 'intern'})
+        self.assertSetEqual(acl.who_all('doc/7', ['view', 'delete']), {'root'})
+        self.assertSetEqual(acl.who_all('doc/7', ['view', '???']), set())
+        self.assertSetEqual(acl.who_any('doc/7', []), set())
+        self.assertSetEqual(acl.who_all('doc/7', []), set())
+
+        # resources_with()
+        self.assertSetEqual(acl.resources_with('delete'), {'doc/7', 'doc/8'})
+        self.assertSetEqual(acl.resources_with('edit'), {'doc/7'})
+        self.assertSetEqual(acl.resources_with('???'), set())
+
+        # Follow the changes
+        acl.revoke('root', 'doc/8', 'delete')
+        acl.del_role('editor')
+        self.assertSetEqual(acl.who('doc/7', 'edit'), {'root'})
+        self.assertSetEqual(acl.resources_with('delete'), {'doc/7'})
+        acl.del_permission('doc/7', 'delete')
+        self.assertSetEqual(acl.resources_with('delete'), set())
+        acl.del_resource('doc/7')
+        self.assertSetEqual(acl.who('doc/7', 'view'), set())
+        self.assertSetEqual(acl.resources_with('view'), set())
+        if isinstance(acl, miracle.Acl) and not isinstance(acl, miracle.CompactAcl):
+            self.assertDictEqual(acl._permission_grants, {})
+
+    def test_iter(self):
+        """ iter_grants(), iter_which() """
+        acl = self.Acl()
+        acl.grants({
+            'root': {'/admin': ['enter', 'kill'], '/user': ['show']},
+            'user': {'/user': ['show', 'edit']},
+        })
+        acl.add_role('admin', ['user'])
+        acl.add_resource('/empty')
+        grants = {('root', '/admin', 'enter'), ('root', '/admin', 'kill'), ('root', '/user', 'show'),
+                  ('user', '/user', 'show'), ('user', '/user', 'edit')}
+
+        # iter_grants(): every combination of filters
+        iterator = acl.iter_grants()
+        self.assertIs(iter(iterator), iterator)
+        for role in (None, 'root', 'user', 'admin', '???'):
+            for resource in (None, '/admin', '/user', '/empty', '/???'):
+                for permission in (None, 'show', 'kill', '???'):
+                    self.assertEqual(
+                        sorted(acl.iter_grants(role, resource, permission)),
+                        sorted(grant for grant in grants
+                               if role in (None, grant[0]) and resource in (None, grant[1])
+                               and permission in (None, grant[2])),
+                        (role, resource, permission)
+                    )
+
+        # iter_which(): inherited grants too
+        for role in ('root', 'admin', '???'):
+            self.assertEqual(sorted(acl.iter_which(role)),
+                             sorted((resource, permission) for resource, permissions in acl.which(role).items()
+                                    for permission in permissions))
+
+    def test_views(self):
+        """ view_roles(), view_structure(), view_grants() """
+        acl = self.Acl()
+        acl.grants({'root': {'/admin': ['enter', 'kill']}, 'user': {'/user': ['show']}})
+        acl.add_resource('/empty')
+
+        roles = acl.view_roles()
+        structure = acl.view_structure()
+        grants = acl.view_grants()
+        self.assertEqual(roles, acl.get_roles())
+        self.assertEqual(dict(structure), acl.get())
+        self.assertEqual({role: dict(resources) for role, resources in grants.items()}, acl.show())
+        self.assertIn('kill', grants['root']['/admin'])
+        self.assertNotIn('show', grants['root']['/admin'])
+        self.assertEqual(len(grants['root']['/admin']), 2)
+        self.assertRaises(KeyError, lambda: structure['/???'])
+        self.assertNotIn('/???', acl.get_resources())
+
+        # Read-only
+        self.assertFalse(hasattr(roles, 'add'))
+        self.assertFalse(hasattr(structure, '__setitem__'))
+
+        # Views follow the changes
+        acl.grant('guest', '/user', 'show')
+        acl.del_resource('/empty')
+        self.assertIn('guest', roles)
+        self.assertIn('guest', grants)
+        self.assertNotIn('/empty', structure)
+
+    def test_instrument(self):
+        """ instrument(): call counts, latency histograms, slow calls, gauges """
+        acl = self.Acl()
+        slow = []
+        metrics = acl.instrument(miracle.Metrics(slow=lambda *args: slow.append(args), slow_threshold=0))
+        self.assertRaises(ValueError, acl.instrument)
+
+        acl.grants({'root': {'/admin': ['enter']}, 'user': {'/user': ['show', 'edit']}})
+        acl.add_role('super', ['root'])
+        self.assertTrue(acl.check_any(['user', 'super'], '/admin', 'enter'))
+        self.assertFalse(acl.check('user', '/admin', 'enter'))
+        self.assertFalse(acl.check('user', '/admin', 'enter'))
+
+        # Only the outermost calls are counted
+        self.assertDictEqual(metrics.get_calls(), {'grants': 1, 'add_role': 1, 'check_any': 1, 'check': 2})
+        self.assertEqual(slow[2][:3], ('check_any', (['user', 'super'], '/admin', 'enter'), {}))
+        self.assertDictEqual(metrics.get_cardinality(), {'roles': 3, 'resources': 2, 'grants': 3})
+
+        count, total, buckets = metrics.get_latency('check')
+        self.assertEqual(count, 2)
+        self.assertEqual(buckets[-1], (float('inf'), 2))
+        self.assertListEqual([n for bound, n in buckets], sorted(n for bound, n in buckets))
+        self.assertEqual(metrics.get_latency('who'), (0, 0.0, [(bound, 0) for bound, n in buckets]))
+
+        text = metrics.prometheus()
+        self.assertIn('# TYPE miracle_call_seconds histogram\n', text)
+        self.assertIn('miracle_call_seconds_bucket{method="check",le="+Inf"} 2\n', text)
+        self.assertIn('miracle_call_seconds_count{method="check_any"} 1\n', text)
+        self.assertIn('# TYPE miracle_grants gauge\nmiracle_grants 3\n', text)
+
+        # Uninstrumented: the methods are the class' again
+        acl.uninstrument()
+        self.assertNotIn('check', vars(acl))
+        acl.check('user', '/user', 'show')
+        self.assertEqual(metrics.get_calls()['check'], 2)
+        self.assertDictEqual(metrics.reset().get_calls(), {})
+
+        # Snapshots are not instrumented
+        acl.instrument()
+        self.assertNotIn('check', vars(acl.freeze()))
+        acl.uninstrument()
+
+        # The changelog still records
+        acl = self.ChangelogAcl()
+        acl.instrument()
+        acl.grant('root', '/admin', 'enter')
+        acl.uninstrument()
+        acl.grant('user', '/user', 'show')
+        self.assertEqual(acl.get_version(), 2)
+
+
+class TestAclCache(TestAclStructure):
+    """ The whole test-suite passes with memoization """
+    Acl = staticmethod(lambda: miracle.Acl(cache_size=2))
+
+    def test_cache(self):
+        """ Memoized results are never stale """
+        acl = self.Acl()
+        acl.grants({
+            'root': {'/admin': ['enter'], '/user': ['edit']},
+            'user': {'/user': ['show']},
+        })
+
+        self.assertDictEqual(acl.which_any(['root', 'user']), {'/admin': {'enter'}, '/user': {'edit', 'show'}})
+        self.assertEqual(acl.which_permissions_all(['root', 'user'], '/user'), set())
+        self.assertEqual(len(acl._cache), 2)
+
+        # Results are copies
+        acl.which_any(['user', 'root'])['/user'].add('delete')
+        self.assertDictEqual(acl.which_any(['root', 'user']), {'/admin': {'enter'}, '/user': {'edit', 'show'}})
+
+        # LRU
+        acl.which_all(['root', 'user'])
+        self.assertEqual(len(acl._cache), 2)
+        self.assertIn(('which_any', frozenset(['root', 'user'])), acl._cache)
+
+        # Every change invalidates
+        acl.grant('user', '/user', 'edit')
+        self.assertEqual(acl.which_permissions_all(['root', 'user'], '/user'), {'edit'})
+        acl.revoke_all('root')
+        self.assertDictEqual(acl.which_any(['root', 'user']), {'/user': {'edit', 'show'}})
+        acl.add_role('root', ['user'])
+        self.assertDictEqual(acl.which_all(['root', 'user']), {'/user': {'edit', 'show'}})
+        acl.del_permission('/user', 'edit')
+        self.assertDictEqual(acl.which_all(['root', 'user']), {'/user': {'show'}})
+        acl.del_role('user')
+        self.assertDictEqual(acl.which_any(['root', 'user']), {})
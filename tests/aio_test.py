@@ -0,0 +1,112 @@
+import sys
+import unittest
+
+if sys.version_info < (3, 5):
+    raise unittest.SkipTest('asyncio support requires Python 3.5')
+
+import asyncio
+
+import miracle
+from miracle.aio import AsyncAcl, AsyncStorage
+
+
+class SlowStorage(AsyncStorage):
+    """ Storage that counts the lookups, and answers them later """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.storage = miracle.MemoryStorage()
+        self.lookups = 0
+
+    def _later(self, value):
+        future = self.loop.create_future()
+        self.loop.call_later(0.01, future.set_result, value)
+        return future
+
+    def get_grants(self, role):
+        self.lookups += 1
+        return self._later(self.storage.get_grants(role))
+
+    def grant_many(self, grants):
+        return self._later(self.storage.grant_many(grants))
+
+    def revoke_many(self, grants):
+        return self._later(self.storage.revoke_many(grants))
+
+
+class TestAsyncAcl(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def run_(self, *coroutines):
+        ret = self.loop.run_until_complete(asyncio.gather(*coroutines))
+        return ret[0] if len(ret) == 1 else ret
+
+    def test_acl(self):
+        """ Read & write, with the default and the SQLite storages """
+        for storage in (None, miracle.SqliteStorage()):
+            acl = AsyncAcl(storage)
+            self.run_(acl.add({'/page': ['view']}), acl.add_roles(['nobody']))
+            self.run_(acl.grant_many([('root', '/admin', 'enter'), ('user', '/page', 'view')]))
+            self.run_(acl.grant('root', '/admin', 'kill'))
+
+            self.assertSetEqual(self.run_(acl.get_roles()), {'nobody', 'root', 'user'})
+            self.assertSetEqual(self.run_(acl.get_resources()), {'/admin', '/page'})
+            self.assertSetEqual(self.run_(acl.get_permissions('/admin')), {'enter', 'kill'})
+            self.assertTrue(self.run_(acl.check('root', '/admin', 'kill')))
+            self.assertFalse(self.run_(acl.check('user', '/admin', 'kill')))
+            self.assertTrue(self.run_(acl.check_any(['root', 'user'], '/page', 'view')))
+            self.assertFalse(self.run_(acl.check_all(['root', 'user'], '/page', 'view')))
+            self.assertFalse(self.run_(acl.check_any([], '/page', 'view')))
+            self.assertEqual(self.run_(acl.check_many(['root', 'user', 'user'], ['/admin', '/page', '/admin'],
+                                                      ['enter', 'view', 'enter'])), [True, True, False])
+            self.assertSetEqual(self.run_(acl.which_permissions('root', '/admin')), {'enter', 'kill'})
+            self.assertDictEqual(self.run_(acl.which('user')), {'/page': {'view'}})
+
+            # Writes are seen at once
+            self.run_(acl.revoke('root', '/admin', 'kill'))
+            self.assertFalse(self.run_(acl.check('root', '/admin', 'kill')))
+
+            if storage is not None:
+                storage.close()
+
+    def test_cache(self):
+        """ Lookups are cached, coalesced and invalidated """
+        storage = SlowStorage(self.loop)
+        acl = AsyncAcl(storage, ttl=60, cache_size=2)
+        self.run_(acl.grant_many([('root', '/admin', 'enter'), ('user', '/page', 'view')]))
+
+        # Coalesced
+        results = self.run_(*[acl.check('root', '/admin', 'enter') for i in range(10)])
+        self.assertEqual(results, [True] * 10)
+        self.assertEqual(storage.lookups, 1)
+
+        # Cached
+        self.assertTrue(self.run_(acl.check('root', '/admin', 'enter')))
+        self.assertEqual(storage.lookups, 1)
+
+        # LRU
+        self.run_(acl.check('user', '/page', 'view'))
+        self.run_(acl.check('nobody', '/page', 'view'))
+        self.assertEqual(list(acl._cache), ['user', 'nobody'])
+        self.assertEqual(storage.lookups, 3)
+
+        # A write during a lookup is not lost
+        acl.invalidate()
+        check = self.loop.create_task(acl.check('root', '/admin', 'enter'))
+        self.run_(asyncio.sleep(0))
+        self.run_(acl.revoke('root', '/admin', 'enter'))
+        self.assertTrue(self.run_(check))  # the lookup started before
+        self.assertFalse(self.run_(acl.check('root', '/admin', 'enter')))
+
+        # TTL
+        acl = AsyncAcl(storage, ttl=0)
+        self.run_(acl.check('user', '/page', 'view'), acl.check('user', '/page', 'view'))
+        lookups = storage.lookups
+        self.run_(acl.check('user', '/page', 'view'))
+        self.assertEqual(storage.lookups, lookups + 1)
@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import miracle
+
+
+class TestDecisionLog(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'decisions.log')
+
+        self.acl = miracle.Acl()
+        self.acl.grants({
+            'root': {'/admin': ['enter'], '/user': ['show', 'edit']},
+            'user': {'/user': ['show']},
+        })
+        self.acl.add_role('super', ['root'])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_json(self):
+        """ Denials are recorded, allows are sampled, and only the outermost checks count """
+        with miracle.DecisionLog(self.path, interval=60) as log:
+            self.assertIs(self.acl.audit(log), log)
+            self.assertRaises(ValueError, self.acl.audit, log)
+            self.assertTrue(self.acl.check('root', '/admin', 'enter'))
+            self.assertFalse(self.acl.check('user', '/admin', 'enter'))
+            self.assertFalse(self.acl.check_any(iter(['user', '???']), '/user', 'edit'))
+            self.assertTrue(self.acl.check_any(['user', 'super'], '/user', 'edit'))  # calls check()
+            self.assertFalse(self.acl.check_all({'super'}, '/user', 'delete'))
+            self.assertListEqual(self.acl.check_many(['super', 'user'], ['/admin', '/admin'], ['enter', 'enter']),
+                                 [True, False])
+            self.acl.unaudit()
+            self.assertNotIn('check', vars(self.acl))
+            self.acl.check('user', '/admin', 'enter')
+
+        decisions = list(miracle.DecisionLog.read(self.path))
+        self.assertListEqual([(d['method'], d['roles'], d['resource'], d['permission'], d['allowed'])
+                              for d in decisions], [
+            ('check', ['user'], '/admin', 'enter', False),
+            ('check_any', ['user', '???'], '/user', 'edit', False),
+            ('check_all', ['super'], '/user', 'delete', False),
+            ('check_many', ['user'], '/admin', 'enter', False),
+        ])
+        self.assertEqual(log.get_stats(), {'written': 4, 'dropped': 0, 'pending': 0})
+
+    def test_binary(self):
+        """ Binary format, with every decision, and rotation """
+        log = miracle.DecisionLog(self.path, format='binary', allowed_rate=1.0, batch_size=10, max_bytes=500,
+                                  backups=2, interval=60)
+        self.acl.audit(log)
+        for i in range(100):
+            self.acl.check('root' if i % 2 else 'user', '/admin', 'enter')
+        log.close()
+        self.assertNotIn('check', vars(self.acl))
+
+        self.assertSetEqual(set(os.listdir(self.dir)), {'decisions.log', 'decisions.log.1', 'decisions.log.2'})
+        decisions = list(miracle.DecisionLog.read(self.path, 'binary'))
+        self.assertEqual(len(decisions), 10)
+        self.assertEqual([d['allowed'] for d in decisions], [False, True] * 5)
+        self.assertEqual(decisions[0]['roles'], ['user'])
+        self.assertEqual(log.get_stats()['written'], 100)
+        self.assertRaises(ValueError, miracle.DecisionLog.read, self.path, 'xml')
+        self.assertRaises(ValueError, miracle.DecisionLog, self.path, 'xml')
+
+    def test_full(self):
+        """ A full buffer drops decisions rather than blocking """
+        with miracle.DecisionLog(self.path, capacity=3, interval=60) as log:
+            self.acl.audit(log)
+            with log._write_lock:  # the writer is stuck
+                for i in range(5):
+                    self.assertFalse(self.acl.check('user', '/admin', 'enter'))
+                self.assertEqual(log.get_stats(), {'written': 0, 'dropped': 2, 'pending': 3})
+            log.flush()
+            self.assertEqual(log.get_stats(), {'written': 3, 'dropped': 2, 'pending': 0})
+        self.assertEqual(len(list(miracle.DecisionLog.read(self.path))), 3)
+
+    def test_instrumented(self):
+        """ Audit and metrics stack, and are removed in reverse order """
+        with miracle.DecisionLog(self.path, interval=60) as log:
+            self.acl.audit(log)
+            metrics = self.acl.instrument()
+            self.assertRaises(ValueError, self.acl.unaudit)
+            self.acl.check('user', '/admin', 'enter')
+            self.acl.uninstrument()
+            self.acl.unaudit()
+            self.assertNotIn('check', vars(self.acl))
+        self.assertEqual(metrics.get_calls(), {'check': 1})
+        self.assertEqual(len(list(miracle.DecisionLog.read(self.path))), 1)
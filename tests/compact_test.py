@@ -0,0 +1,49 @@
+import miracle
+import acl_test
+
+
+class TestCompactAcl(acl_test.TestAclStructure):
+    """ CompactAcl passes the whole Acl test-suite """
+    Acl = miracle.CompactAcl
+    ChangelogAcl = staticmethod(lambda: miracle.CompactAcl(changelog=True))
+    PathAcl = staticmethod(lambda: miracle.CompactAcl(separator='/'))
+
+    def test_indexes(self):
+        """ Bitmask indexes follow grant(), revoke() and del_*() """
+        acl = self.Acl()
+        acl.grants({
+            'root': {'a': ['read', 'write'], 'b': ['read']},
+            'user': {'a': ['read']},
+        })
+        read, write = 1 << acl._bits['a']['read'], 1 << acl._bits['a']['write']
+
+        self.assertDictEqual(acl._role_grants, {
+            'root': {'a': read | write, 'b': 1},
+            'user': {'a': read},
+        })
+        self.assertDictEqual(acl._resource_grants, {
+            'a': {'root': read | write, 'user': read},
+            'b': {'root': 1},
+        })
+
+        # Empty entries are dropped
+        acl.revoke('root', 'b', 'read')
+        acl.del_permission('a', 'write')
+        acl.revoke_all('user')
+
+        self.assertDictEqual(acl._role_grants, {'root': {'a': read}})
+        self.assertDictEqual(acl._resource_grants, {'a': {'root': read}})
+
+        # The freed bit is reused
+        acl.grant('user', 'a', 'delete')
+        self.assertEqual(1 << acl._bits['a']['delete'], write)
+        self.assertEqual(acl.which_permissions('user', 'a'), {'delete'})
+        self.assertEqual(acl.which_permissions('root', 'a'), {'read'})
+
+    def test_memory(self):
+        """ Masks are small: no tuple per grant """
+        acl = self.Acl()
+        acl.grant_many(('user', 'r{}'.format(i), p) for i in range(100) for p in ('read', 'write', 'delete'))
+        self.assertFalse(hasattr(acl, '_grants'))
+        self.assertEqual(len(acl._role_grants['user']), 100)
+        self.assertEqual(set(acl._role_grants['user'].values()), {0b111})
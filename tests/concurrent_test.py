@@ -0,0 +1,74 @@
+import threading
+
+import miracle
+import acl_test
+
+
+class TestConcurrentAcl(acl_test.TestAclStructure):
+    """ ConcurrentAcl passes the whole Acl test-suite """
+    Acl = miracle.ConcurrentAcl
+    ChangelogAcl = staticmethod(lambda: miracle.ConcurrentAcl(miracle.Acl(changelog=True)))
+    PathAcl = staticmethod(lambda: miracle.ConcurrentAcl(miracle.Acl(separator='/')))
+
+    def test_indexes(self):
+        """ Writes publish a new snapshot; batches publish once """
+        acl = self.Acl()
+        snapshot = acl.freeze()
+        self.assertIsInstance(snapshot, miracle.FrozenAcl)
+
+        # Every write publishes
+        acl.grant('root', '/admin', 'enter')
+        self.assertIsNot(acl.freeze(), snapshot)
+        self.assertFalse(snapshot.check('root', '/admin', 'enter'))
+        self.assertTrue(acl.check('root', '/admin', 'enter'))
+
+        # Batch: published when finished
+        snapshot = acl.freeze()
+        with acl.batch() as a:
+            a.grant('user', '/user', 'show')
+            with acl.batch():
+                a.revoke_all('root')
+            self.assertIs(acl.freeze(), snapshot)
+            self.assertFalse(acl.check('user', '/user', 'show'))
+            self.assertTrue(acl.check('root', '/admin', 'enter'))
+        self.assertTrue(acl.check('user', '/user', 'show'))
+        self.assertFalse(acl.check('root', '/admin', 'enter'))
+
+    def test_views(self):
+        """ Views and iterators are of the published snapshot: writers never change them """
+        acl = self.Acl()
+        acl.grant('root', '/admin', 'enter')
+        roles = acl.view_roles()
+        grants = acl.iter_grants()
+
+        acl.grant('user', '/user', 'show')
+        self.assertEqual(set(roles), {'root'})
+        self.assertEqual(list(grants), [('root', '/admin', 'enter')])
+        self.assertEqual(set(acl.view_roles()), {'root', 'user'})
+
+    def test_threads(self):
+        """ Readers keep working while a writer modifies the Acl """
+        acl = self.Acl()
+        acl.grant_many(('user', 'r{}'.format(i), 'read') for i in range(200))
+        errors = []
+
+        def read():
+            try:
+                for i in range(100):
+                    acl.which('user')
+                    acl.show()
+                    self.assertTrue(acl.check('user', 'r0', 'read'))
+            except Exception as e:
+                errors.append(e)
+
+        readers = [threading.Thread(target=read) for i in range(4)]
+        for t in readers:
+            t.start()
+        for i in range(1, 200):
+            acl.revoke('user', 'r{}'.format(i), 'read')
+            acl.grant('admin', 'r{}'.format(i), 'write')
+        for t in readers:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertDictEqual(acl.which('user'), {'r0': {'read'}})
@@ -0,0 +1,37 @@
+import unittest
+
+from miracle.conditions import Condition
+
+
+class TestCondition(unittest.TestCase):
+    def test_expression(self):
+        """ Expressions over the context """
+        class User(object):
+            id = 1
+            groups = ['staff']
+
+        context = {'user': User(), 'post': {'author': 1, 'tags': ('a', 'b')}, 'n': 3}
+        for expression, expected in [
+            ('user.id == post["author"]', True),
+            ("'staff' in user.groups and 'c' not in post['tags']", True),
+            ('n * 2 > 5 or missing', True),
+            ('not (n % 3 == 0)', False),
+            ('post["tags"][-1] == "b" and None is None', True),
+        ]:
+            self.assertEqual(bool(Condition(expression).test(context)), expected, expression)
+
+        self.assertRaises(KeyError, Condition('missing').test, context)
+        self.assertFalse(Condition('missing').holds(context))
+        self.assertFalse(Condition(lambda context: context['missing']).holds(context))
+
+    def test_callable(self):
+        """ Callables are used as they are """
+        test = lambda context: context['ok']
+        condition = Condition(test)
+        self.assertIs(condition.test, test)
+        self.assertIs(condition.source, test)
+
+    def test_invalid(self):
+        """ Only a safe subset of Python is allowed """
+        for expression in ['user ==', 'len(x)', 'x.__class__', '_x', 'lambda: 1', '[x for x in y]', 'x if y else z']:
+            self.assertRaises(ValueError, Condition, expression)
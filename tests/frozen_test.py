@@ -0,0 +1,128 @@
+import pickle
+import unittest
+
+import miracle
+
+
+class TestFrozenAcl(unittest.TestCase):
+    def setUp(self):
+        self.acl = miracle.Acl()
+        self.acl.add_role('nobody')
+        self.acl.add_resource('/empty')
+        self.acl.grants({
+            'root': {'/admin': ['enter'], '/user': ['show', 'edit', 'delete']},
+            'admin': {'/admin': ['enter'], '/user': ['show', 'edit']},
+            'user': {'/user': ['show']},
+        })
+
+    def test_read(self):
+        """ FrozenAcl answers exactly like the Acl """
+        acl = self.acl
+        frozen = acl.freeze()
+        self.assertIsInstance(frozen, miracle.FrozenAcl)
+        self.assertIs(frozen.freeze(), frozen)
+
+        self.assertSetEqual(frozen.get_roles(), acl.get_roles())
+        self.assertSetEqual(frozen.get_resources(), acl.get_resources())
+        self.assertDictEqual(frozen.get(), acl.get())
+        self.assertDictEqual(frozen.show(), acl.show())
+        self.assertDictEqual(frozen.__getstate__(), acl.__getstate__())
+
+        roles = ['root', 'admin', 'user', 'nobody', '???']
+        resources = ['/admin', '/user', '/empty', '/???']
+        permissions = ['enter', 'show', 'edit', 'delete', '???']
+        role_sets = [[], ['root'], ['root', 'user'], ['admin', 'user'], ['user', 'nobody'], roles]
+
+        for resource in resources:
+            self.assertSetEqual(frozen.get_permissions(resource), acl.get_permissions(resource))
+            for role in roles:
+                self.assertEqual(frozen.which_permissions(role, resource), acl.which_permissions(role, resource))
+                for permission in permissions:
+                    self.assertEqual(frozen.check(role, resource, permission), acl.check(role, resource, permission))
+            for permission in permissions:
+                self.assertSetEqual(frozen.who(resource, permission), acl.who(resource, permission))
+            for rs in role_sets:
+                self.assertEqual(frozen.which_permissions_any(rs, resource), acl.which_permissions_any(rs, resource))
+                self.assertEqual(frozen.which_permissions_all(rs, resource), acl.which_permissions_all(rs, resource))
+                for permission in permissions:
+                    self.assertEqual(frozen.check_any(rs, resource, permission), acl.check_any(rs, resource, permission))
+                    self.assertEqual(frozen.check_all(rs, resource, permission), acl.check_all(rs, resource, permission))
+        for role in roles:
+            self.assertDictEqual(frozen.which(role), acl.which(role))
+        for permission in permissions:
+            self.assertSetEqual(frozen.resources_with(permission), acl.resources_with(permission))
+        for role in roles:
+            self.assertEqual(sorted(frozen.iter_which(role)), sorted(acl.iter_which(role)))
+            for resource in resources + [None]:
+                for permission in permissions + [None]:
+                    self.assertEqual(sorted(frozen.iter_grants(role, resource, permission)),
+                                     sorted(acl.iter_grants(role, resource, permission)))
+        self.assertEqual(sorted(frozen.iter_grants()), sorted(acl.iter_grants()))
+        self.assertEqual(sorted(frozen.iter_grants(None, '/user')), sorted(acl.iter_grants(None, '/user')))
+        self.assertEqual(sorted(frozen.iter_grants(None, None, 'show')), sorted(acl.iter_grants(None, None, 'show')))
+        self.assertEqual(frozen.view_roles(), acl.view_roles())
+        for rs in role_sets:
+            self.assertDictEqual(frozen.which_any(rs), acl.which_any(rs))
+            self.assertDictEqual(frozen.which_all(rs), acl.which_all(rs))
+
+        self.assertEqual(
+            frozen.check_many(['root', 'user', '???'], ['/user', '/admin', '/user'], ['delete', 'enter', 'show']),
+            [True, False, False]
+        )
+
+        # Results are copies
+        frozen.which('root')['/admin'].add('kill')
+        frozen.which_permissions('root', '/admin').add('kill')
+        self.assertFalse(frozen.check('root', '/admin', 'kill'))
+
+    def test_immutable(self):
+        """ FrozenAcl can't be modified, and does not follow the Acl """
+        frozen = self.acl.freeze()
+        self.assertRaises(TypeError, frozen.add_role, 'guest')
+        self.assertRaises(TypeError, frozen.grant, 'guest', '/user', 'show')
+        self.assertRaises(TypeError, frozen.revoke_all, 'root')
+        self.assertRaises(TypeError, frozen.del_role, 'root')
+        self.assertRaises(TypeError, frozen.clear)
+
+        self.acl.revoke_all('root')
+        self.acl.grant('guest', '/user', 'show')
+        self.assertTrue(frozen.check('root', '/admin', 'enter'))
+        self.assertFalse(frozen.check('guest', '/user', 'show'))
+
+        # Readers share the snapshot: nothing is memoized
+        acl = miracle.Acl(cache_size=10)
+        acl.__setstate__(self.acl.__getstate__())
+        frozen = acl.freeze()
+        self.assertDictEqual(frozen.which_any(['admin', 'user']), acl.which_any(['admin', 'user']))
+        self.assertEqual(len(frozen._cache), 0)
+
+    def test_compact(self):
+        """ CompactAcl can be frozen too """
+        acl = miracle.CompactAcl()
+        acl.__setstate__(self.acl.__getstate__())
+        self.assertDictEqual(acl.freeze().__getstate__(), self.acl.__getstate__())
+
+    def test_pickle(self):
+        """ FrozenAcl is picklable """
+        frozen = pickle.loads(pickle.dumps(self.acl.freeze()))
+        self.assertIsInstance(frozen, miracle.FrozenAcl)
+        self.assertDictEqual(frozen.__getstate__(), self.acl.__getstate__())
+        self.assertTrue(frozen.check('admin', '/user', 'edit'))
+
+    def test_inheritance(self):
+        """ FrozenAcl has the inherited grants """
+        self.acl.add_role('super', ['root', 'nobody'])
+        frozen = self.acl.freeze()
+        self.assertTrue(frozen.check('super', '/user', 'delete'))
+        self.assertTrue(frozen.check_all(['super', 'root'], '/admin', 'enter'))
+        self.assertDictEqual(frozen.which('super'), self.acl.which('root'))
+        self.assertSetEqual(frozen.get_parents('super'), {'root', 'nobody'})
+        self.assertDictEqual(frozen.__getstate__(), self.acl.__getstate__())
+
+    def test_dumps(self):
+        """ FrozenAcl dumps() and loads() """
+        frozen = self.acl.freeze()
+        frozen2 = miracle.FrozenAcl.loads(frozen.dumps())
+        self.assertIsInstance(frozen2, miracle.FrozenAcl)
+        self.assertDictEqual(frozen2.__getstate__(), self.acl.__getstate__())
+        self.assertDictEqual(miracle.Acl.loads(frozen.dumps()).show(), self.acl.show())
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if sys.version_info < (3, 3):
+    raise unittest.SkipTest('MappedAcl requires Python 3.3')
+
+import miracle
+
+
+class TestMappedAcl(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'acl.bin')
+
+        self.acl = miracle.Acl()
+        self.acl.add_role('nobody')
+        self.acl.add_resource('/empty')
+        self.acl.add_permission('/user', 'create')
+        self.acl.grants({
+            'root': {'/admin': ['enter'], '/user': ['show', 'edit', 'delete']},
+            'admin': {'/admin': ['enter'], '/user': ['show', 'edit']},
+            'user': {'/user': ['show'], u'/caf\xe9': [u'право']},
+        })
+        self.acl.add_role('super', ['admin'])
+        self.acl.del_permission('/user', 'edit')  # a hole in the bits
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_read(self):
+        """ MappedAcl answers exactly like the Acl """
+        acl = self.acl
+        miracle.MappedAcl.write(acl, self.path)
+
+        with miracle.MappedAcl(self.path) as mapped:
+            self.assertSetEqual(mapped.get_roles(), acl.get_roles())
+            self.assertSetEqual(mapped.get_resources(), acl.get_resources())
+
+            roles = ['root', 'admin', 'user', 'super', 'nobody', '???', 1]
+            resources = ['/admin', '/user', '/empty', u'/caf\xe9', '/???', None]
+            permissions = ['enter', 'show', 'edit', 'delete', 'create', u'право', '???']
+            role_sets = [[], ['root'], ['root', 'user'], ['admin', 'user'], ['user', 'nobody'], roles]
+
+            for resource in resources:
+                self.assertSetEqual(mapped.get_permissions(resource), acl.get_permissions(resource))
+                for role in roles:
+                    self.assertEqual(mapped.which_permissions(role, resource), acl.which_permissions(role, resource))
+                    for permission in permissions:
+                        self.assertEqual(mapped.check(role, resource, permission), acl.check(role, resource, permission))
+                for rs in role_sets:
+                    self.assertEqual(mapped.which_permissions_any(rs, resource), acl.which_permissions_any(rs, resource))
+                    self.assertEqual(mapped.which_permissions_all(rs, resource), acl.which_permissions_all(rs, resource))
+                    for permission in permissions:
+                        self.assertEqual(mapped.check_any(rs, resource, permission), acl.check_any(rs, resource, permission))
+                        self.assertEqual(mapped.check_all(rs, resource, permission), acl.check_all(rs, resource, permission))
+            for role in roles:
+                self.assertDictEqual(mapped.which(role), acl.which(role))
+
+            self.assertEqual(
+                mapped.check_many(['super', 'user', '???'], ['/user', '/admin', '/user'], ['show', 'enter', 'show']),
+                [True, False, False]
+            )
+
+    def test_empty(self):
+        """ Empty Acl """
+        miracle.MappedAcl.write(miracle.Acl(), self.path)
+        with miracle.MappedAcl(self.path) as mapped:
+            self.assertSetEqual(mapped.get_roles(), set())
+            self.assertFalse(mapped.check('root', '/admin', 'enter'))
+            self.assertDictEqual(mapped.which('root'), {})
+
+    def test_buffer(self):
+        """ MappedAcl.pack() and MappedAcl.from_buffer() """
+        data = miracle.MappedAcl.pack(self.acl)
+        miracle.MappedAcl.write(self.acl, self.path)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+        for buffer in (data, bytearray(data), memoryview(data)):
+            with miracle.MappedAcl.from_buffer(buffer) as mapped:
+                self.assertSetEqual(mapped.get_roles(), self.acl.get_roles())
+                self.assertTrue(mapped.check('super', '/user', 'show'))
+                self.assertFalse(mapped.check('user', '/admin', 'enter'))
+                self.assertDictEqual(mapped.which('user'), self.acl.which('user'))
+        self.assertRaises(ValueError, miracle.MappedAcl.from_buffer, b'???')
+
+    def test_implied(self):
+        """ Implied permissions are resolved when writing """
+        acl = miracle.Acl()
+        acl.add_implied('write', ['read'])
+        acl.grant('editor', '/page', 'write')
+        acl.grant('admin', '/book', '*')
+        acl.add_permission('/book', 'delete')
+
+        with miracle.MappedAcl.from_buffer(miracle.MappedAcl.pack(acl)) as mapped:
+            self.assertTrue(mapped.check('editor', '/page', 'read'))
+            self.assertTrue(mapped.check('admin', '/book', 'delete'))
+            self.assertSetEqual(mapped.get_permissions('/page'), acl.get_permissions('/page'))  # 'read' is not defined
+            for role in ('editor', 'admin'):
+                self.assertDictEqual(mapped.which(role), acl.which(role))
+
+    def test_errors(self):
+        """ Unsupported Acls and files """
+        acl = miracle.Acl()
+        acl.grant(1, '/admin', 'enter')
+        self.assertRaises(TypeError, miracle.MappedAcl.write, acl, self.path)
+
+        acl = miracle.Acl()
+        acl.add({'/wide': ['p{}'.format(i) for i in range(65)]})
+        self.assertRaises(ValueError, miracle.MappedAcl.write, acl, self.path)
+
+        acl = miracle.Acl(separator='/')
+        self.assertRaises(ValueError, miracle.MappedAcl.write, acl, self.path)
+
+        with open(self.path, 'wb') as f:
+            f.write(self.acl.dumps())
+        self.assertRaises(ValueError, miracle.MappedAcl, self.path)
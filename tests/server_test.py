@@ -0,0 +1,97 @@
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import unittest
+
+if sys.version_info < (3, 8) or not hasattr(socket, 'AF_UNIX'):
+    raise unittest.SkipTest('AclServer requires Python 3.8 and Unix sockets')
+
+import miracle
+from miracle.server import AclServer, AclClient, ServerError
+
+
+class TestAclServer(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'acl.sock')
+
+        self.acl = miracle.Acl()
+        self.acl.add_role('nobody')
+        self.acl.grants({
+            'root': {'/admin': ['enter'], '/user': ['show', 'edit', 'delete']},
+            'admin': {'/admin': ['enter'], '/user': ['show', 'edit']},
+            'user': {'/user': ['show']},
+        })
+        self.acl.add_role('super', ['admin'])
+
+        self.server = AclServer(self.acl, self.path, workers=2)
+        self.client = AclClient(self.path, timeout=10)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+        shutil.rmtree(self.dir)
+
+    def test_check(self):
+        """ The server answers like the Acl """
+        acl, client = self.acl, self.client
+        self.assertSetEqual(client.get_roles(), acl.get_roles())
+        self.assertSetEqual(client.get_resources(), acl.get_resources())
+        self.assertSetEqual(client.get_permissions('/user'), acl.get_permissions('/user'))
+
+        for role in ['root', 'admin', 'user', 'super', 'nobody', '???']:
+            self.assertDictEqual(client.which(role), acl.which(role))
+            for resource in ['/admin', '/user', '/???']:
+                self.assertEqual(client.which_permissions(role, resource), acl.which_permissions(role, resource))
+                for permission in ['enter', 'show', 'edit', '???']:
+                    self.assertEqual(client.check(role, resource, permission), acl.check(role, resource, permission))
+
+        roles = ['user', 'super']
+        self.assertTrue(client.check_any(roles, '/user', 'edit'))
+        self.assertFalse(client.check_all(roles, '/user', 'edit'))
+        self.assertSetEqual(client.which_permissions_any(roles, '/user'), {'show', 'edit'})
+        self.assertSetEqual(client.which_permissions_all(roles, '/user'), {'show'})
+        self.assertEqual(client.which_permissions_any([], '/user'), acl.which_permissions_any([], '/user'))
+        self.assertListEqual(
+            client.check_many(['super', 'user', '???'], ['/user', '/admin', '/user'], ['show', 'enter', 'show']),
+            [True, False, False]
+        )
+
+    def test_pipeline(self):
+        """ Many requests in a single round trip, larger than the socket buffers """
+        calls = [('check', ('root', '/user', 'edit')), ('which', ('root',)), ('check', ('user', '/user', 'edit'))]
+        results = self.client.pipeline(calls * 10000)
+        self.assertEqual(len(results), 30000)
+        self.assertListEqual(results[:3], [True, self.acl.which('root'), False])
+        self.assertListEqual(results[-3:], results[:3])
+
+        # Many connections, spread over the workers
+        clients = [AclClient(self.path, timeout=10) for i in range(4)]
+        try:
+            for client in clients:
+                self.assertTrue(client.check('root', '/admin', 'enter'))
+        finally:
+            for client in clients:
+                client.close()
+
+    def test_errors(self):
+        """ Failed calls raise, and the connection is still usable """
+        self.assertRaises(ServerError, self.client.call, 'check', 'root')
+        self.assertRaises(ValueError, self.client.call, 'grant', 'root', '/admin', 'enter')
+        self.assertTrue(self.client.check('root', '/admin', 'enter'))
+
+    def test_publish(self):
+        """ Publishing a new Acl """
+        self.assertFalse(self.client.check('user', '/admin', 'enter'))
+        self.acl.grant('user', '/admin', 'enter')
+        self.server.publish(self.acl)
+        self.assertTrue(self.client.check('user', '/admin', 'enter'))
+        with AclClient(self.path, timeout=10) as client:
+            self.assertTrue(client.check('user', '/admin', 'enter'))
+
+        # Implied permissions
+        self.acl.add_implied('enter', ['look'])
+        self.server.publish(self.acl)
+        self.assertTrue(self.client.check('user', '/admin', 'look'))
@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import miracle
+import acl_test
+
+
+class TestSqliteAcl(acl_test.TestAclStructure):
+    """ SqliteAcl passes the Acl test-suite, but for the features it does not support """
+    Acl = miracle.SqliteAcl
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'acl.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    @unittest.skip('Not supported')
+    def test_changelog(self):
+        pass
+
+    @unittest.skip('Not supported')
+    def test_implied(self):
+        pass
+
+    @unittest.skip('Not supported')
+    def test_conditions(self):
+        pass
+
+    @unittest.skip('Not supported')
+    def test_hierarchy(self):
+        pass
+
+    @unittest.skip('Not supported')
+    def test_views(self):
+        pass
+
+    def test_indexes(self):
+        """ Checks and lookups by resource are served by covering indexes """
+        acl = self.Acl()
+        acl.grant('root', '/admin', 'enter')
+
+        def plan(sql, *args):
+            return ' '.join(row[-1] for row in acl._query('EXPLAIN QUERY PLAN ' + sql, *args))
+
+        self.assertIn('PRIMARY KEY (role=? AND resource=? AND permission=?)', plan(
+            'SELECT 1 FROM grants WHERE role = ? AND resource = ? AND permission = ?', 'root', '/admin', 'enter'))
+        self.assertIn('COVERING INDEX grants_by_resource (resource=? AND permission=?)', plan(
+            'SELECT role FROM grants WHERE resource = ? AND permission = ?', '/admin', 'enter'))
+
+    def test_persistence(self):
+        """ Data survives reopening the database """
+        acl = self.Acl(self.path)
+        acl.grants({'root': {'/admin': ['enter']}, 'user': {'/user': ['show']}})
+        acl.add_role('admin', ['user'])
+        acl.close()
+
+        acl = self.Acl(self.path)
+        self.assertTrue(acl.check('root', '/admin', 'enter'))
+        self.assertTrue(acl.check('admin', '/user', 'show'))
+        self.assertEqual(acl.get_parents('admin'), {'user'})
+
+        # Load into a database, and into memory
+        loaded = self.Acl.loads(acl.dumps(), os.path.join(self.dir, 'copy.db'))
+        self.assertDictEqual(loaded.__getstate__(), acl.__getstate__())
+        self.assertDictEqual(acl.freeze().which('admin'), {'/user': {'show'}})
+        acl.close()
+        loaded.close()
+
+    def test_unsupported(self):
+        """ In-memory features can not be loaded """
+        for acl in [miracle.Acl(separator='/'), miracle.Acl().add_implied('write', ['read']),
+                    miracle.Acl().grant('user', '/post', 'edit', condition='user == author')]:
+            self.assertRaises(ValueError, self.Acl.loads, acl.dumps())
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+
+import miracle
+
+
+class TestMemoryStorage(unittest.TestCase):
+    Storage = miracle.MemoryStorage
+
+    def test_storage(self):
+        """ Roles, structure, grants """
+        storage = self.Storage()
+        storage.add_roles(['nobody'])
+        storage.add({'/empty': [], '/page': ['view']})
+        storage.grant_many(iter([
+            ('root', '/admin', 'enter'),
+            ('root', '/admin', 'kill'),
+            ('user', '/page', 'edit'),
+            ('user', '/page', 'edit'),
+        ]))
+
+        self.assertSetEqual(storage.get_roles(), {'nobody', 'root', 'user'})
+        self.assertDictEqual(storage.get_structure(), {
+            '/empty': set(),
+            '/page': {'view', 'edit'},
+            '/admin': {'enter', 'kill'},
+        })
+        self.assertDictEqual(storage.get_grants('root'), {'/admin': {'enter', 'kill'}})
+        self.assertDictEqual(storage.get_grants('nobody'), {})
+
+        storage.revoke_many(iter([('root', '/admin', 'kill'), ('user', '/page', 'edit'), ('user', '/page', 'view')]))
+        self.assertDictEqual(storage.get_grants('root'), {'/admin': {'enter'}})
+        self.assertDictEqual(storage.get_grants('user'), {})
+        self.assertIn('user', storage.get_roles())
+
+
+class TestSqliteStorage(TestMemoryStorage):
+    Storage = miracle.SqliteStorage
+
+    def test_persistence(self):
+        """ Data survives reopening the database """
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            storage = self.Storage(path)
+            storage.grant_many([('root', '/admin', 'enter')])
+            storage.close()
+
+            storage = self.Storage(path)
+            self.assertDictEqual(storage.get_grants('root'), {'/admin': {'enter'}})
+            storage.close()
+        finally:
+            os.unlink(path)